@@ -0,0 +1,99 @@
+"""
+Convergence of the AdaptiveController under a changing scene and load, on a simulated detector.
+
+The simulated detector costs --ns-per-pixel per scanned pixel (times the load factor of the phase, e.g. other
+processes competing for the CPU) and finds a face only when it is at least 80 pixels in the scanned image,
+like the HOG detector of dlib. Each phase prints the settings the controller converged to, the frames it
+needed to settle (probe frames excluded) and the resulting latency, then the decision log is written as JSON lines.
+
+Usage:
+    python -m benchmarks.adaptive_controller --target-fps 10 --max-latency-ms 150
+    python -m benchmarks.adaptive_controller --decision-log decisions.jsonl
+"""
+from collections import namedtuple
+import argparse
+import json
+import numpy as np
+from src.business_logic.adaptive_controller import AdaptiveController, DETECTOR_WINDOW
+
+# Same fields as recognizer.Recognition, without importing face_recognition
+Recognition = namedtuple("Recognition", ["location", "name", "distance", "track_id"])
+
+# (phase, face sides in frame pixels, CPU load factor)
+PHASES = [
+    ("wide shot, distant faces", [70, 90], 1.0),
+    ("close-up", [320], 1.0),
+    ("empty scene", [], 1.0),
+    ("wide shot under 3x load", [70, 90], 3.0),
+    ("crowd, mixed sizes", [70, 110, 160, 240], 1.0),
+]
+
+
+def simulate_inference(controller : AdaptiveController, frame_shape, faces, load : float, ns_per_pixel : float, other_ms : float, rng : np.random.Generator):
+    """
+    :return: Tuple (timings, duration, recognitions) of one simulated inference with the current settings
+    """
+    settings = controller.settings
+    scanned = frame_shape[0] * frame_shape[1] * settings.scale ** 2 * 4 ** settings.upsample
+    detect = scanned * ns_per_pixel * 1e-9 * load * rng.uniform(0.9, 1.1)
+    other = other_ms / 1000 * load * rng.uniform(0.9, 1.1)
+    recognitions = [
+        Recognition((100, 100 + side, 100 + side, 100), "Person", 0.4, i)
+        for i, side in enumerate(faces) if side * settings.resolution >= DETECTOR_WINDOW
+    ]
+    timings = {"preprocess": 0.0, "detect": detect, "encode": other, "detect_pixels": scanned}
+    return timings, detect + other, recognitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-fps", type=float, default=10.0)
+    parser.add_argument("--max-latency-ms", type=float, default=150.0)
+    parser.add_argument("--capture-fps", type=float, default=30.0)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--ns-per-pixel", type=float, default=60.0, help="Simulated HOG cost per scanned pixel")
+    parser.add_argument("--other-ms", type=float, default=8.0, help="Simulated preprocessing + encoding + matching milliseconds")
+    parser.add_argument("--frames-per-phase", type=int, default=150)
+    parser.add_argument("--decision-log", help="Optional JSON lines file of the controller decisions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    frame_shape = (args.height, args.width, 3)
+    controller = AdaptiveController(args.target_fps, args.max_latency_ms / 1000, name="simulated", log_interval=1e9)
+
+    clock = 0.0
+    print(f"{'phase':<28}{'scale':>7}{'upsample':>9}{'stride':>7}{'settled@':>9}{'latency ms':>11}{'fps':>7}{'found':>7}")
+    for phase, faces, load in PHASES:
+        history, latencies, found = [], [], []
+        for _ in range(args.frames_per_phase):
+            timings, duration, recognitions = simulate_inference(controller, frame_shape, faces, load, args.ns_per_pixel, args.other_ms, rng)
+            # Simulated clock: the next inference starts stride frames later, or when this one ends
+            clock += max(controller.settings.stride / args.capture_fps, duration)
+            settings = controller.update(frame_shape, timings, duration, recognitions, args.capture_fps, now=clock)
+            # The periodic probe frames are not a change of the converged settings
+            if controller.reason != "probe":
+                history.append(settings)
+            latencies.append(duration)
+            found.append(len(recognitions))
+
+        # Settled: first frame after which the settings never change again
+        settled = len(history) - 1
+        while settled > 0 and history[settled - 1] == history[-1]:
+            settled -= 1
+        final = history[-1]
+        latency = 1000 * float(np.mean(latencies[-(len(history) - settled):]))
+        fps = min(args.capture_fps / final.stride, 1000 / latency)
+        print(f"{phase:<28}{final.scale:>7.2f}{final.upsample:>9}{final.stride:>7}{settled:>9}{latency:>11.1f}{fps:>7.1f}{found[-1]:>4}/{len(faces):<2}")
+
+    decisions = controller.decision_log()
+    print(f"{len(decisions)} decisions logged")
+    if args.decision_log:
+        with open(args.decision_log, "w", encoding="utf-8") as f:
+            for decision in decisions:
+                f.write(json.dumps(decision) + "\n")
+
+
+if __name__ == "__main__":
+    main()
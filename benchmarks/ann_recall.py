@@ -0,0 +1,80 @@
+"""
+Recall and latency report of the approximate gallery indexes against the exact scan.
+
+Usage:
+    python -m benchmarks.ann_recall --gallery-size 100000 --queries 500 --n-lists 316 --n-probe 1 4 8 16 32
+"""
+import argparse
+import time
+import numpy as np
+from src.business_logic.ann_index import ExactIndex, IVFIndex
+from src.business_logic.gallery_matcher import GalleryMatcher
+
+
+def synthetic_gallery(gallery_size : int, query_count : int, seed : int = 0):
+    """
+    Generate a random gallery that looks like dlib encodings: identities ~1.0 apart,
+    queries ~0.3 away from an enrolled identity (the same person seen again by the camera).
+
+    :return: Tuple (gallery, names, queries, query_identities)
+    """
+    rng = np.random.default_rng(seed)
+    gallery = rng.normal(0.0, 0.06, size=(gallery_size, 128)).astype(np.float32)
+    names = [f"Person_{i + 1}" for i in range(gallery_size)]
+    query_identities = rng.choice(gallery_size, query_count, replace=False)
+    queries = gallery[query_identities] + rng.normal(0.0, 0.025, size=(query_count, 128)).astype(np.float32)
+    return gallery, names, queries, query_identities
+
+
+def timed_match(matcher : GalleryMatcher, queries : np.ndarray):
+    """
+    Match the queries one frame (one face) at a time like the live loop does
+
+    :return: Tuple (results, mean milliseconds per query)
+    """
+    start = time.perf_counter()
+    results = [matcher.match(query[None, :])[0] for query in queries]
+    elapsed = time.perf_counter() - start
+    return results, 1000.0 * elapsed / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery-size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--n-lists", type=int, nargs="+", default=[0], help="0 = sqrt(gallery size)")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    gallery, names, queries, _ = synthetic_gallery(args.gallery_size, args.queries)
+
+    exact = GalleryMatcher(gallery, names, tolerance=args.tolerance, index=ExactIndex())
+    exact_results, exact_ms = timed_match(exact, queries)
+    exact_names = [result.name for result in exact_results]
+    exact_indices = [result.index for result in exact_results]
+
+    print(f"gallery={args.gallery_size} queries={args.queries} tolerance={args.tolerance}")
+    print(f"{'index':<24}{'build s':>10}{'recall@1':>10}{'decision':>10}{'ms/query':>10}{'speedup':>10}")
+    print(f"{'exact':<24}{'-':>10}{1.0:>10.3f}{1.0:>10.3f}{exact_ms:>10.3f}{1.0:>10.2f}")
+
+    for n_lists in args.n_lists:
+        start = time.perf_counter()
+        matcher = GalleryMatcher(gallery, names, tolerance=args.tolerance, index=IVFIndex(n_lists=n_lists or None, min_train_size=0))
+        build_seconds = time.perf_counter() - start
+        # The matcher builds and queries its own copy of the index given to it
+        index = matcher.index
+
+        for n_probe in args.n_probe:
+            index.n_probe = n_probe
+            results, ms = timed_match(matcher, queries)
+
+            # recall@1: same closest template as the exact scan, decision: same name / "Unknown" outcome
+            recall = np.mean([result.index == expected for result, expected in zip(results, exact_indices)])
+            decision = np.mean([result.name == expected for result, expected in zip(results, exact_names)])
+            label = f"ivf lists={len(index.lists)} probe={n_probe}"
+            print(f"{label:<24}{build_seconds:>10.2f}{recall:>10.3f}{decision:>10.3f}{ms:>10.3f}{exact_ms / ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Compact gallery: memory per identity and match latency of the quantized indexes (int8, product quantization)
+against the legacy list of float64 arrays (matched like face_recognition.face_distance) and the float32 matrix of
+GalleryMatcher. The quantized indexes are scanned first and their candidates re-ranked exactly against the float32
+templates, read from a memory-mapped file like the gallery store does.
+
+Memory: heap_bytes are held by the process (codes, norms, templates added since the load), mapped_bytes are the
+float32 templates read through the memory map of the gallery file (page cache, shared by the processes of the
+machine and evictable), total_bytes both. Before timing, templates are added and deleted like a running kiosk
+enrolls and deletes faces, base_mapped reports that the templates were still read through the map afterwards.
+scanned_kb_per_match is what one match reads: the whole float32 matrix for the exact scan, the codes plus the
+re-ranked rows (or the whole matrix for a query scanned exactly) for the quantized indexes, an upper bound for int8
+whose head codes rule out most rows before the other codes are read. It is the memory that has to stay in the page
+cache for matches to run at full speed.
+
+Decisions: the share of queries whose nearest template and tolerance decision are the ones of the exact scan
+(1.0 expected for every mode). Exits with status 1 otherwise.
+
+Synthetic galleries: isotropic random encodings (the ann_recall generator, the worst case of product quantization)
+or, with --intrinsic-dim, encodings spread over a low-dimensional subspace like real face embeddings.
+
+Usage:
+    python -m benchmarks.compact_gallery --gallery-size 100000
+    python -m benchmarks.compact_gallery --gallery-size 1000000 --intrinsic-dim 32 --modes int8 pq
+"""
+import argparse
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.ann_recall import synthetic_gallery
+from src.business_logic.ann_index import QUANTIZATION_MODES, QuantizedIndex
+from src.business_logic.gallery_matcher import ENCODING_SIZE, GalleryMatcher
+
+
+def structured_gallery(gallery_size : int, query_count : int, intrinsic_dim : int, seed : int = 0):
+    """
+    Encodings on a random intrinsic_dim-dimensional subspace plus a little noise, identities ~1.0 apart,
+    queries ~0.3 away from an enrolled identity
+
+    :return: Tuple (gallery, names, queries, query_identities)
+    """
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.normal(size=(128, intrinsic_dim)))[0].T.astype(np.float32)
+    sigma = 1.0 / np.sqrt(2 * intrinsic_dim)
+    gallery = (rng.normal(0.0, sigma, size=(gallery_size, intrinsic_dim)).astype(np.float32) @ basis) + rng.normal(0.0, 0.005, size=(gallery_size, 128)).astype(np.float32)
+    names = [f"Person_{i + 1}" for i in range(gallery_size)]
+    query_identities = rng.choice(gallery_size, query_count, replace=False)
+    queries = gallery[query_identities] + (rng.normal(0.0, 0.3 * sigma, size=(query_count, intrinsic_dim)).astype(np.float32) @ basis)
+    return gallery, names, queries, query_identities
+
+
+def list_of_arrays(gallery : np.ndarray, queries : np.ndarray, tolerance : float) -> dict:
+    """Legacy representation: one float64 array per template in a list, one face_distance per query"""
+    known_face_encodings = [np.array(row, dtype=np.float64) for row in gallery]
+    nbytes = sys.getsizeof(known_face_encodings) + sum(sys.getsizeof(encoding) for encoding in known_face_encodings)
+
+    decisions, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        # face_recognition.face_distance: the list is converted to a matrix on every call
+        distances = np.linalg.norm(known_face_encodings - query.astype(np.float64), axis=1)
+        best = int(np.argmin(distances))
+        latencies.append(time.perf_counter() - start)
+        decisions.append((best, distances[best] <= tolerance))
+    return {"bytes": nbytes, "latencies": latencies, "decisions": decisions}
+
+
+def timed_matches(matcher : GalleryMatcher, queries : np.ndarray) -> dict:
+    """Match one face at a time like the live loop does"""
+    matcher.match(queries[:1])
+    decisions, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = matcher.match(query[None, :])[0]
+        latencies.append(time.perf_counter() - start)
+        decisions.append((result.index, result.distance <= matcher.tolerance))
+    return {"latencies": latencies, "decisions": decisions}
+
+
+def is_mapped(array : np.ndarray) -> bool:
+    """True if the array reads a memory-mapped file"""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def matcher_memory(matcher : GalleryMatcher) -> dict:
+    """
+    :return: Dict {"heap": bytes held by the process, "mapped": bytes of the templates read through the memory map}
+    """
+    snapshot = matcher.snapshot
+    index_bytes = getattr(snapshot.index, "nbytes", 0)
+    heap = index_bytes + snapshot.squared_norms.nbytes + snapshot.tail.nbytes + (snapshot.base_rows.nbytes if snapshot.base_rows is not None else 0)
+    if is_mapped(snapshot.base):
+        return {"heap": heap, "mapped": snapshot.base.nbytes}
+    return {"heap": heap + snapshot.base.nbytes, "mapped": 0}
+
+
+def scanned_bytes(matcher : GalleryMatcher, candidates : list) -> float:
+    """
+    :param candidates: Candidate rows of every query (None for a query scanned exactly), None for an exact scan
+    :return: Mean bytes read per match
+    """
+    snapshot = matcher.snapshot
+    full_scan = snapshot.base.nbytes + snapshot.tail.nbytes + snapshot.squared_norms.nbytes
+    if candidates is None:
+        return float(full_scan)
+    row_bytes = 4 * (ENCODING_SIZE + 1)
+    index_bytes = snapshot.index.nbytes
+    return float(np.mean([index_bytes + (full_scan if rows is None else len(rows) * row_bytes) for rows in candidates]))
+
+
+def update_like_a_kiosk(matcher : GalleryMatcher, updates : int, seed : int = 2) -> None:
+    """Enroll and delete templates after the load, the re-ranking matrix must stay memory-mapped"""
+    rng = np.random.default_rng(seed)
+    for i in range(updates):
+        matcher.add(rng.normal(0.0, 0.06, 128).astype(np.float32), f"Enrolled_{i}")
+    matcher.remove_rows(rng.choice(len(matcher), updates // 2, replace=False).tolist())
+
+
+def summary(name : str, memory : dict, identities : int, run : dict, reference : list, extra : dict) -> str:
+    same = np.mean([decision == expected for decision, expected in zip(run["decisions"], reference)])
+    total = memory["heap"] + memory["mapped"]
+    values = {
+        "structure": name,
+        "heap_bytes_per_identity": round(memory["heap"] / identities, 1),
+        "mapped_bytes_per_identity": round(memory["mapped"] / identities, 1),
+        "total_bytes_per_identity": round(total / identities, 1),
+        "total_mb": round(total / 1e6, 1),
+        "match_p50_ms": round(1000 * float(np.percentile(run["latencies"], 50)), 3),
+        "match_p95_ms": round(1000 * float(np.percentile(run["latencies"], 95)), 3),
+        "same_decisions": round(float(same), 4),
+        **extra
+    }
+    return ", ".join(f"{key}={value}" for key, value in values.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery-size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--baseline-queries", type=int, default=30, help="Queries of the list of float64 arrays (slow)")
+    parser.add_argument("--modes", nargs="+", default=list(QUANTIZATION_MODES), choices=QUANTIZATION_MODES)
+    parser.add_argument("--intrinsic-dim", type=int, default=0, help="Dimension of the subspace of the encodings (0 = isotropic)")
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--pq-subvectors", type=int, default=32)
+    parser.add_argument("--updates", type=int, default=100, help="Templates added (and half as many deleted) before timing")
+    args = parser.parse_args()
+
+    if args.intrinsic_dim:
+        gallery, names, queries, _ = structured_gallery(args.gallery_size, args.queries, args.intrinsic_dim)
+    else:
+        gallery, names, queries, _ = synthetic_gallery(args.gallery_size, args.queries)
+    # Unknown faces as well: a decision is also "nobody within tolerance"
+    rng = np.random.default_rng(1)
+    queries = np.concatenate([queries, gallery[rng.choice(len(gallery), args.queries // 3)][:, rng.permutation(128)]])
+
+    directory = tempfile.mkdtemp(prefix="compact_gallery_bench_")
+    try:
+        # The templates the candidates are re-ranked against stay in a memory-mapped file, as in the gallery store
+        path = os.path.join(directory, "encodings.npy")
+        np.save(path, gallery)
+        mapped = np.load(path, mmap_mode="r")
+
+        exact = GalleryMatcher(mapped, names, tolerance=args.tolerance)
+        update_like_a_kiosk(exact, args.updates)
+        exact_run = timed_matches(exact, queries)
+        reference = exact_run["decisions"]
+        identities = len(exact.snapshot.name_rows)
+        print(f"gallery_size={args.gallery_size}, identities={identities}, queries={len(queries)}, intrinsic_dim={args.intrinsic_dim or 128}, updates={args.updates}")
+
+        # The baseline has no adds or deletes, its decisions are compared with an exact scan of the same gallery
+        baseline_queries = queries[:args.baseline_queries]
+        baseline = list_of_arrays(gallery, baseline_queries, args.tolerance)
+        baseline_reference = timed_matches(GalleryMatcher(mapped, names, tolerance=args.tolerance), baseline_queries)["decisions"]
+        print(summary("list_float64", {"heap": baseline["bytes"], "mapped": 0}, len(gallery), baseline, baseline_reference, {}))
+        print(summary("matrix_float32", matcher_memory(exact), identities, exact_run, reference, {
+            "base_mapped": is_mapped(exact.snapshot.base),
+            "scanned_kb_per_match": round(scanned_bytes(exact, None) / 1e3, 1)
+        }))
+
+        all_same = True
+        for mode in args.modes:
+            index = QuantizedIndex(mode, pq_subvectors=args.pq_subvectors, min_train_size=0)
+            start = time.perf_counter()
+            matcher = GalleryMatcher(mapped, names, tolerance=args.tolerance, index=index)
+            build_seconds = time.perf_counter() - start
+            update_like_a_kiosk(matcher, args.updates)
+            run = timed_matches(matcher, queries)
+            candidates = matcher.snapshot.index.candidates(queries)
+            exact_scans = sum(rows is None for rows in candidates)
+            reranked = [len(rows) for rows in candidates if rows is not None]
+            print(summary(f"{mode}_rerank", matcher_memory(matcher), identities, run, reference, {
+                "base_mapped": is_mapped(matcher.snapshot.base),
+                "scanned_kb_per_match": round(scanned_bytes(matcher, candidates) / 1e3, 1),
+                "reranked_rows": round(float(np.mean(reranked)), 1) if reranked else 0,
+                "exact_scans": exact_scans,
+                "max_error": round(float(matcher.snapshot.index.errors.max()), 4),
+                "build_s": round(build_seconds, 2)
+            }))
+            all_same &= all(decision == expected for decision, expected in zip(run["decisions"], reference))
+        del mapped, exact
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if not all_same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+CPU per displayed frame of the legacy display path (resize + default quality JPEG + base64 + synchronous
+update of every frame) against DisplayTransport (skip while the UI is busy, adaptive quality / resolution,
+reused resize buffer, control-only update from a sender thread).
+
+The UI is a stand-in control whose update() sleeps --ui-latency-ms, like a websocket round trip.
+The cost of a full page.update() diff in Flet is not included, so the gain in the app is larger.
+
+Usage:
+    python -m benchmarks.display_transport --seconds 5 --capture-fps 30 --ui-latency-ms 15
+"""
+import argparse
+import base64
+import time
+import cv2
+import numpy as np
+from src.utils.display_transport import DisplayTransport
+
+
+class LatencyControl:
+    def __init__(self, latency : float):
+        """Image control stand-in: update() takes the UI round trip time"""
+        self.latency = latency
+        self.src_base64 = ""
+        self.updates = 0
+        self.bytes = 0
+
+    def update(self) -> None:
+        time.sleep(self.latency)
+        self.updates += 1
+        self.bytes += len(self.src_base64)
+
+
+def camera_frames(seed : int = 0, count : int = 30):
+    rng = np.random.default_rng(seed)
+    return [cv2.resize(rng.integers(0, 256, size=(90, 160, 3), dtype=np.uint8), (1280, 720), interpolation=cv2.INTER_CUBIC) for _ in range(count)]
+
+
+def run_legacy(frames, seconds : float, capture_fps : float, latency : float) -> dict:
+    control = LatencyControl(latency)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    next_frame_time = wall_start
+    i = 0
+    while time.perf_counter() - wall_start < seconds:
+        # The render loop handles the latest captured frame, like the LatestSlot does
+        frame = frames[i % len(frames)].copy()
+        i += 1
+        display_frame = cv2.resize(frame, (640, 360))
+        ret, buffer = cv2.imencode(".jpg", display_frame)
+        control.src_base64 = base64.b64encode(buffer).decode("utf-8")
+        control.update()
+
+        next_frame_time += 1.0 / capture_fps
+        delay = next_frame_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame_time = time.perf_counter()
+    return summary("legacy", control, time.process_time() - cpu_start, time.perf_counter() - wall_start)
+
+
+def run_transport(frames, seconds : float, capture_fps : float, latency : float, target_fps : float, target_kbps : float) -> dict:
+    control = LatencyControl(latency)
+    transport = DisplayTransport(control, 640, 360, target_fps=target_fps, target_kbps=target_kbps)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    next_frame_time = wall_start
+    i = 0
+    while time.perf_counter() - wall_start < seconds:
+        frame = frames[i % len(frames)]
+        i += 1
+        if transport.ready():
+            transport.submit(frame.copy())
+
+        next_frame_time += 1.0 / capture_fps
+        delay = next_frame_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    transport.close()
+    result = summary("transport", control, time.process_time() - cpu_start, time.perf_counter() - wall_start)
+    result.update(quality=transport.quality, scale=round(transport.scale, 2), skipped=transport.skipped_count)
+    return result
+
+
+def summary(name : str, control : LatencyControl, cpu_seconds : float, wall_seconds : float) -> dict:
+    return {
+        "path": name,
+        "displayed_fps": round(control.updates / wall_seconds, 1),
+        "cpu_ms_per_displayed_frame": round(1000 * cpu_seconds / max(control.updates, 1), 2),
+        "cpu_percent": round(100 * cpu_seconds / wall_seconds, 1),
+        "kb_per_frame": round(control.bytes / max(control.updates, 1) / 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--capture-fps", type=float, default=30.0)
+    parser.add_argument("--ui-latency-ms", type=float, default=15.0)
+    parser.add_argument("--target-fps", type=float, default=25.0)
+    parser.add_argument("--target-kbps", type=float, default=8000.0)
+    args = parser.parse_args()
+
+    # One OpenCV thread so the CPU time compares the work done, not the thread pool
+    cv2.setNumThreads(1)
+    frames = camera_frames()
+    latency = args.ui_latency_ms / 1000
+
+    results = [
+        run_legacy(frames, args.seconds, args.capture_fps, latency),
+        run_transport(frames, args.seconds, args.capture_fps, latency, args.target_fps, args.target_kbps)
+    ]
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Throughput of the recognition event log: one commit per event (a synchronous insert in the camera thread)
+against EventLog (bounded queue, batched inserts in WAL mode from a writer thread), and the latency of
+the indexed history queries.
+
+Usage:
+    python -m benchmarks.event_log --events 100000 --batch-size 512
+    python -m benchmarks.event_log --events 20000 --max-queue 1000 --rate 50000
+"""
+from collections import namedtuple
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from src.business_logic.event_log import EventLog, INSERT, connect
+
+# Same fields as recognizer.Recognition, without importing face_recognition
+Recognition = namedtuple("Recognition", ["location", "name", "distance", "track_id"])
+
+
+def synthetic_events(count : int, people : int = 500, cameras : int = 4, seed : int = 0):
+    """
+    :return: List of (camera, Recognition, timestamp) spread over the last 7 days
+    """
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    timestamps = np.sort(now - rng.uniform(0, 7 * 24 * 3600, count))
+    names = rng.integers(0, people + 1, count)
+    return [
+        (f"camera_{i % cameras}", Recognition((10, 60, 60, 10), f"Person_{name}" if name else "Unknown", float(rng.uniform(0.2, 0.7)), i % 50), float(timestamp))
+        for i, (name, timestamp) in enumerate(zip(names, timestamps))
+    ]
+
+
+def run_per_event_commit(path : str, events) -> dict:
+    connection = connect(path)
+    start = time.perf_counter()
+    for camera, recognition, timestamp in events:
+        with connection:
+            connection.execute(INSERT, (timestamp, camera, recognition.name, recognition.distance, recognition.track_id, *recognition.location))
+    seconds = time.perf_counter() - start
+    connection.close()
+    return {"mode": "commit_per_event", "events": len(events), "seconds": round(seconds, 3), "events_per_second": round(len(events) / seconds), "caller_us_per_event": round(1e6 * seconds / len(events), 1)}
+
+
+def run_event_log(path : str, events, batch_size : int, max_queue : int, rate : float) -> dict:
+    event_log = EventLog(path, batch_size=batch_size, max_queue=max_queue)
+    event_log.start()
+    caller_seconds = 0.0
+    start = time.perf_counter()
+    for i, (camera, recognition, timestamp) in enumerate(events):
+        # Optional pacing of the producer, like cameras recognizing faces at a fixed rate
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        call_start = time.perf_counter()
+        event_log.record(camera, recognition, timestamp)
+        caller_seconds += time.perf_counter() - call_start
+    event_log.flush(timeout=60.0)
+    seconds = time.perf_counter() - start
+    stats = event_log.stats()
+    event_log.close()
+    return {
+        "mode": f"event_log_batch_{batch_size}", "events": len(events), "seconds": round(seconds, 3),
+        "events_per_second": round(stats["written"] / seconds), "caller_us_per_event": round(1e6 * caller_seconds / len(events), 1),
+        "written": stats["written"], "dropped": stats["dropped"]
+    }
+
+
+def run_queries(path : str, repeats : int = 50) -> dict:
+    event_log = EventLog(path)
+    now = time.time()
+    timings = {}
+    queries = {
+        "name_last_24h": lambda: event_log.query(name="Person_7", since=now - 24 * 3600),
+        "name_all_time": lambda: event_log.query(name="Person_7"),
+        "camera_last_hour": lambda: event_log.query(camera="camera_1", since=now - 3600),
+        "everyone_last_hour": lambda: event_log.query(since=now - 3600),
+        "name_counts_24h": lambda: event_log.name_counts(since=now - 24 * 3600)
+    }
+    for label, query in queries.items():
+        query()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            query()
+        timings[f"{label}_ms"] = round(1000 * (time.perf_counter() - start) / repeats, 3)
+    event_log.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--baseline-events", type=int, default=5000, help="Events of the commit-per-event run (slow)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-queue", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=0.0, help="Producer events per second (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    events = synthetic_events(args.events)
+    directory = tempfile.mkdtemp(prefix="event_log_bench_")
+    try:
+        results = [
+            run_per_event_commit(os.path.join(directory, "per_event.db"), events[:args.baseline_events]),
+            run_event_log(os.path.join(directory, "events.db"), events, args.batch_size, args.max_queue, args.rate)
+        ]
+        for result in results:
+            print(", ".join(f"{key}={value}" for key, value in result.items()))
+        print(", ".join(f"{key}={value}" for key, value in run_queries(os.path.join(directory, "events.db")).items()))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
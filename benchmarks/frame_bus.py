@@ -0,0 +1,175 @@
+"""
+Shared-memory frame bus: checks that a frame is never copied outside its ring, then compares the end-to-end
+latency of the threaded pipeline (MultiCameraRecognizer) and of the process pipeline (ProcessCameraRecognizer)
+on the same video, with a render loop doing the work of the UI (resize, overlay, JPEG encoding).
+
+Copy check: a frame is decoded into a ring slot by cv2.VideoCapture.read, read through a second attachment of
+the ring (as another process does) and run through the inference preprocessing and the render stage under
+tracemalloc: no allocation may be as large as the frame. The process run also reports the frames the capture
+processes had to copy into their ring (0 expected). Exits with status 1 if a copy is found.
+
+Latency: capture -> recognitions available in the UI process ("recognition") and capture -> frame in the render
+loop ("render"), p50 / p95 in milliseconds.
+
+Usage:
+    python -m benchmarks.frame_bus --seconds 10
+    python -m benchmarks.frame_bus --video entrance.mp4 --seconds 20 --target-fps 0
+"""
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.multi_camera import MultiCameraRecognizer
+from src.business_logic.process_pipeline import ProcessCameraRecognizer
+from src.business_logic.recognizer import FaceRecognizer, Recognition
+from src.utils.frame_buffers import FrameBuffers
+from src.utils.metrics import metrics
+from src.utils.overlay import draw_recognitions
+from src.utils.shared_ring import FrameDescriptor, SharedRing
+
+
+def write_video(path : str, frames : int = 300, width : int = 1280, height : int = 720, fps : float = 30.0) -> None:
+    """Synthetic video: a bright face-sized square moving over a textured background"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = rng.integers(60, 200, size=(height, width, 3), dtype=np.uint8)
+    for i in range(frames):
+        frame = background.copy()
+        left = 100 + (i * 7) % (width - 400)
+        frame[200:440, left:left + 240] = 230
+        writer.write(frame)
+    writer.release()
+
+
+def render(frame, recognitions, buffers : FrameBuffers, size=(640, 360)) -> int:
+    """Render stage of the UI: display-size copy, overlay and JPEG encoding, returns the JPEG size"""
+    display_frame = buffers.display(frame, size)
+    draw_recognitions(display_frame, recognitions, size[0] / frame.shape[1], size[1] / frame.shape[0])
+    return len(cv2.imencode(".jpg", display_frame, (cv2.IMWRITE_JPEG_QUALITY, 75))[1])
+
+
+def check_copies(video : str) -> dict:
+    """
+    :return: Dict of the copy checks, "zero_copy" is True if they all pass
+    """
+    cap = cv2.VideoCapture(video)
+    height, width = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    producer = SharedRing.create(height * width * 3, slots=4)
+    consumer = SharedRing.attach(producer.spec)
+    try:
+        # Producer: decoded straight into the slot
+        slot = producer.reserve()
+        target = producer.array(slot, (height, width, 3))
+        ret, frame = cap.read(target)
+        decoded_in_place = bool(ret) and np.shares_memory(frame, target)
+        producer.publish(slot, 1)
+        descriptor = FrameDescriptor(1, slot, frame.shape, time.time())
+
+        # Consumer: the same memory through its own mapping, a write of the producer is seen without any transfer
+        leased = consumer.lease(descriptor)
+        view = consumer.array(descriptor.slot, descriptor.shape)
+        target[0, 0, 0] = 255 - int(view[0, 0, 0])
+        shared = leased and int(view[0, 0, 0]) == int(target[0, 0, 0]) and not view.flags.owndata
+
+        # Inference preprocessing and render stage on the view, once to allocate their reusable buffers, then traced
+        inference_buffers, display_buffers = FrameBuffers(), FrameBuffers()
+        recognitions = [Recognition((200, 340, 440, 100), "Person", 0.4, 1)]
+        inference_buffers.downscale(view, 0.25)
+        render(view, recognitions, display_buffers)
+        tracemalloc.start()
+        for _ in range(10):
+            inference_buffers.downscale(view, 0.25)
+            render(view, recognitions, display_buffers)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        consumer.release(descriptor.slot)
+        del target, frame, view
+    finally:
+        cap.release()
+        consumer.close()
+        producer.close()
+
+    frame_bytes = height * width * 3
+    return {
+        "decoded_in_place": decoded_in_place,
+        "shared_view": shared,
+        "consumer_peak_kb": round(peak / 1000, 1),
+        "frame_kb": round(frame_bytes / 1000, 1),
+        "descriptor_bytes": len(pickle.dumps(("frame", descriptor))),
+        "zero_copy": decoded_in_place and shared and peak < frame_bytes
+    }
+
+
+def run(engine, seconds : float) -> dict:
+    """Render loop of the UI on an engine, returns the latency percentiles and rates"""
+    metrics.reset()
+    opened = engine.start()
+    if not opened:
+        engine.stop()
+        raise RuntimeError("Unable to open the video")
+    buffers = {source.name: FrameBuffers() for source in opened}
+    rendered = 0
+    start = time.perf_counter()
+    while engine.is_running and time.perf_counter() - start < seconds:
+        for source, frame in engine.next_render_frames(timeout=0.5):
+            render(frame, source.overlay_slot.peek() or [], buffers[source.name])
+            rendered += 1
+    elapsed = time.perf_counter() - start
+    stats = engine.stats()
+    percentiles = metrics.stage_percentiles()
+    engine.stop()
+
+    source_stats = stats[opened[0].name]
+    result = {
+        "rendered_fps": round(rendered / elapsed, 1),
+        "inference_fps": source_stats["inference_fps"],
+        "recognition_p50_ms": round(1000 * percentiles.get("recognition_latency", {}).get(0.5, float("nan")), 2),
+        "recognition_p95_ms": round(1000 * percentiles.get("recognition_latency", {}).get(0.95, float("nan")), 2),
+        "render_p50_ms": round(1000 * percentiles.get("render_latency", {}).get(0.5, float("nan")), 2),
+        "render_p95_ms": round(1000 * percentiles.get("render_latency", {}).get(0.95, float("nan")), 2)
+    }
+    if "copies" in source_stats:
+        result["frame_copies"] = source_stats["copies"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video file (default: a synthetic 720p video)")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--target-fps", type=float, default=10.0, help="Adaptive controller target (0 = fixed settings)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="frame_bus_bench_")
+    try:
+        video = args.video
+        if video is None:
+            video = os.path.join(directory, "synthetic.avi")
+            write_video(video, frames=int(30 * (args.seconds + 2)))
+
+        copies = check_copies(video)
+        print(", ".join(f"{key}={value}" for key, value in copies.items()))
+
+        gallery_dir = os.path.join(directory, "gallery")
+        target_fps = args.target_fps or None
+        threaded = MultiCameraRecognizer([video], FaceRecognizer(GalleryMatcher()), target_fps=target_fps)
+        processes = ProcessCameraRecognizer([video], gallery_dir=gallery_dir, data_file=os.path.join(directory, "none.pkl"), target_fps=target_fps)
+        results = {"threads": run(threaded, args.seconds), "processes": run(processes, args.seconds)}
+        for mode, result in results.items():
+            print(f"mode={mode}, " + ", ".join(f"{key}={value}" for key, value in result.items()))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if not copies["zero_copy"] or results["processes"].get("frame_copies"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Throughput of the serial face_recognition.face_encodings against ParallelFaceEncoder
+for a growing number of faces per frame. Also checks that both paths return identical encodings.
+
+Usage:
+    python -m benchmarks.parallel_encoding --workers 4 --faces 1 2 5 10 20 --frames 20
+"""
+import argparse
+import time
+import numpy as np
+import face_recognition
+from src.business_logic.parallel_encoder import ParallelFaceEncoder
+
+
+def synthetic_frame(face_count : int, face_size : int = 80, seed : int = 0):
+    """
+    Random 720p RGB frame with face_count boxes on a grid (dlib encodes any box, a real face is not required)
+
+    :return: Tuple (frame, face_locations)
+    """
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, size=(720, 1280, 3), dtype=np.uint8)
+    columns = 1280 // (face_size + 16)
+    locations = []
+    for i in range(face_count):
+        top = 16 + (i // columns) * (face_size + 16)
+        left = 16 + (i % columns) * (face_size + 16)
+        locations.append((top, left + face_size, top + face_size, left))
+    return frame, locations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+
+    encoder = ParallelFaceEncoder(workers=args.workers)
+    try:
+        # Warm up the pool so the model loading is not part of the measure
+        frame, locations = synthetic_frame(encoder.workers)
+        encoder.encode(frame, locations)
+
+        print(f"workers={encoder.workers} frames={args.frames}")
+        print(f"{'faces':>6}{'serial fps':>12}{'parallel fps':>14}{'pipelined fps':>15}{'speedup':>10}{'identical':>11}")
+        for face_count in args.faces:
+            frame, locations = synthetic_frame(face_count)
+
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                serial = face_recognition.face_encodings(frame, locations)
+            serial_fps = args.frames / (time.perf_counter() - start)
+
+            # One frame at a time, faces sharded across the workers
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                parallel = encoder.encode(frame, locations)
+            parallel_fps = args.frames / (time.perf_counter() - start)
+
+            # Consecutive frames in flight at the same time, collected in order
+            start = time.perf_counter()
+            jobs = []
+            for _ in range(args.frames):
+                if len(jobs) == encoder.max_in_flight:
+                    pipelined = jobs.pop(0).result()
+                jobs.append(encoder.submit(frame, locations))
+            for job in jobs:
+                pipelined = job.result()
+            pipelined_fps = args.frames / (time.perf_counter() - start)
+
+            identical = all(np.array_equal(a, b) for a, b in zip(serial, parallel)) and all(np.array_equal(a, b) for a, b in zip(serial, pipelined))
+            best_fps = max(parallel_fps, pipelined_fps)
+            print(f"{face_count:>6}{serial_fps:>12.2f}{parallel_fps:>14.2f}{pipelined_fps:>15.2f}{best_fps / serial_fps:>10.2f}{str(identical):>11}")
+    finally:
+        encoder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Reproducible benchmark of every stage of the recognition pipeline and of the gallery storage.
+
+Usage:
+    python -m benchmarks.pipeline_stages --output bench.json
+    python -m benchmarks.pipeline_stages --output bench.json --baseline baseline.json --threshold 0.15
+    python -m benchmarks.pipeline_stages --video recorded.mp4 --gallery-sizes 100 10000 1000000
+
+Frames are synthetic (seeded) unless --video or --frames-dir is given, galleries are random 128-d
+encodings. Each stage is timed separately and written as JSON (median / p95 milliseconds), a stage is
+repeated until it ran for 50 ms so the sub-millisecond ones get enough runs for a stable median.
+With --baseline, every stage is compared with the saved run and the command exits with status 1 when
+a stage is slower than baseline * (1 + threshold) and by more than --min-delta-ms. The stages of the
+baseline missing from the run are listed.
+"""
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import base64
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from src.business_logic.ann_index import IVFIndex
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.gallery_store import GalleryStore
+from src.utils.metrics import MetricsRegistry
+from src.utils.overlay import draw_recognitions
+
+try:
+    import face_recognition
+    from src.business_logic.add_known_face import FaceAdder
+except ImportError:
+    face_recognition = None
+    FaceAdder = None
+
+
+def measure(function : Callable, repeats : int, warmup : int = 1, min_seconds : float = 0.05, max_runs : int = 1000) -> Dict[str, float]:
+    """
+    Time a function, at least repeats times and until it ran for min_seconds (at most max_runs times)
+
+    :return: Dict with the median, p95 and minimum milliseconds and the number of runs
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    while len(times) < repeats or (sum(times) < 1000.0 * min_seconds and len(times) < max_runs):
+        start = time.perf_counter()
+        function()
+        times.append(1000.0 * (time.perf_counter() - start))
+    return {
+        "median_ms": round(float(np.median(times)), 4),
+        "p95_ms": round(float(np.percentile(times, 95)), 4),
+        "min_ms": round(float(np.min(times)), 4),
+        "runs": len(times)
+    }
+
+
+def load_frames(args, rng : np.random.Generator) -> List[np.ndarray]:
+    """
+    Frames to benchmark: from a recorded video, a folder of images, or synthetic 720p frames
+    """
+    frames = []
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        while len(frames) < args.frame_count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    elif args.frames_dir:
+        for name in sorted(os.listdir(args.frames_dir))[:args.frame_count]:
+            frame = cv2.imread(os.path.join(args.frames_dir, name))
+            if frame is not None:
+                frames.append(frame)
+
+    if not frames:
+        # Smooth random frames compress like camera images, pure noise would make JPEG unrealistically slow
+        for _ in range(args.frame_count):
+            noise = rng.integers(0, 256, size=(90, 160, 3), dtype=np.uint8)
+            frames.append(cv2.resize(noise, (1280, 720), interpolation=cv2.INTER_CUBIC))
+    return frames
+
+
+class OverlayBox(NamedTuple):
+    # Same fields as Recognition, which cannot be imported without face_recognition
+    location: Tuple[int, int, int, int]
+    name: str
+
+
+def synthetic_recognitions(frame : np.ndarray, count : int) -> List[OverlayBox]:
+    height, width = frame.shape[:2]
+    size = min(height, width) // 4
+    return [
+        OverlayBox((40, 40 + (i + 1) * size, 40 + size, 40 + i * size), "Unknown" if i % 2 else f"Person_{i}")
+        for i in range(count)
+    ]
+
+
+def benchmark_frame_stages(frames : List[np.ndarray], results : dict, args) -> None:
+    cycle = {"i": 0}
+
+    def next_frame():
+        cycle["i"] = (cycle["i"] + 1) % len(frames)
+        return frames[cycle["i"]]
+
+    def preprocess():
+        small_frame = cv2.resize(next_frame(), (0, 0), fx=args.scale, fy=args.scale)
+        return cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+
+    results["preprocess.resize_cvtcolor"] = measure(preprocess, args.repeats)
+
+    rgb_small_frames = [cv2.cvtColor(cv2.resize(frame, (0, 0), fx=args.scale, fy=args.scale), cv2.COLOR_BGR2RGB) for frame in frames]
+    if face_recognition is not None:
+        results["detect.face_locations"] = measure(lambda: face_recognition.face_locations(rgb_small_frames[cycle["i"] % len(rgb_small_frames)]), max(args.repeats // 10, 3))
+
+        # dlib encodes any box, a real face is not required to time the encoder
+        height, width = rgb_small_frames[0].shape[:2]
+        size = min(height, width) // 3
+        boxes = [(10, 10 + size, 10 + size, 10), (10, width - 10, 10 + size, width - 10 - size)]
+        results["encode.face_encodings_per_face"] = measure(lambda: face_recognition.face_encodings(rgb_small_frames[0], boxes[:1]), max(args.repeats // 10, 3))
+    else:
+        results["detect.face_locations"] = {"skipped": "face_recognition is not installed"}
+        results["encode.face_encodings_per_face"] = {"skipped": "face_recognition is not installed"}
+
+    overlay_frame = frames[0].copy()
+    recognitions = synthetic_recognitions(overlay_frame, 3)
+    results["render.draw_overlay_3_faces"] = measure(lambda: draw_recognitions(overlay_frame, recognitions), args.repeats)
+
+    def display_encode():
+        display_frame = cv2.resize(next_frame(), (640, 360))
+        ret, buffer = cv2.imencode(".jpg", display_frame)
+        return base64.b64encode(buffer).decode("utf-8")
+
+    results["render.jpeg_base64_640x360"] = measure(display_encode, args.repeats)
+
+    # Cost of the always-on instrumentation, per 1000 recorded stage latencies
+    registry = MetricsRegistry()
+
+    def observe_stages():
+        for _ in range(1000):
+            with registry.time_stage("benchmark"):
+                pass
+
+    results["metrics.time_stage_x1000"] = measure(observe_stages, args.repeats)
+
+
+def benchmark_gallery(size : int, rng : np.random.Generator, results : dict, args) -> None:
+    gallery = rng.normal(0.0, 0.06, size=(size, 128)).astype(np.float32)
+    names = [f"Person_{i + 1}" for i in range(size)]
+    queries = gallery[rng.choice(size, 5)] + rng.normal(0.0, 0.025, size=(5, 128)).astype(np.float32)
+    repeats = args.repeats if size <= 100000 else max(args.repeats // 10, 3)
+
+    matcher = GalleryMatcher(gallery, names)
+    results[f"match.exact_5_faces@{size}"] = measure(lambda: matcher.match(queries), repeats)
+
+    if size >= 10000:
+        ivf_matcher = GalleryMatcher(gallery, names, index=IVFIndex(min_train_size=0))
+        results[f"match.ivf_5_faces@{size}"] = measure(lambda: ivf_matcher.match(queries), repeats)
+
+    # Multi-template identities (4 templates per name): centroid prefilter, then exact best-of on the candidates
+    template_names = [f"Person_{i // 4 + 1}" for i in range(size)]
+    prefilter_matcher = GalleryMatcher(gallery, template_names, prefilter_identities=32)
+    prefilter_matcher.match(queries[:1])  # Builds the centroids once
+    results[f"match.prefilter_5_faces@{size}"] = measure(lambda: prefilter_matcher.match(queries), repeats)
+    results[f"gallery.rows_of_name@{size}"] = measure(lambda: prefilter_matcher.snapshot.rows_of(template_names[size // 2]), repeats)
+    results[f"gallery.add_template@{size}"] = measure(lambda: prefilter_matcher.add(queries[0], "Benchmark"), max(repeats // 10, 3), warmup=3)
+
+    directory = tempfile.mkdtemp(prefix="face_bench_")
+    try:
+        store = GalleryStore(os.path.join(directory, "gallery"))
+        results[f"gallery.save@{size}"] = measure(lambda: store.write(gallery, names), max(repeats // 10, 3))
+        results[f"gallery.load@{size}"] = measure(lambda: GalleryStore(store.directory).load(), repeats)
+        results[f"gallery.append@{size}"] = measure(lambda: store.append(queries[0], "Benchmark"), max(repeats // 10, 3), warmup=3)
+
+        # Legacy whole-file pickle of a list of float64 arrays, for comparison
+        if size <= 100000:
+            pickle_path = os.path.join(directory, "known_faces.pkl")
+            legacy = {"encodings": list(gallery.astype(np.float64)), "names": names}
+
+            def pickle_save():
+                with open(pickle_path, "wb") as f:
+                    pickle.dump(legacy, f)
+
+            def pickle_load():
+                with open(pickle_path, "rb") as f:
+                    return pickle.load(f)
+
+            results[f"gallery.pickle_save@{size}"] = measure(pickle_save, max(repeats // 10, 3))
+            results[f"gallery.pickle_load@{size}"] = measure(pickle_load, max(repeats // 10, 3))
+
+        if FaceAdder is not None:
+            face_adder = FaceAdder(gallery_dir=os.path.join(directory, "adder"), matcher=matcher)
+            results[f"gallery.is_duplicate_face@{size}"] = measure(lambda: face_adder.is_duplicate_face(queries[0]), repeats)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(current : dict, baseline : dict, threshold : float, min_delta_ms : float = 0.05) -> List[str]:
+    """
+    Compare the stages of two runs
+
+    :param threshold: Allowed slowdown ratio per stage
+    :param min_delta_ms: Slowdowns smaller than this are timer noise, never a regression
+    :return: List of the regressed stage names
+    """
+    regressions = []
+    print(f"{'stage':<44}{'baseline ms':>13}{'current ms':>13}{'ratio':>8}")
+    for stage, timing in current["stages"].items():
+        reference = baseline["stages"].get(stage)
+        if not reference or "median_ms" not in reference or "median_ms" not in timing:
+            continue
+        ratio = timing["median_ms"] / max(reference["median_ms"], 1e-9)
+        flag = ""
+        if ratio > 1 + threshold and timing["median_ms"] - reference["median_ms"] > min_delta_ms:
+            regressions.append(stage)
+            flag = "  REGRESSION"
+        print(f"{stage:<44}{reference['median_ms']:>13.4f}{timing['median_ms']:>13.4f}{ratio:>8.2f}{flag}")
+
+    # A stage that stopped running (renamed, failing, optional dependency missing) is not compared at all
+    missing = [stage for stage, reference in baseline["stages"].items() if "median_ms" in reference and "median_ms" not in current["stages"].get(stage, {})]
+    for stage in missing:
+        print(f"{stage:<44}{baseline['stages'][stage]['median_ms']:>13.4f}{'missing':>13}")
+    if missing:
+        print(f"{len(missing)} stage(s) of the baseline were not measured: {', '.join(missing)}", file=sys.stderr)
+    return regressions
+
+
+def main(argv : Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", "-o", default="bench_results.json")
+    parser.add_argument("--baseline", help="Saved results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown ratio per stage before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Slowdowns below this many milliseconds never fail")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--scale", type=float, default=0.25)
+    parser.add_argument("--video", help="Recorded video to take the frames from")
+    parser.add_argument("--frames-dir", help="Folder of images to take the frames from")
+    parser.add_argument("--frame-count", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    stages = {}
+
+    frames = load_frames(args, rng)
+    benchmark_frame_stages(frames, stages, args)
+    for size in args.gallery_sizes:
+        benchmark_gallery(size, rng, stages, args)
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "frame_shape": list(frames[0].shape),
+            "source": args.video or args.frames_dir or "synthetic"
+        },
+        "stages": stages
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for stage, timing in stages.items():
+        print(f"{stage:<44}{timing.get('median_ms', timing.get('skipped', '')):>13}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Time and memory churn per frame of the legacy preprocessing (new arrays for the render copy, the
+detection resize, the RGB conversion and the display resize, overlay drawn on the full frame)
+against FrameBuffers (dst= into reused per-source buffers, overlay drawn on the display-size frame).
+
+Allocations are measured with tracemalloc, which sees the numpy arrays OpenCV returns:
+"transient KB" is the peak of the memory allocated while a frame is processed.
+
+Usage:
+    python -m benchmarks.preprocessing --frames 300 --width 1280 --height 720
+"""
+import argparse
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from src.utils.frame_buffers import FrameBuffers
+from src.utils.overlay import draw_recognitions
+from benchmarks.pipeline_stages import synthetic_recognitions
+
+SCALE = 0.25
+DISPLAY_SIZE = (640, 360)
+
+
+def legacy_frame(frame, recognitions) -> None:
+    render_frame = frame.copy()
+    small_frame = cv2.resize(frame, (0, 0), fx=SCALE, fy=SCALE)
+    cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    draw_recognitions(render_frame, recognitions)
+    cv2.resize(render_frame, DISPLAY_SIZE)
+
+
+def buffered_frame(frame, recognitions, inference_buffers : FrameBuffers, display_buffers : FrameBuffers) -> None:
+    inference_buffers.downscale(frame, SCALE)
+    display_frame = display_buffers.display(frame, DISPLAY_SIZE)
+    draw_recognitions(display_frame, recognitions, DISPLAY_SIZE[0] / frame.shape[1], DISPLAY_SIZE[1] / frame.shape[0])
+
+
+def run(name : str, process, frames, count : int) -> None:
+    # Warm up (the buffers are allocated by the first frame)
+    for frame in frames[:2]:
+        process(frame)
+
+    start = time.perf_counter()
+    for i in range(count):
+        process(frames[i % len(frames)])
+    per_frame_ms = 1000 * (time.perf_counter() - start) / count
+
+    tracemalloc.start()
+    peaks = []
+    for i in range(min(count, 50)):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        process(frames[i % len(frames)])
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    print(f"{name:<10} {per_frame_ms:8.3f} ms/frame  {np.median(peaks) / 1024:10.1f} transient KB/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [cv2.resize(rng.integers(0, 256, size=(90, 160, 3), dtype=np.uint8), (args.width, args.height)) for _ in range(10)]
+    recognitions = synthetic_recognitions(frames[0], 3)
+
+    inference_buffers, display_buffers = FrameBuffers(), FrameBuffers()
+    run("legacy", lambda frame: legacy_frame(frame, recognitions), frames, args.frames)
+    run("buffered", lambda frame: buffered_frame(frame, recognitions, inference_buffers, display_buffers), frames, args.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Local recognition service: many kiosk clients (one process each, one persistent connection each) send single-face
+/match requests to one service, with micro-batching, without it (every request matched alone) and with a new
+connection per request. Reports the throughput, the client latency p50 / p95 and the mean match batch.
+
+Checks: the answers of the service are the matches of a local GalleryMatcher over the same gallery, and a face
+enrolled by one client is matched by another on its very next request. Exits with status 1 if a check fails.
+
+Usage:
+    python -m benchmarks.recognition_service --clients 8 --requests 200
+    python -m benchmarks.recognition_service --gallery-size 100000 --clients 16 --max-wait-ms 1
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.ann_recall import synthetic_gallery
+from src.business_logic.ann_index import ExactIndex
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.recognition_client import RecognitionClient
+from src.business_logic.recognition_service import RecognitionService
+
+
+def client_main(address : str, queries : np.ndarray, keep_alive : bool, start_event, results) -> None:
+    """One kiosk: waits for the start signal, then sends one /match per query and reports its latencies"""
+    try:
+        client = RecognitionClient(address)
+        client.health()
+        results.put(None)
+        start_event.wait()
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            client.match(query[None, :])
+            latencies.append(time.perf_counter() - start)
+            if not keep_alive:
+                client.close()
+        results.put(latencies)
+    except Exception as e:
+        results.put(f"{type(e).__name__}: {e}")
+
+
+def run(service : RecognitionService, address : str, queries : np.ndarray, clients : int, max_batch : int, keep_alive : bool = True) -> dict:
+    """
+    :return: Dict of the throughput, the latency percentiles and the mean batch of one configuration
+    """
+    service.batcher.max_batch = max_batch
+    batches, matched = service.batcher.batches, service.batcher.queries
+    context = multiprocessing.get_context("spawn")
+    start_event, results = context.Event(), context.Queue()
+    processes = [
+        context.Process(target=client_main, args=(address, client_queries, keep_alive, start_event, results), daemon=True)
+        for client_queries in np.array_split(queries, clients)
+    ]
+    for process in processes:
+        process.start()
+    # Every client is connected before the clock starts
+    answers = [results.get() for _ in processes]
+
+    start = time.perf_counter()
+    start_event.set()
+    # A client that failed to connect sent its error instead of its latencies
+    answers += [results.get() for answer in list(answers) if answer is None]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    errors = [answer for answer in answers if isinstance(answer, str)]
+    if errors:
+        raise RuntimeError(f"{len(errors)} clients failed: {errors[0]}")
+    latencies = [latency for answer in answers if answer is not None for latency in answer]
+
+    batch_count = service.batcher.batches - batches
+    return {
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(1000 * float(np.percentile(latencies, 95)), 2),
+        "mean_batch": round((service.batcher.queries - matched) / batch_count, 2) if batch_count else 0.0
+    }
+
+
+def check_matches(address : str, matcher : GalleryMatcher, queries : np.ndarray) -> bool:
+    """The service answers exactly like a local matcher over the same gallery"""
+    remote = RecognitionClient(address).match(queries)
+    local = matcher.match(queries)
+    return all(a["name"] == b.name and abs(a["distance"] - b.distance) < 1e-5 for a, b in zip(remote, local))
+
+
+def check_enrollment(address : str, encoding : np.ndarray) -> bool:
+    """A face enrolled by one client is matched by another one on its next request, then deleted"""
+    kiosk_a, kiosk_b = RecognitionClient(address), RecognitionClient(address)
+    kiosk_b.health()
+    enrolled, _ = kiosk_a.enroll("Benchmark_Visitor", encoding)
+    seen = kiosk_b.match([encoding])[0]["name"] == "Benchmark_Visitor"
+    deleted, _, _ = kiosk_b.delete("Benchmark_Visitor")
+    forgotten = kiosk_a.match([encoding])[0]["name"] != "Benchmark_Visitor"
+    return enrolled and seen and deleted and forgotten
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery-size", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--unix", action="store_true", help="Serve on a Unix socket instead of a local TCP port")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="recognition_service_bench_")
+    service = RecognitionService(os.path.join(directory, "gallery"), os.path.join(directory, "none.pkl"), max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    try:
+        gallery, names, queries, _ = synthetic_gallery(args.gallery_size, args.clients * args.requests)
+        service.start()
+        service.gallery.replace(gallery, names)
+        address = service.serve(socket_path=os.path.join(directory, "service.sock")) if args.unix else service.serve(0)
+
+        reference = GalleryMatcher(gallery, names, tolerance=service.matcher.tolerance, index=ExactIndex())
+        checks = {
+            "same_matches": check_matches(address, reference, queries[:64]),
+            "enrollment_visible": check_enrollment(address, np.random.default_rng(1).normal(0.0, 0.06, 128).astype(np.float32))
+        }
+        print(f"gallery_size={args.gallery_size}, clients={args.clients}, " + ", ".join(f"{key}={value}" for key, value in checks.items()))
+
+        modes = {
+            "batched": run(service, address, queries, args.clients, args.max_batch),
+            "unbatched": run(service, address, queries, args.clients, 1),
+            "batched_new_connections": run(service, address, queries, args.clients, args.max_batch, keep_alive=False)
+        }
+        for mode, result in modes.items():
+            print(f"mode={mode}, " + ", ".join(f"{key}={value}" for key, value in result.items()))
+    finally:
+        service.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
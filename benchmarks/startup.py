@@ -0,0 +1,100 @@
+"""
+Startup costs, each measured in a fresh interpreter:
+    - import time of the app modules and of the heavy libraries
+    - time to the first recognized frame (import + model load + first recognize call) and the
+      latency of the following frames, headless
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --video entrance.mp4 --runs 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import numpy as np
+
+MODULES = [
+    "config",
+    "src.utils.metrics",
+    "src.business_logic.gallery_matcher",
+    "src.business_logic.add_known_face",
+    "src.utils.audio_engine",
+    "src.gui.main_window",
+    "numpy",
+    "cv2",
+    "face_recognition",
+    "src.business_logic.recognizer",
+    "src.business_logic.multi_camera"
+]
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+FIRST_FRAME_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import numpy as np
+import cv2
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.recognizer import FaceRecognizer
+imported = time.perf_counter()
+
+video = {video!r}
+if video:
+    ret, frame = cv2.VideoCapture(video).read()
+else:
+    frame = cv2.resize(np.random.default_rng(0).integers(0, 256, size=(90, 160, 3), dtype=np.uint8), (1280, 720))
+recognizer = FaceRecognizer(GalleryMatcher())
+
+first_start = time.perf_counter()
+recognizer.recognize(frame)
+first = time.perf_counter()
+
+latencies = []
+for _ in range(5):
+    frame_start = time.perf_counter()
+    recognizer.recognize(frame)
+    latencies.append(time.perf_counter() - frame_start)
+
+print(json.dumps({{"import_seconds": imported - start, "first_frame_seconds": first - first_start,
+                  "time_to_first_frame_seconds": first - start, "next_frame_seconds": sorted(latencies)[len(latencies) // 2]}}))
+"""
+
+
+def run_python(script : str) -> str:
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return result.stdout.strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measure, the median is reported")
+    parser.add_argument("--video", help="Video whose first frame is recognized (default: synthetic frame)")
+    args = parser.parse_args()
+
+    print(f"{'module':<40}{'import ms':>12}")
+    for module in MODULES:
+        try:
+            times = [float(run_python(IMPORT_SCRIPT.format(module=module))) for _ in range(args.runs)]
+            print(f"{module:<40}{1000 * np.median(times):>12.1f}")
+        except RuntimeError as e:
+            print(f"{module:<40}{'skipped':>12}  ({e})")
+
+    try:
+        runs = [json.loads(run_python(FIRST_FRAME_SCRIPT.format(video=args.video))) for _ in range(args.runs)]
+        print()
+        for key in runs[0]:
+            print(f"{key:<40}{1000 * np.median([run[key] for run in runs]):>12.1f} ms")
+    except RuntimeError as e:
+        print(f"first recognized frame: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 import logging
 import sys
 
-from isort import file
-
 LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
 
 def setup_logger(name : str = None, file_name : str = "app.log") -> logging.Logger:
@@ -1,14 +1,49 @@
+import time
+START_TIME = time.perf_counter()
+
 from src.gui.main_window import FaceRecognitionApp
+from src.utils.metrics import metrics
 import logging
+import os
 import sys
 import flet as ft
 
+metrics.set_gauge("import_seconds", time.perf_counter() - START_TIME, module="main_window")
+
 logger = logging.getLogger(__name__)
 
 
 def main(page: ft.Page):
     try:
-        FaceRecognitionApp(page)
+        # Comma separated video sources, e.g. FACE_APP_SOURCES=0,1,rtsp://10.0.0.5/stream,entrance.mp4
+        sources = [source.strip() for source in os.environ.get("FACE_APP_SOURCES", "0").split(",") if source.strip()]
+        # Processes encoding the faces in parallel (0 = encode in the camera thread)
+        encoding_workers = int(os.environ.get("FACE_APP_ENCODING_WORKERS", "0"))
+        # Optional Prometheus export: FACE_APP_METRICS_FILE=metrics.prom and / or FACE_APP_METRICS_PORT=9108
+        metrics_file = os.environ.get("FACE_APP_METRICS_FILE") or None
+        metrics_port = int(os.environ["FACE_APP_METRICS_PORT"]) if os.environ.get("FACE_APP_METRICS_PORT") else None
+        # Sound alerts output: auto, device, null or file:alerts.wav
+        audio_sink = os.environ.get("FACE_APP_AUDIO_SINK", "auto")
+        # SQLite database of the recognition history
+        events_db = os.environ.get("FACE_APP_EVENTS_DB", "recognition_events.db")
+        # Adaptive detection: target processed FPS per stream (0 = fixed scale), latency cap and optional decision log
+        target_fps = float(os.environ.get("FACE_APP_TARGET_FPS", "10")) or None
+        max_latency = float(os.environ.get("FACE_APP_MAX_LATENCY_MS", "150")) / 1000
+        controller_log = os.environ.get("FACE_APP_CONTROLLER_LOG") or None
+        # Detector and encoder profile written by python -m src.cli.calibrate
+        profile_file = os.environ.get("FACE_APP_PROFILE", "host_profile.json")
+        # Capture and inference in separate processes sharing the frames through shared memory: FACE_APP_PROCESS_PIPELINE=1
+        process_pipeline = os.environ.get("FACE_APP_PROCESS_PIPELINE", "0") == "1"
+        # Gallery and matching shared with the other kiosks by python -m src.cli.recognition_service:
+        # FACE_APP_SERVICE=http://127.0.0.1:8765 or unix:/tmp/face_recognition.sock
+        service = os.environ.get("FACE_APP_SERVICE") or None
+        # Gallery index: exact scan (default), ivf clusters (approximate, faster on large galleries) or int8 / pq compact codes re-ranked exactly (large watchlists)
+        gallery_index = os.environ.get("FACE_APP_GALLERY_INDEX", "exact")
+        FaceRecognitionApp(
+            page, encoding_workers=encoding_workers, sources=sources, metrics_file=metrics_file, metrics_port=metrics_port, audio_sink=audio_sink, started_at=START_TIME,
+            events_db=events_db, target_fps=target_fps, max_latency=max_latency, controller_log=controller_log, profile_file=profile_file,
+            process_pipeline=process_pipeline, service=service, gallery_index=gallery_index
+        )
     except Exception as e:
         logger.error(f"Error occured in FaceRecognitionApp processing, check this issue: {e}")
         sys.exit(1)
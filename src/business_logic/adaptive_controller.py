@@ -0,0 +1,239 @@
+"""
+Closed-loop control of the detection resolution and of the processing rate of a video source.
+
+The HOG detector finds faces of about 80 pixels in the image it scans, so the smallest face it can see
+in the camera frame is 80 / (scale * 2 ** upsample) pixels. The detection cost grows with the scanned
+pixels, (scale * 2 ** upsample) ** 2 times the frame area. The controller measures both on every
+inference (face sizes from the recognitions, cost per scanned pixel from the stage times) and picks:
+    resolution = scale * 2 ** upsample  just large enough for the smallest face seen recently, grown step by
+                                        step while no face is seen (distant faces), capped by the latency budget
+    stride                              captured frames per processed frame, from the target FPS and the cost
+"""
+from typing import Any, List, NamedTuple, Optional, Sequence
+from collections import deque
+import math
+import time
+from config import setup_logger
+
+logger = setup_logger(__name__)
+
+DETECTOR_WINDOW = 80  # Side in pixels of the HOG detection window of dlib
+
+
+class ControllerSettings(NamedTuple):
+    """
+    Detection settings of the next frames of a source
+
+    :param scale: Downscale factor of the frame before detection and encoding
+    :param upsample: Number of times the detector upsamples the small frame
+    :param stride: Captured frames per processed frame (1 = every frame)
+    """
+    scale: float
+    upsample: int
+    stride: int
+
+    @property
+    def resolution(self) -> float:
+        return self.scale * 2 ** self.upsample
+
+
+class AdaptiveController:
+    def __init__(self, target_fps : float = 10.0, max_latency : float = 0.15, scale : float = 0.25, upsample : int = 1, min_scale : float = 0.1, max_scale : float = 1.0, max_upsample : int = 2, max_stride : int = 30, face_margin : float = 1.4, search_resolution : float = 2.0, face_memory : float = 2.0, probe_interval : float = 5.0, smoothing : float = 0.8, max_step : float = 1.25, hysteresis : float = 0.1, scale_step : float = 0.05, log_size : int = 1000, log_interval : float = 5.0, name : str = ""):
+        """
+        Initialize AdaptiveController: adjusts the detection scale, the upsample count and the stride of one source
+
+        :param target_fps: Processed frames per second wanted for the source
+        :param max_latency: Maximum seconds of one inference, the resolution is capped to stay under it
+        :param scale: Initial downscale factor
+        :param upsample: Initial detector upsample count
+        :param min_scale: Smallest downscale factor
+        :param max_scale: Largest downscale factor, higher resolutions use the detector upsampling
+        :param max_upsample: Largest detector upsample count
+        :param max_stride: Largest number of captured frames per processed frame
+        :param face_margin: The smallest recent face is scanned at face_margin * 80 pixels, so somewhat smaller faces are found too
+        :param search_resolution: Largest resolution tried while no face is seen
+        :param face_memory: Seconds a seen face size is remembered
+        :param probe_interval: Seconds between two probe frames at the largest affordable resolution while faces are seen (0 = never)
+        :param smoothing: Weight of the previous estimate in the smoothed stage costs
+        :param max_step: Largest change factor of the resolution per frame, so the loop converges without oscillating
+                         (over the latency budget the resolution may drop by max_step ** 3 at once)
+        :param hysteresis: Relative resolution change under which the settings are kept
+        :param scale_step: The scale is rounded to multiples of scale_step (keeps the preprocessing buffers reusable)
+        :param log_size: Number of decisions kept in the decision log
+        :param log_interval: Seconds between two log entries when the settings do not change
+        :param name: Name of the source, for the logs
+        """
+        self.target_fps = target_fps
+        self.max_latency = max_latency
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.max_upsample = max_upsample
+        self.max_stride = max_stride
+        self.face_margin = face_margin
+        self.search_resolution = search_resolution
+        self.face_memory = face_memory
+        self.probe_interval = probe_interval
+        self.smoothing = smoothing
+        self.max_step = max_step
+        self.hysteresis = hysteresis
+        self.scale_step = scale_step
+        self.log_interval = log_interval
+        self.name = name
+
+        self.settings = ControllerSettings(scale, upsample, 1)
+        self.reason = "initial"  # Why the current settings were chosen: faces, search, fps, latency or probe
+        self.decisions = deque(maxlen=log_size)
+        self.seconds_per_pixel = None  # Smoothed detection seconds per scanned pixel
+        self.other_seconds = 0.0       # Smoothed preprocessing + encoding + matching seconds
+        self.latency = 0.0             # Smoothed seconds of one inference
+        self._faces = deque()          # (time, smallest face side in frame pixels)
+        self._last_log_time = 0.0
+        self._last_probe_time = None
+        self._probe_return = None
+        self._probe_stride = 1
+
+    def update(self, frame_shape : Sequence[int], timings : dict, duration : float, recognitions : Sequence[Any], capture_fps : float = 0.0, now : Optional[float] = None) -> ControllerSettings:
+        """
+        Feed the measurements of one inference and get the settings of the next frames
+
+        :param frame_shape: Shape of the captured frame
+        :param timings: Stage seconds of the inference, as filled by FaceRecognizer.recognize
+        :param duration: Seconds of the whole inference
+        :param recognitions: Recognitions of the frame (full frame locations)
+        :param capture_fps: Measured capture rate of the source (0 = unknown)
+        :param now: Time of the inference in seconds (default: time.monotonic(), a simulation passes its own clock)
+        :return: ControllerSettings to use from the next frame on
+        """
+        now = time.monotonic() if now is None else now
+        if self._last_probe_time is None:
+            self._last_probe_time = now
+        frame_pixels = float(frame_shape[0] * frame_shape[1])
+        self._measure(timings, duration, frame_pixels)
+
+        # Size of the smallest face seen over the last face_memory seconds
+        if recognitions:
+            self._faces.append((now, min(min(bottom - top, right - left) for top, right, bottom, left in (r.location for r in recognitions))))
+        while self._faces and now - self._faces[0][0] > self.face_memory:
+            self._faces.popleft()
+        smallest_face = min(size for _, size in self._faces) if self._faces else None
+
+        # A probe frame is a one-off: the next settings are computed from the ones before it
+        current = self._probe_return if self._probe_return is not None else self.settings.resolution
+        stride_before = self._probe_stride if self._probe_return is not None else self.settings.stride
+        self._probe_return = None
+        if smallest_face:
+            # Just enough resolution for the smallest face: close-ups are scanned at a low resolution
+            wanted, reason = self.face_margin * DETECTOR_WINDOW / max(smallest_face, 1), "faces"
+        else:
+            # No face: look for distant ones with a growing resolution, bounded by the budgets below
+            wanted, reason = min(current * self.max_step, self.search_resolution), "search"
+
+        # Budgets: the latency cap always holds, the FPS budget gives way to the faces being seen
+        latency_limit = self._resolution_for(self.max_latency, frame_pixels)
+        fps_limit = self._resolution_for((1.0 - self.hysteresis) / self.target_fps, frame_pixels) if self.target_fps else math.inf
+        if smallest_face is None and wanted > fps_limit:
+            wanted, reason = fps_limit, "fps"
+        if wanted > latency_limit:
+            wanted, reason = latency_limit, "latency"
+
+        # Bounded steps, then hysteresis: the loop settles instead of chasing the measurement noise.
+        # Over the latency budget it backs off faster than it climbs, and is not held by the hysteresis
+        max_drop = self.max_step ** 3 if reason == "latency" else self.max_step
+        wanted = min(max(wanted, current / max_drop), current * self.max_step)
+        keep = abs(wanted / current - 1.0) < self.hysteresis and not (reason == "latency" and wanted < current)
+        resolution = current if keep else wanted
+
+        # Faces smaller than the smallest one seen are invisible at its resolution: now and then,
+        # one frame is scanned at the largest resolution the budgets allow
+        probe_resolution = min(self.search_resolution, fps_limit, latency_limit)
+        if smallest_face and self.probe_interval and now - self._last_probe_time >= self.probe_interval and probe_resolution > resolution * self.max_step:
+            self._probe_return, self._probe_stride = resolution, stride_before
+            self._last_probe_time = now
+            resolution, reason = probe_resolution, "probe"
+        scale, upsample = self._split(resolution)
+
+        # Stride: skip the frames the target FPS (or the inference cost) does not leave time for
+        stride = 1
+        if capture_fps > 0:
+            # Frame periods one inference takes: the current stride is kept until the cost is clearly below the next lower one
+            periods = capture_fps * self._predict(scale * 2 ** upsample, frame_pixels)
+            cost_stride = math.ceil(periods)
+            if cost_stride < stride_before and periods > cost_stride * (1.0 - self.hysteresis):
+                cost_stride = min(cost_stride + 1, stride_before)
+            stride = max(1, round(capture_fps / self.target_fps) if self.target_fps else 1, cost_stride)
+            stride = min(stride_before if reason == "probe" else stride, self.max_stride)
+
+        settings = ControllerSettings(scale, upsample, stride)
+        if settings != self.settings or now - self._last_log_time >= self.log_interval:
+            self._log(now, settings, reason, smallest_face, capture_fps, frame_pixels)
+        self.settings = settings
+        self.reason = reason
+        return settings
+
+    def decision_log(self) -> List[dict]:
+        """
+        :return: Logged decisions, oldest first
+        """
+        return list(self.decisions)
+
+    def stats(self) -> dict:
+        return {
+            "scale": self.settings.scale,
+            "upsample": self.settings.upsample,
+            "stride": self.settings.stride,
+            "latency_ms": round(1000 * self.latency, 1),
+            "decisions": len(self.decisions)
+        }
+
+    def _measure(self, timings : dict, duration : float, frame_pixels : float) -> None:
+        # Detection cost per scanned pixel, only from the frames where the detector actually scanned
+        # (a motion-gated frame that skipped detection says nothing about it)
+        scanned = timings.get("detect_pixels", 0)
+        if scanned >= 0.25 * frame_pixels * self.settings.scale ** 2:
+            seconds_per_pixel = timings.get("detect", 0.0) / scanned
+            self.seconds_per_pixel = seconds_per_pixel if self.seconds_per_pixel is None else self.smoothing * self.seconds_per_pixel + (1 - self.smoothing) * seconds_per_pixel
+        other = max(duration - timings.get("detect", 0.0), 0.0)
+        self.other_seconds = self.smoothing * self.other_seconds + (1 - self.smoothing) * other
+        self.latency = duration if not self.latency else self.smoothing * self.latency + (1 - self.smoothing) * duration
+
+    def _predict(self, resolution : float, frame_pixels : float) -> float:
+        """Predicted seconds of a full inference at a resolution"""
+        if self.seconds_per_pixel is None:
+            return self.latency
+        return self.seconds_per_pixel * frame_pixels * resolution ** 2 + self.other_seconds
+
+    def _resolution_for(self, seconds : float, frame_pixels : float) -> float:
+        """Largest resolution whose predicted inference fits in seconds"""
+        if self.seconds_per_pixel is None:
+            return math.inf
+        detect_budget = seconds - self.other_seconds
+        if detect_budget <= 0:
+            return 0.0
+        return math.sqrt(detect_budget / (self.seconds_per_pixel * frame_pixels))
+
+    def _split(self, resolution : float):
+        """Resolution -> (scale, upsample): downscaling first, the detector upsamples beyond max_scale"""
+        upsample = 0
+        while resolution / 2 ** upsample > self.max_scale and upsample < self.max_upsample:
+            upsample += 1
+        scale = resolution / 2 ** upsample
+        scale = round(scale / self.scale_step) * self.scale_step
+        return round(min(max(scale, self.min_scale), self.max_scale), 4), upsample
+
+    def _log(self, now : float, settings : ControllerSettings, reason : str, smallest_face : Optional[int], capture_fps : float, frame_pixels : float) -> None:
+        decision = {
+            "time": round(time.time(), 3),
+            "source": self.name,
+            "reason": reason,
+            "scale": settings.scale,
+            "upsample": settings.upsample,
+            "stride": settings.stride,
+            "smallest_face": smallest_face,
+            "latency_ms": round(1000 * self.latency, 2),
+            "predicted_ms": round(1000 * self._predict(settings.resolution, frame_pixels), 2),
+            "capture_fps": round(capture_fps, 1)
+        }
+        if settings != self.settings:
+            logger.info(f"'{self.name}' detection set to scale {settings.scale}, upsample {settings.upsample}, stride {settings.stride} ({reason}, latency {decision['latency_ms']} ms, smallest face {smallest_face})")
+        self.decisions.append(decision)
+        self._last_log_time = now
@@ -1,99 +1,140 @@
-from typing import List, Any, Tuple
-import face_recognition
-import numpy as np
-import cv2
-import pickle
-import os
+from typing import Any, Tuple, Optional
 from config import setup_logger
+from src.business_logic.gallery import Gallery
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.host_profile import DetectionProfile, PROFILE_FILE, load_profile
+from src.utils.metrics import metrics
 
 logger = setup_logger(__name__)
 
 class FaceAdder:
-    def __init__(self, data_file="known_faces.pkl", tolerance=0.4):
+    def __init__(self, data_file="known_faces.pkl", tolerance=0.4, matcher : Optional[GalleryMatcher] = None, gallery_dir="known_faces_gallery", encoder : Optional[Any] = None, sessions : Optional[Any] = None, camera_uri : Any = "0", burst_size : int = 8, gallery : Optional[Gallery] = None, profile : Optional[DetectionProfile] = None, profile_file : str = PROFILE_FILE):
         """
         Initialize FaceAdder with configuration
         
-        :param data_file: Path to the file where face data is stored
+        :param data_file: Path to the legacy pickle file, migrated once into gallery_dir
         :param tolerance: Tolerance for face comparison (lower = more strict)
+        :param matcher: Optional GalleryMatcher holding the in-memory gallery (e.g. the one of the live recognizer)
+        :param gallery_dir: Directory of the binary gallery where face data is stored
+        :param encoder: Optional encoding backend with an encode(rgb_frame, face_locations) method (e.g. ParallelFaceEncoder)
+        :param sessions: Optional CameraSessionManager shared with the live recognition loop, enrollment then samples the
+                         running stream instead of opening the camera (default: the camera is opened for the capture only)
+        :param camera_uri: Camera the faces are captured from
+        :param burst_size: Number of frames captured per enrollment, the best face of the burst is kept
+        :param gallery: Optional Gallery owning the known faces (default: one over gallery_dir, data_file and matcher)
+        :param profile: Optional detector and encoder profile (default: the calibrated profile of the host, from profile_file)
+        :param profile_file: Host profile written by the calibration command
         """
         self.data_file = data_file
         self.tolerance = tolerance
+        self.gallery = gallery if gallery is not None else Gallery(gallery_dir, data_file, matcher)
+        self.matcher = self.gallery.matcher
+        self.store = self.gallery.store
+        self.encoder = encoder
+        self.sessions = sessions
+        self.camera_uri = camera_uri
+        self.burst_size = burst_size
+        # Templates are encoded with the settings of the live recognizer, so both see the same faces
+        self.profile = profile if profile is not None else load_profile(profile_file)
 
-    def is_duplicate_face(self, new_encoding, known_encodings):
+    def is_duplicate_face(self, new_encoding, name : Optional[str] = None):
         """
-        Check if a face encoding already exists in the known faces
+        Check if a face encoding already exists in the known faces under another name
         
         :param new_encoding: Face encoding to check
-        :param known_encodings: List of known face encodings
+        :param name: Name the face is enrolled under, a face close to a template of the same name is one more template of that person
         :return: True if duplicate, False otherwise
         """
-        if not known_encodings:
+        if not self.gallery.count():
             return False
 
-        distances = face_recognition.face_distance(known_encodings, new_encoding)
-        logger.info(f"The norm distances between all known faces and compared face is {distances}")
-        return np.any(distances <= self.tolerance) # If there is at least one face that his difference is less than tolerance the compared face is familiar.
+        with metrics.time_stage("duplicate_check"):
+            closest = self.matcher.match([new_encoding])[0]
+        logger.info(f"The norm distance between the closest known face and compared face is {closest.distance}")
+        return closest.distance <= self.tolerance and closest.name != name
 
-    def capture_face_from_camera(self):
+    def capture_face_from_camera(self, open_timeout : float = 10.0, burst_timeout : float = 2.0, skip_frames : int = 5):
         """
-        Capture a single frame from camera and extract face encoding
+        Capture a short burst of frames from the camera and extract the encoding of its best face
         
+        :param open_timeout: Seconds to wait for the camera to open
+        :param burst_timeout: Maximum seconds to capture the burst
+        :param skip_frames: Frames skipped after the camera opens while its exposure settles (a running stream already skipped them)
         :return: Tuple (success, face_encoding_or_error_message)
         """
-        cap = cv2.VideoCapture(0)
-        
-        if not cap.isOpened():
-            return False, "Unable to access camera"
-        
-        ret, frame = cap.read()
-        cap.release()
+        import cv2
+        from src.business_logic.camera_session import CameraSessionManager
+        from src.business_logic.face_quality import best_face
+
+        # Share the running stream of the live loop if there is one, the camera is only opened when nobody uses it
+        sessions = self.sessions if self.sessions is not None else CameraSessionManager()
+        source = sessions.acquire(self.camera_uri)
+        try:
+            if not source.opened.wait(open_timeout) or source.error is not None:
+                return False, "Unable to access camera"
+
+            with metrics.time_stage("enroll_burst"):
+                frames = source.burst(self.burst_size, burst_timeout, skip_frames)
+        finally:
+            sessions.release(source)
 
-        if not ret:
+        if not frames:
             return False, "Error capturing frame from camera"
 
+        # Keep the sharpest, largest and best exposed face of the burst, only that face is encoded
+        with metrics.time_stage("enroll_select"):
+            best = best_face(frames, self.profile.detect)
+
+        if best is None:
+            return False, "No face detected. Please ensure your face is clearly visible"
+        frame, location, score = best
+        logger.info(f"Enrollment face selected from a burst of {len(frames)} frames, quality score {score:.1f}")
+
         # Convert BGR to RGB for face_recognition library
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Find face encodings in the frame
-        encodings = face_recognition.face_encodings(rgb_frame)
+
+        with metrics.time_stage("enroll_encode"):
+            if self.encoder is not None:
+                encodings = self.encoder.encode(rgb_frame, [location])
+            else:
+                encodings = self.profile.encode(rgb_frame, [location])
 
         if not encodings:
             return False, "No face detected. Please ensure your face is clearly visible"
 
-        # Return the first (and hopefully only) face encoding
         return True, encodings[0]
 
-    def add_face_to_database(self, face_encoding, name, known_encodings, known_names):
+    def add_face_to_database(self, face_encoding, name):
         """
-        Add a new face encoding and name to the database
+        Add a new face encoding and name to the database (journaled on disk, then visible to the live matcher)
         
         :param face_encoding: The face encoding to add
-        :param name: Name associated with the face
-        :param known_encodings: List of known face encodings (will be modified)
-        :param known_names: List of known face names (will be modified)
-        :return: True if added successfully
+        :param name: Name associated with the face, a known name gets one more template
+        :return: Tuple (success, message)
         """
         # Check for duplicates
-        if self.is_duplicate_face(face_encoding, known_encodings):
+        if self.is_duplicate_face(face_encoding, name):
             return False, "This face is already in the database!"
 
         # Generate name if not provided
         if not name:
-            name = f"Person_{len(known_encodings) + 1}"
+            name = f"Person_{self.gallery.identity_count() + 1}"
 
-        # Add to the lists
-        known_encodings.append(face_encoding)
-        known_names.append(name)
+        try:
+            templates = len(self.gallery.rows_of(name))
+            self.gallery.add(face_encoding, name)
+        except Exception as e:
+            return False, f"Failed to save face data: {str(e)}"
 
+        if templates:
+            return True, f"Face added successfully as template {templates + 1} of '{name}'"
         return True, f"Face added successfully as '{name}'"
 
-    def capture_and_add_face(self, name : str, known_encodings : List[Any], known_names : List[str]):
+    def capture_and_add_face(self, name : Optional[str]):
         """
         Complete process: capture face from camera and add to database
         
         :param name: Name for the person (optional)
-        :param known_encodings: List of known face encodings
-        :param known_names: List of known face names
         :return: Tuple (success, message)
         """
         # Step 1: Capture face from camera
@@ -102,97 +143,68 @@ class FaceAdder:
         if not capture_success:
             return False, face_data  # face_data contains error message
 
-        face_encoding = face_data
-
         # Step 2: Add face to database
-        add_success, message = self.add_face_to_database(
-            face_encoding, name, known_encodings, known_names
-        )
-
-        if add_success:
-            # Step 3: Save to file
-            try:
-                self.save_known_faces(known_encodings, known_names)
-                return True, message
-            except Exception as e:
-                # Remove the face we just added since saving failed
-                known_encodings.pop()
-                known_names.pop()
-                return False, f"Failed to save face data: {str(e)}"
-        else:
-            return False, message
+        return self.add_face_to_database(face_data, name)
 
     def save_known_faces(self, known_encodings, known_names):
         """
-        Save known faces to file
+        Save known faces to file (rewrites the whole gallery, adds and deletes are journaled instead)
         
-        :param known_encodings: List of face encodings to save
-        :param known_names: List of corresponding names to save
+        :param known_encodings: Face encodings to save
+        :param known_names: Corresponding names to save
         """
-        data = {
-            "encodings": known_encodings,
-            "names": known_names
-        }
-        
-        with open(self.data_file, "wb") as f:
-            pickle.dump(data, f)
+        if self.store is None:
+            # RemoteGallery: the files belong to the recognition service, a client only enrolls and deletes
+            raise RuntimeError("The gallery of the recognition service can not be rewritten by a client, stop the service and run the tool on its gallery")
+        self.gallery.replace(known_encodings, known_names)
+
+    def compact_known_faces(self):
+        """
+        Fold the journaled adds and deletes into the gallery file
+        """
+        self.gallery.compact()
 
     def load_known_faces(self):
         """
-        Load known faces from file
+        Load known faces from file, only if the gallery files changed since the last load
         
-        :return: Tuple (encodings, names)
+        :return: Number of known face templates
         """
-        if not os.path.exists(self.data_file):
-            return [], []
-        
         try:
-            with open(self.data_file, "rb") as f:
-                data = pickle.load(f)
-                encodings = data.get("encodings", [])
-                names = data.get("names", [])
-                return encodings, names
+            self.gallery.reload_if_changed()
         except Exception as e:
             print(f"Error loading known faces: {e}")
-            return [], []
+        return self.gallery.count()
 
     def get_face_count(self):
         """
         Get the number of faces in the database
         
-        :return: Number of faces
+        :return: Number of face templates
         """
-        encodings, _ = self.load_known_faces()
-        return len(encodings)
+        return self.gallery.count()
 
-    def delete_face(self, name : str, known_encodings : List, known_names : List[str]) -> Tuple[bool, str]:
+    def delete_face(self, name : str) -> Tuple[bool, str]:
         """
-        Delete a face from the database by index
+        Delete a person (all the templates of the name) from the database
         
-        :param index: Index of face to delete
-        :param known_encodings: List of known face encodings
-        :param known_names: List of known face names
+        :param name: Name of the person to delete
         :return: Tuple (success, message)
         """
         try:
-            index = known_names.index(name)
-            del known_encodings[index]
-            del known_names[index]
-            
-            try:
-                self.save_known_faces(known_encodings, known_names)
-                return True, f"Deleted face '{name}' successfully"
-            except Exception as e:
-                return False, f"Error saving after deletion: {str(e)}"
+            removed = self.gallery.remove(name)
         except Exception as e:
-            logger.error(f"{name} is not in knows_names list!")
-            return False, f"{name} is not in knows_names list!"
+            return False, f"Error saving after deletion: {str(e)}"
+
+        if not removed:
+            logger.error(f"{name} is not in the known faces!")
+            return False, f"{name} is not in the known faces!"
+        return True, f"Deleted face '{name}' successfully" if removed == 1 else f"Deleted face '{name}' ({removed} templates) successfully"
 
     def list_known_faces(self):
         """
         Get list of all known face names
         
-        :return: List of names
+        :return: List of names, one per person
         """
-        _, names = self.load_known_faces()
-        return names
\ No newline at end of file
+        return self.gallery.identities()
\ No newline at end of file
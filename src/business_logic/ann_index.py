@@ -0,0 +1,549 @@
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import numpy as np
+from config import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class ExactIndex:
+    """
+    Index that proposes every known face as a candidate (brute-force linear scan).
+    Used as the default index and as the ground truth when evaluating approximate indexes.
+    """
+
+    def build(self, encodings : np.ndarray) -> None:
+        pass
+
+    def add(self, encoding : np.ndarray) -> None:
+        pass
+
+    def remove(self, row : int) -> None:
+        pass
+
+    def clone(self) -> "ExactIndex":
+        return self
+
+    def candidates(self, queries : np.ndarray, top_k : int = 1) -> Optional[List[np.ndarray]]:
+        """
+        :return: None, meaning every row of the gallery is a candidate
+        """
+        return None
+
+
+class IVFIndex:
+    def __init__(self, n_lists : Optional[int] = None, n_probe : int = 8, min_train_size : int = 2048, train_iterations : int = 10, seed : int = 0):
+        """
+        Inverted file index: the gallery is split into n_lists clusters with k-means and a query
+        only scans the rows of its n_probe closest clusters. Candidates are re-ranked exactly by the matcher.
+
+        :param n_lists: Number of clusters (None = sqrt of the gallery size at build time)
+        :param n_probe: Number of closest clusters scanned per query (higher = better recall, slower)
+        :param min_train_size: Below this gallery size the index is not trained and every row is a candidate
+        :param train_iterations: Number of k-means iterations
+        :param seed: Random seed for the k-means initialization
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.train_iterations = train_iterations
+        self.seed = seed
+
+        self.centroids = None
+        self.lists = []
+        self.assignments = np.empty(0, dtype=np.int64)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def build(self, encodings : np.ndarray) -> None:
+        """
+        Train the clusters on the gallery and fill the inverted lists
+
+        :param encodings: (N, 128) float32 matrix of known face encodings
+        """
+        self.centroids = None
+        self.lists = []
+        self.assignments = np.zeros(len(encodings), dtype=np.int64)
+
+        if len(encodings) < self.min_train_size:
+            return
+
+        n_lists = self.n_lists or int(np.sqrt(len(encodings)))
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample, k-means quality saturates long before the whole gallery is used
+        sample_size = min(len(encodings), n_lists * 64)
+        sample = encodings[rng.choice(len(encodings), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.train_iterations):
+            labels = self._nearest_centroids(sample, centroids, 1)[:, 0]
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+
+            # Re-seed empty clusters with random sample points so no list stays unused
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            centroids[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+
+        self.centroids = centroids
+        self.assignments = self._nearest_centroids(encodings, centroids, 1)[:, 0]
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(n_lists + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(n_lists)]
+
+        logger.info(f"IVF index built over {len(encodings)} faces with {n_lists} lists")
+
+    def add(self, encoding : np.ndarray) -> None:
+        """
+        Insert the face that was appended as the last row of the gallery
+
+        :param encoding: 128-d face encoding of the new row
+        """
+        row = len(self.assignments)
+        if not self.is_trained:
+            self.assignments = np.append(self.assignments, 0)
+            return
+
+        list_id = int(self._nearest_centroids(encoding.reshape(1, -1), self.centroids, 1)[0, 0])
+        self.assignments = np.append(self.assignments, list_id)
+        self.lists[list_id] = np.append(self.lists[list_id], row)
+
+    def remove(self, row : int) -> None:
+        """
+        Remove a row of the gallery, the rows after it shift down by one like in the gallery itself
+
+        :param row: Row index of the removed face
+        """
+        if self.is_trained:
+            list_id = self.assignments[row]
+            self.lists[list_id] = self.lists[list_id][self.lists[list_id] != row]
+            # New arrays instead of in-place updates, a clone may share them with a published gallery snapshot
+            self.lists = [rows - (rows > row) for rows in self.lists]
+        self.assignments = np.delete(self.assignments, row)
+
+    def clone(self) -> "IVFIndex":
+        """
+        Copy of the index that can be modified without changing this one (the row arrays are shared,
+        every modification replaces them instead of writing into them)
+        """
+        clone = copy.copy(self)
+        clone.lists = list(self.lists)
+        return clone
+
+    def candidates(self, queries : np.ndarray, top_k : int = 1) -> Optional[List[np.ndarray]]:
+        """
+        Propose candidate rows for every query
+
+        :param queries: (M, 128) float32 matrix of face encodings to search
+        :param top_k: Number of closest known faces the matcher returns per query (the probed lists do not depend on it)
+        :return: List of candidate row arrays, one per query, or None if every row is a candidate
+        """
+        if not self.is_trained:
+            return None
+
+        n_probe = min(self.n_probe, len(self.lists))
+        probes = self._nearest_centroids(queries, self.centroids, n_probe)
+        return [np.concatenate([self.lists[list_id] for list_id in query_probes]) for query_probes in probes]
+
+    @staticmethod
+    def _nearest_centroids(points : np.ndarray, centroids : np.ndarray, k : int, chunk_size : int = 65536) -> np.ndarray:
+        """
+        Find the k closest centroids of every point, in chunks to bound the memory of the distance matrix
+
+        :return: (len(points), k) array of centroid indices
+        """
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        result = np.empty((len(points), k), dtype=np.int64)
+
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            # The query norm is constant per row so it does not change the ranking
+            scores = centroid_norms[None, :] - 2.0 * (chunk @ centroids.T)
+            if k < len(centroids):
+                nearest = np.argpartition(scores, k - 1, axis=1)[:, :k]
+                order = np.argsort(np.take_along_axis(scores, nearest, axis=1), axis=1)
+                result[start:start + chunk_size] = np.take_along_axis(nearest, order, axis=1)
+            else:
+                result[start:start + chunk_size] = np.argsort(scores, axis=1)
+
+        return result
+
+
+QUANTIZATION_MODES = ("int8", "pq")
+
+
+class QuantizedIndex:
+    def __init__(self, mode : str = "int8", max_candidates : float = 0.1, min_train_size : int = 2048, head_dims : int = 32, pq_subvectors : int = 32, pq_centroids : int = 256, train_iterations : int = 10, seed : int = 0, chunk_size : int = 1024):
+        """
+        Compact copy of the gallery in quantized arrays, scanned to propose candidates that the matcher re-ranks
+        exactly against the float32 templates (which can stay in the memory-mapped gallery file, only the candidate
+        rows are read). Codes per template: 128 bytes (int8) or pq_subvectors bytes (pq). The codes come on top of
+        the memory map, what they save is the part of the gallery file a match reads: a match scans the codes and
+        a few float32 rows instead of the whole file, for galleries larger than the page cache can hold.
+
+        The reconstruction error of every template is kept, so the proposal never misses the exact top_k
+        templates: a row is proposed if its approximate distance minus its error is not above the top_k-th
+        smallest approximate distance plus error of the gallery. The top_k results, hence every tolerance
+        decision, are the ones of the exact scan. When the errors are too large for the bound to select few rows
+        (coarse pq codes), the query is scanned exactly instead.
+
+        int8 codes are split in two: the head_dims dimensions of largest variance, scanned first, and the others.
+        The distance over the head minus the error of a row is a lower bound of its distance, so the other
+        dimensions are only read for the rows this bound cannot rule out (most of the gallery is ruled out for a
+        face that is enrolled, an unknown face reads every dimension).
+
+        :param mode: "int8" (per-dimension scale) or "pq" (product quantization, uint8 codes)
+        :param max_candidates: Fraction of the gallery above which a query gets no proposal and is scanned exactly
+        :param min_train_size: Below this gallery size the index is not built and every row is a candidate
+        :param head_dims: Dimensions of the int8 codes scanned first
+        :param pq_subvectors: Number of sub-vectors of a template in pq mode (128 must be a multiple of it)
+        :param pq_centroids: Centroids per sub-vector in pq mode (at most 256, one byte per code)
+        :param train_iterations: Number of k-means iterations of the pq codebooks
+        :param seed: Random seed of the pq training
+        :param chunk_size: Gallery rows cast to float32 at once during a scan, small enough for the chunk to stay in cache
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode {mode}, expected one of {QUANTIZATION_MODES}")
+        if mode == "pq" and (128 % pq_subvectors or not 0 < pq_centroids <= 256):
+            raise ValueError("pq_subvectors must divide 128 and pq_centroids must be in [1, 256]")
+        if mode == "int8" and not 0 < head_dims < 128:
+            raise ValueError("head_dims must be in [1, 127]")
+        self.mode = mode
+        self.max_candidates = max_candidates
+        self.min_train_size = min_train_size
+        self.head_dims = head_dims
+        self.pq_subvectors = pq_subvectors
+        self.pq_centroids = pq_centroids
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+        self.codes = None  # (N, 128 - head_dims) int8 or (pq_subvectors, N) uint8
+        self.head_codes = None  # int8: (N, head_dims) int8
+        self.order = None  # int8: (128,) dimensions by decreasing variance, the codes follow this order
+        self.scale = None  # int8: (128,) float32 step of every dimension, in the order of the codes
+        self.codebooks = None  # pq: (pq_subvectors, pq_centroids, 128 / pq_subvectors) float32
+        self.code_norms = np.empty(0, dtype=np.float32)  # Squared norms of the reconstructed templates
+        self.head_norms = np.empty(0, dtype=np.float32)  # int8: squared norms of the reconstructed heads
+        self.errors = np.empty(0, dtype=np.float32)  # Distance between every template and its reconstruction
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codes is not None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: Memory of the codes, the norms, the errors and the codebooks
+        """
+        if not self.is_trained:
+            return 0
+        arrays = [getattr(self, name) for name in self._row_arrays()] + [self.order, self.scale, self.codebooks]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def build(self, encodings : np.ndarray) -> None:
+        """
+        Train the quantizer on the gallery and encode every template
+
+        :param encodings: (N, 128) float32 matrix of known face encodings
+        """
+        self.codes = self.head_codes = self.order = self.scale = self.codebooks = None
+        self.code_norms = np.empty(0, dtype=np.float32)
+        self.head_norms = np.empty(0, dtype=np.float32)
+        self.errors = np.empty(0, dtype=np.float32)
+        if len(encodings) < self.min_train_size:
+            return
+
+        if self.mode == "int8":
+            # By chunks, a memory-mapped gallery is not copied
+            peak = np.zeros(encodings.shape[1], dtype=np.float32)
+            sums = np.zeros(encodings.shape[1])
+            squares = np.zeros(encodings.shape[1])
+            for start in range(0, len(encodings), self.chunk_size):
+                chunk = np.asarray(encodings[start:start + self.chunk_size], dtype=np.float32)
+                np.maximum(peak, np.abs(chunk).max(axis=0), out=peak)
+                sums += chunk.sum(axis=0)
+                squares += np.einsum("ij,ij->j", chunk, chunk)
+            variances = squares / len(encodings) - (sums / len(encodings)) ** 2
+            self.order = np.argsort(-variances, kind="stable")
+            self.scale = (np.maximum(peak, 1e-6) / 127.0)[self.order]
+        elif self.mode == "pq":
+            self.codebooks = self._train_codebooks(encodings)
+
+        parts = [self._encode(np.asarray(encodings[start:start + self.chunk_size], dtype=np.float32)) for start in range(0, len(encodings), self.chunk_size)]
+        for name in self._row_arrays():
+            setattr(self, name, np.concatenate([part[name] for part in parts], axis=self._row_axis(name)))
+
+        logger.info(f"{self.mode} index built over {len(encodings)} faces, {self.nbytes / len(encodings):.0f} bytes per face, max error {self.errors.max():.4f}")
+
+    def add(self, encoding : np.ndarray) -> None:
+        """
+        Insert the face that was appended as the last row of the gallery
+
+        :param encoding: 128-d face encoding of the new row
+        """
+        if not self.is_trained:
+            return
+        # New arrays instead of in-place updates, a clone may share them with a published gallery snapshot
+        part = self._encode(np.asarray(encoding, dtype=np.float32).reshape(1, -1))
+        for name in self._row_arrays():
+            setattr(self, name, np.concatenate([getattr(self, name), part[name]], axis=self._row_axis(name)))
+
+    def remove(self, row : int) -> None:
+        """
+        Remove a row of the gallery, the rows after it shift down by one like in the gallery itself
+
+        :param row: Row index of the removed face
+        """
+        if not self.is_trained:
+            return
+        for name in self._row_arrays():
+            setattr(self, name, np.delete(getattr(self, name), row, axis=self._row_axis(name)))
+
+    def clone(self) -> "QuantizedIndex":
+        """
+        Copy of the index that can be modified without changing this one (the arrays are shared,
+        every modification replaces them instead of writing into them)
+        """
+        return copy.copy(self)
+
+    def candidates(self, queries : np.ndarray, top_k : int = 1) -> Optional[List[np.ndarray]]:
+        """
+        Propose candidate rows for every query: the rows that may be among its exact top_k
+
+        :param queries: (M, 128) float32 matrix of face encodings to search
+        :param top_k: Number of closest known faces the matcher returns per query
+        :return: List of candidate row arrays (None for a query to scan exactly), one per query, or None if every row is a candidate
+        """
+        if not self.is_trained:
+            return None
+
+        size = len(self.errors)
+        k = min(max(top_k, 1), size)
+        limit = max(k, int(self.max_candidates * size))
+        # Bound the (queries, gallery) distance matrices to about 16M floats
+        query_block = max(1, (1 << 24) // max(size, 1))
+        result = []
+        for start in range(0, len(queries), query_block):
+            block = np.asarray(queries[start:start + query_block], dtype=np.float32)
+            if self.mode == "pq":
+                result.extend(self._propose(distances, None, k, limit) for distances in self.approximate_distances(block))
+            else:
+                result.extend(self._int8_candidates(block, k, limit))
+        return result
+
+    def approximate_distances(self, queries : np.ndarray) -> np.ndarray:
+        """
+        Distances between the queries and the reconstructed templates
+
+        :param queries: (M, 128) float32 matrix
+        :return: (M, N) float32 matrix
+        """
+        size = len(self.errors)
+        squared = np.empty((len(queries), size), dtype=np.float32)
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+
+        if self.mode == "pq":
+            # Asymmetric distance: one table of sub-vector distances per query, then a lookup per code
+            sub_dim = queries.shape[1] // self.pq_subvectors
+            sub_queries = queries.reshape(len(queries), self.pq_subvectors, sub_dim)
+            tables = (
+                np.einsum("msd,msd->ms", sub_queries, sub_queries)[:, :, None]
+                + np.einsum("skd,skd->sk", self.codebooks, self.codebooks)[None, :, :]
+                - 2.0 * np.einsum("msd,skd->msk", sub_queries, self.codebooks)
+            ).astype(np.float32)
+            for i, table in enumerate(tables):
+                row = squared[i]
+                row[:] = 0.0
+                for s in range(self.pq_subvectors):
+                    row += table[s].take(self.codes[s])
+        else:
+            scaled = queries[:, self.order] * self.scale[None, :]
+            np.add(self._products(self.head_codes, scaled[:, :self.head_dims]), self._products(self.codes, scaled[:, self.head_dims:]), out=squared)
+            squared *= -2.0
+            squared += self.code_norms[None, :]
+            squared += query_norms[:, None]
+
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared, out=squared)
+
+    def _int8_candidates(self, queries : np.ndarray, k : int, limit : int) -> List[Optional[np.ndarray]]:
+        """
+        Candidates of a block of queries from the head codes first, the other codes of the rows they cannot rule out
+        """
+        permuted = queries[:, self.order]
+        scaled = permuted * self.scale[None, :]
+        head, rest = slice(0, self.head_dims), slice(self.head_dims, None)
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        head_products = self._products(self.head_codes, scaled[:, head])
+        head_squared = np.einsum("ij,ij->i", permuted[:, head], permuted[:, head])[:, None] + self.head_norms[None, :] - 2.0 * head_products
+        np.maximum(head_squared, 0.0, out=head_squared)
+
+        result, full_scans = [], []
+        for i in range(len(queries)):
+            # Upper bound of the k-th exact distance from the rows closest over the head, then every row whose
+            # head distance minus error (lower bound of its distance) is not above it
+            seeds = np.array([np.argmin(head_squared[i])]) if k == 1 else np.argpartition(head_squared[i], k - 1)[:k]
+            seed_distances = self._row_distances(query_norms[i], head_products[i], scaled[i, rest], seeds)
+            bound = (seed_distances + self.errors[seeds]).max() + 2e-3
+            rows = np.flatnonzero(np.sqrt(head_squared[i]) - self.errors <= bound)
+            if len(rows) > limit:
+                result.append(None)
+                full_scans.append(i)
+            else:
+                result.append(self._propose(self._row_distances(query_norms[i], head_products[i], scaled[i, rest], rows), rows, k, limit))
+
+        if full_scans:
+            # Faces the head cannot narrow down (unknown faces): the other dimensions of every row, in one scan
+            squared = head_products[full_scans] + self._products(self.codes, scaled[full_scans, rest])
+            squared *= -2.0
+            squared += self.code_norms[None, :]
+            squared += query_norms[full_scans, None]
+            distances = np.sqrt(np.maximum(squared, 0.0, out=squared), out=squared)
+            for i, query_distances in zip(full_scans, distances):
+                result[i] = self._propose(query_distances, None, k, limit)
+        return result
+
+    def _row_distances(self, query_norm : float, head_products : np.ndarray, scaled_rest : np.ndarray, rows : np.ndarray) -> np.ndarray:
+        """
+        :return: Approximate distances of one query to some rows, the products over the head already computed
+        """
+        products = head_products[rows] + self.codes[rows].astype(np.float32) @ scaled_rest
+        return np.sqrt(np.maximum(query_norm + self.code_norms[rows] - 2.0 * products, 0.0))
+
+    def _propose(self, distances : np.ndarray, rows : Optional[np.ndarray], k : int, limit : int) -> Optional[np.ndarray]:
+        """
+        Rows that may be among the exact top k: approximate distance minus error not above the k-th smallest
+        approximate distance plus error. The margin covers the float32 rounding of the approximate distances
+        (the square root amplifies it close to 0)
+
+        :param distances: Approximate distances of the rows
+        :param rows: Gallery rows of the distances, None for the whole gallery
+        :return: Candidate rows, None if there are more than limit
+        """
+        errors = self.errors if rows is None else self.errors[rows]
+        upper = distances + errors
+        k = min(k, len(upper))
+        bound = (upper.min() if k == 1 else np.partition(upper, k - 1)[k - 1]) + 2e-3
+        possible = np.flatnonzero(distances - errors <= bound)
+        if len(possible) > limit:
+            return None
+        return possible if rows is None else rows[possible]
+
+    def _products(self, codes : np.ndarray, scaled_queries : np.ndarray) -> np.ndarray:
+        """
+        Products of the queries (scale folded in) and the int8 codes, cast by chunks into one float32 buffer that
+        stays in cache: a float32 copy of the codes never exists. numpy has no integer BLAS kernel, an int8 @ int8
+        product runs on a generic loop slower than the float32 scan of the whole gallery
+
+        :return: (M, N) float32 matrix
+        """
+        size = len(codes)
+        products = np.empty((size, len(scaled_queries)), dtype=np.float32)
+        scaled_queries = np.ascontiguousarray(scaled_queries.T)
+        buffer = np.empty((min(self.chunk_size, size), codes.shape[1]), dtype=np.float32)
+        for start in range(0, size, self.chunk_size):
+            chunk = buffer[:len(codes[start:start + self.chunk_size])]
+            np.copyto(chunk, codes[start:start + self.chunk_size], casting="unsafe")
+            np.dot(chunk, scaled_queries, out=products[start:start + len(chunk)])
+        return products.T
+
+    def _row_arrays(self) -> Tuple[str, ...]:
+        """
+        :return: Names of the arrays with one entry per gallery row
+        """
+        if self.mode == "int8":
+            return ("head_codes", "codes", "head_norms", "code_norms", "errors")
+        return ("codes", "code_norms", "errors")
+
+    def _row_axis(self, name : str) -> int:
+        # pq codes are stored by sub-vector, one lookup per sub-vector scans a contiguous array
+        return 1 if self.mode == "pq" and name == "codes" else 0
+
+    def _encode(self, encodings : np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        :return: Dict {name of a row array: its entries} of a block of encodings
+        """
+        if self.mode == "int8":
+            permuted = encodings[:, self.order]
+            codes = np.clip(np.rint(permuted / self.scale), -127, 127).astype(np.int8)
+            reconstructed = codes.astype(np.float32) * self.scale
+            head = reconstructed[:, :self.head_dims]
+            part = {
+                "head_codes": np.ascontiguousarray(codes[:, :self.head_dims]),
+                "codes": np.ascontiguousarray(codes[:, self.head_dims:]),
+                "head_norms": np.einsum("ij,ij->i", head, head)
+            }
+            encodings = permuted
+        else:
+            sub_dim = encodings.shape[1] // self.pq_subvectors
+            codes = np.empty((self.pq_subvectors, len(encodings)), dtype=np.uint8)
+            reconstructed = np.empty_like(encodings)
+            for s in range(self.pq_subvectors):
+                columns = slice(s * sub_dim, (s + 1) * sub_dim)
+                codes[s] = self._assign(np.ascontiguousarray(encodings[:, columns]), self.codebooks[s])
+                reconstructed[:, columns] = self.codebooks[s][codes[s]]
+            part = {"codes": codes}
+
+        part["code_norms"] = np.einsum("ij,ij->i", reconstructed, reconstructed)
+        part["errors"] = np.linalg.norm(encodings - reconstructed, axis=1).astype(np.float32)
+        return part
+
+    def _train_codebooks(self, encodings : np.ndarray) -> np.ndarray:
+        """
+        k-means of every sub-vector space on a sample of the gallery
+
+        :return: (pq_subvectors, pq_centroids, sub_dim) float32 codebooks
+        """
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(encodings), self.pq_centroids * 64)
+        sample = np.asarray(encodings[np.sort(rng.choice(len(encodings), sample_size, replace=False))], dtype=np.float32)
+        sub_dim = sample.shape[1] // self.pq_subvectors
+        centroids_count = min(self.pq_centroids, sample_size)
+        codebooks = np.empty((self.pq_subvectors, centroids_count, sub_dim), dtype=np.float32)
+
+        for s in range(self.pq_subvectors):
+            sub_sample = np.ascontiguousarray(sample[:, s * sub_dim:(s + 1) * sub_dim])
+            centroids = sub_sample[rng.choice(sample_size, centroids_count, replace=False)].copy()
+            for _ in range(self.train_iterations):
+                labels = self._assign(sub_sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sub_sample)
+                counts = np.bincount(labels, minlength=centroids_count)
+                # Re-seed empty centroids with random sample points so every code is used
+                empty = counts == 0
+                centroids[~empty] = sums[~empty] / counts[~empty, None]
+                centroids[empty] = sub_sample[rng.choice(sample_size, int(empty.sum()))]
+            codebooks[s] = centroids
+        return codebooks
+
+    @staticmethod
+    def _assign(points : np.ndarray, centroids : np.ndarray) -> np.ndarray:
+        """
+        :return: Index of the closest centroid of every point
+        """
+        # The point norm is constant per row so it does not change the assignment
+        scores = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2.0 * (points @ centroids.T)
+        return np.argmin(scores, axis=1)
+
+
+INDEX_KINDS = ("exact", "ivf") + QUANTIZATION_MODES
+
+
+def make_index(kind : str = "exact") -> Any:
+    """
+    :param kind: "exact", "ivf" or a quantization mode of QuantizedIndex ("int8", "pq")
+    :return: New candidate index for a GalleryMatcher
+    """
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "ivf":
+        return IVFIndex()
+    if kind in QUANTIZATION_MODES:
+        return QuantizedIndex(kind)
+    raise ValueError(f"Unknown gallery index {kind}, expected exact, ivf or one of {QUANTIZATION_MODES}")
+
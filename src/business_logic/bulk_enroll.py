@@ -0,0 +1,321 @@
+"""
+Bulk enrollment of known faces from image files.
+
+The images are encoded across a process pool, duplicates are found with blocked pairwise distances
+(within the imported set and against the gallery) and the gallery is written once at the end,
+as one new generation of the GalleryStore.
+"""
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import multiprocessing
+import os
+import time
+import numpy as np
+from config import setup_logger
+from src.business_logic.host_profile import DEFAULT_PROFILE, DetectionProfile
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+ENCODING_SIZE = 128
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+# Outcome of one image
+ADDED = "added"
+NO_FACE = "no_face"
+UNREADABLE = "unreadable"
+DUPLICATE_IN_IMPORT = "duplicate_in_import"
+DUPLICATE_OF_GALLERY = "duplicate_of_gallery"
+
+
+class EnrollmentEntry(NamedTuple):
+    """
+    One image to enroll
+
+    :param path: Image file path
+    :param name: Name of the person on the image
+    """
+    path: str
+    name: str
+
+
+def read_entries(source : str) -> List[EnrollmentEntry]:
+    """
+    Read the images to enroll from a directory or a CSV file
+
+    Directory: images in a sub-directory are named after it (people/Jane Doe/1.jpg -> "Jane Doe"),
+    images at the top level are named after the file (people/Jane_Doe.jpg -> "Jane_Doe").
+    CSV: one "path,name" row per image (optional header), relative paths are relative to the CSV file.
+
+    :param source: Directory or CSV file path
+    :return: List of EnrollmentEntry in a stable order
+    """
+    entries = []
+    if os.path.isdir(source):
+        for root, directories, names in os.walk(source):
+            directories.sort()
+            for file_name in sorted(names):
+                if os.path.splitext(file_name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                path = os.path.join(root, file_name)
+                name = os.path.basename(root) if os.path.abspath(root) != os.path.abspath(source) else os.path.splitext(file_name)[0]
+                entries.append(EnrollmentEntry(path, name))
+        return entries
+
+    base_directory = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8", newline="") as f:
+        for row_number, row in enumerate(csv.reader(f)):
+            if not row or not row[0].strip():
+                continue
+            if row_number == 0 and [value.strip().lower() for value in row[:2]] == ["path", "name"]:
+                continue
+            if len(row) < 2 or not row[1].strip():
+                logger.error(f"{source}:{row_number + 1}: expected 'path,name', skipping {row}")
+                continue
+            path = row[0].strip()
+            entries.append(EnrollmentEntry(path if os.path.isabs(path) else os.path.join(base_directory, path), row[1].strip()))
+    return entries
+
+
+def _init_worker() -> None:
+    """Load the face_recognition models once per worker process"""
+    import face_recognition
+    face_recognition.face_encodings(np.zeros((64, 64, 3), dtype=np.uint8), [(8, 56, 56, 8)])
+
+
+def encode_image(path : str, max_side : int = 1024, profile : DetectionProfile = DEFAULT_PROFILE) -> Tuple[Optional[np.ndarray], str, int]:
+    """
+    Encode the face of an enrollment image, the largest face if there are several
+
+    :param path: Image file path
+    :param max_side: Images are downscaled so their longest side is at most max_side before detection
+    :param profile: Detector and encoder settings (its scale is not used, max_side sets the image size)
+    :return: Tuple (128-d float32 encoding or None, outcome, number of detected faces)
+    """
+    import cv2
+
+    image = cv2.imread(path)
+    if image is None:
+        return None, UNREADABLE, 0
+
+    scale = max_side / max(image.shape[:2])
+    if scale < 1.0:
+        image = cv2.resize(image, (0, 0), fx=scale, fy=scale)
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    locations = profile.detect(rgb_image)
+    if not locations:
+        return None, NO_FACE, 0
+
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    encoding = profile.encode(rgb_image, [largest])[0]
+    return np.asarray(encoding, dtype=np.float32), ADDED, len(locations)
+
+
+def encode_images(paths : Sequence[str], workers : Optional[int] = None, max_side : int = 1024, progress : Optional[Callable[[int, int], None]] = None, chunksize : int = 4, profile : DetectionProfile = DEFAULT_PROFILE) -> List[Tuple[Optional[np.ndarray], str, int]]:
+    """
+    Encode enrollment images across a process pool
+
+    :param paths: Image file paths
+    :param workers: Number of worker processes (None = number of CPUs, 0 = encode in this process)
+    :param max_side: Longest image side used for detection
+    :param progress: Optional callback(done, total) called after every image
+    :param chunksize: Images sent to a worker at once
+    :param profile: Detector and encoder settings
+    :return: List of encode_image results, in the order of paths
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    results = []
+
+    if workers == 0 or len(paths) <= 1:
+        for path in paths:
+            results.append(encode_image(path, max_side, profile))
+            if progress is not None:
+                progress(len(results), len(paths))
+        return results
+
+    # spawn: same behaviour on every platform, the models are loaded once per worker by the initializer
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker) as executor:
+        for result in executor.map(encode_image, paths, [max_side] * len(paths), [profile] * len(paths), chunksize=chunksize):
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(paths))
+    return results
+
+
+def nearest_neighbours(queries : Any, references : Any, block_size : int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest reference of every query, computed block by block so at most block_size x block_size
+    distances are held in memory at once
+
+    :param queries: (M, 128) encodings
+    :param references: (N, 128) encodings
+    :param block_size: Rows and columns of one block of the distance matrix
+    :return: Tuple (indices, distances) of the nearest reference per query, -1 / inf when there is no candidate
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    references = np.ascontiguousarray(references, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    query_norms = np.einsum("ij,ij->i", queries, queries)
+    reference_norms = np.einsum("ij,ij->i", references, references)
+
+    best_indices = np.full(len(queries), -1, dtype=np.int64)
+    best_squared = np.full(len(queries), np.inf, dtype=np.float32)
+
+    for query_start in range(0, len(queries), block_size):
+        query_block = queries[query_start:query_start + block_size]
+        query_rows = np.arange(query_start, query_start + len(query_block))
+
+        for reference_start in range(0, len(references), block_size):
+            reference_block = references[reference_start:reference_start + block_size]
+
+            # ||q - r||^2 = ||q||^2 + ||r||^2 - 2 q.r  -> one GEMM per block
+            squared = query_norms[query_start:query_start + len(query_block), None] + reference_norms[None, reference_start:reference_start + len(reference_block)] - 2.0 * (query_block @ reference_block.T)
+
+            nearest = np.argmin(squared, axis=1)
+            nearest_squared = squared[np.arange(len(query_block)), nearest]
+            better = nearest_squared < best_squared[query_rows]
+            best_squared[query_rows[better]] = nearest_squared[better]
+            best_indices[query_rows[better]] = nearest[better] + reference_start
+
+    # Rounding can make the squared distance of identical vectors slightly negative
+    return best_indices, np.sqrt(np.maximum(best_squared, 0.0))
+
+
+def import_conflicts(encodings : Any, names : Sequence[str], rejected : np.ndarray, tolerance : float, block_size : int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Walk the import set in order and find the rows within tolerance of an earlier kept row of another name.
+    Only kept rows count: a refused row can not make a later one a duplicate, and a row of the same name
+    is one more template of the person, it does not hide a conflict with another name.
+
+    :param encodings: (M, 128) encodings of the import set
+    :param names: Name of every row
+    :param rejected: (M,) bool mask of the rows already refused (duplicates of the gallery), never kept
+    :param tolerance: Distance under which two faces of different names are duplicates
+    :param block_size: Rows and columns of one block of the distance matrix
+    :return: Tuple (indices, distances) of the closest conflicting kept row per row, -1 / inf for a kept or rejected row
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    ids = {}
+    name_ids = np.array([ids.setdefault(name, len(ids)) for name in names], dtype=np.int64)
+    norms = np.einsum("ij,ij->i", encodings, encodings)
+
+    kept = np.zeros(len(encodings), dtype=bool)
+    conflicts = np.full(len(encodings), -1, dtype=np.int64)
+    conflict_squared = np.full(len(encodings), np.inf, dtype=np.float32)
+
+    for start in range(0, len(encodings), block_size):
+        rows = np.arange(start, min(start + block_size, len(encodings)))
+        block = encodings[rows]
+
+        # Kept rows of the previous blocks, one GEMM per block of them
+        kept_rows = np.flatnonzero(kept[:start])
+        for kept_start in range(0, len(kept_rows), block_size):
+            columns = kept_rows[kept_start:kept_start + block_size]
+            squared = norms[rows, None] + norms[None, columns] - 2.0 * (block @ encodings[columns].T)
+            squared[name_ids[rows, None] == name_ids[None, columns]] = np.inf
+            nearest = np.argmin(squared, axis=1)
+            nearest_squared = squared[np.arange(len(rows)), nearest]
+            closer = nearest_squared < conflict_squared[rows]
+            conflict_squared[rows[closer]] = nearest_squared[closer]
+            conflicts[rows[closer]] = columns[nearest[closer]]
+
+        # Within the block the kept rows are decided one after the other
+        squared = norms[rows, None] + norms[None, rows] - 2.0 * (block @ block.T)
+        squared[name_ids[rows, None] == name_ids[None, rows]] = np.inf
+        for j, row in enumerate(rows):
+            if rejected[row]:
+                continue
+            earlier = np.flatnonzero(kept[start:row])
+            if len(earlier):
+                nearest = earlier[np.argmin(squared[j, earlier])]
+                if squared[j, nearest] < conflict_squared[row]:
+                    conflict_squared[row] = squared[j, nearest]
+                    conflicts[row] = rows[nearest]
+            kept[row] = not np.sqrt(max(conflict_squared[row], 0.0)) <= tolerance
+
+    conflicts[kept | rejected] = -1
+    conflict_squared[kept | rejected] = np.inf
+    # Rounding can make the squared distance of identical vectors slightly negative
+    return conflicts, np.sqrt(np.maximum(conflict_squared, 0.0))
+
+
+def bulk_enroll(face_adder : Any, entries : Sequence[EnrollmentEntry], workers : Optional[int] = None, max_side : int = 1024, block_size : int = 1024, progress : Optional[Callable[[int, int], None]] = None, dry_run : bool = False) -> dict:
+    """
+    Encode, deduplicate and add a set of images to the gallery of a FaceAdder in one commit
+
+    :param face_adder: FaceAdder owning the gallery, the duplicate tolerance and the detector and encoder profile
+    :param entries: Images to enroll
+    :param workers: Number of encoding processes (None = number of CPUs, 0 = encode in this process)
+    :param max_side: Longest image side used for detection
+    :param block_size: Block size of the pairwise distance computation
+    :param progress: Optional callback(done, total) called after every encoded image
+    :param dry_run: Report what would be added without writing the gallery
+    :return: Report dict with the counters, the throughput and the outcome of every image
+    """
+    start = time.perf_counter()
+
+    with metrics.time_stage("bulk_encode"):
+        results = encode_images([entry.path for entry in entries], workers, max_side, progress, profile=face_adder.profile)
+    encode_seconds = time.perf_counter() - start
+
+    outcomes = [result[1] for result in results]
+    details = [None] * len(entries)
+    encoded_rows = [i for i, result in enumerate(results) if result[0] is not None]
+    encodings = np.array([results[i][0] for i in encoded_rows], dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+    # Duplicates against the gallery and within the import set, blocked batches.
+    # A face close to another template of the same name is one more template of that person, not a duplicate
+    gallery = face_adder.gallery.snapshot
+    names = [entries[i].name for i in encoded_rows]
+    with metrics.time_stage("bulk_duplicate_check"):
+        if len(gallery) and len(encodings):
+            gallery_nearest, gallery_distances = nearest_neighbours(encodings, gallery.encodings, block_size)
+        else:
+            gallery_nearest, gallery_distances = np.full(len(encodings), -1), np.full(len(encodings), np.inf)
+        gallery_duplicates = np.array([
+            distance <= face_adder.tolerance and gallery.names[nearest] != name
+            for nearest, distance, name in zip(gallery_nearest, gallery_distances, names)
+        ], dtype=bool)
+        import_nearest, import_distances = import_conflicts(encodings, names, gallery_duplicates, face_adder.tolerance, block_size)
+
+    kept = []
+    for row, i in enumerate(encoded_rows):
+        if gallery_duplicates[row]:
+            outcomes[i] = DUPLICATE_OF_GALLERY
+            details[i] = f"{gallery.names[gallery_nearest[row]]} ({gallery_distances[row]:.3f})"
+        elif import_nearest[row] >= 0:
+            outcomes[i] = DUPLICATE_IN_IMPORT
+            details[i] = f"{entries[encoded_rows[import_nearest[row]]].path} ({import_distances[row]:.3f})"
+        else:
+            kept.append(row)
+
+    new_encodings = encodings[kept]
+    new_names = [names[row] for row in kept]
+
+    # One commit: the whole gallery is written as a new generation and published as one snapshot
+    if len(new_names) and not dry_run:
+        with metrics.time_stage("bulk_commit"):
+            face_adder.gallery.add_many(new_encodings, new_names)
+
+    seconds = time.perf_counter() - start
+    report = {
+        "images": len(entries),
+        "added": len(new_names),
+        "no_face": outcomes.count(NO_FACE),
+        "unreadable": outcomes.count(UNREADABLE),
+        "duplicate_in_import": outcomes.count(DUPLICATE_IN_IMPORT),
+        "duplicate_of_gallery": outcomes.count(DUPLICATE_OF_GALLERY),
+        "multiple_faces": sum(1 for result in results if result[2] > 1),
+        "gallery_size": face_adder.gallery.count(),
+        "dry_run": dry_run,
+        "seconds": round(seconds, 2),
+        "encode_seconds": round(encode_seconds, 2),
+        "images_per_second": round(len(entries) / encode_seconds, 2) if encode_seconds else 0.0,
+        "items": [
+            {"path": entry.path, "name": entry.name, "outcome": outcome, "detail": detail}
+            for entry, outcome, detail in zip(entries, outcomes, details)
+        ]
+    }
+    logger.info(f"Bulk enrollment: {report['added']} of {report['images']} images added in {report['seconds']}s ({report['images_per_second']} images/s)")
+    return report
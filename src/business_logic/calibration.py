@@ -0,0 +1,154 @@
+"""
+Calibration of the host profile: every candidate DetectionProfile recognizes a small labeled sample and the
+fastest one reaching the recall target without exceeding the false-match rate is kept.
+
+Sample: the directory / CSV layout of bulk enrollment, ideally with two images or more per person. The first image
+of a person is enrolled, the others are recognized against these references with the profile being measured,
+so the recall accounts for both the detector (a missed face is not recognized) and the encoding settings.
+With one image per person the recall falls back to the detection rate. The images stand for camera frames:
+they are resized to frame_side (longest side), then downscaled by the profile scale like in the live recognizer.
+"""
+from typing import Callable, List, Optional, Sequence, Tuple
+import time
+import numpy as np
+from config import setup_logger
+from src.business_logic.bulk_enroll import EnrollmentEntry
+from src.business_logic.host_profile import DetectionProfile
+
+logger = setup_logger(__name__)
+
+
+def load_sample(entries : Sequence[EnrollmentEntry], frame_side : int = 1280) -> List[Tuple[str, np.ndarray]]:
+    """
+    Read the sample images once for all the profiles
+
+    :param entries: Labeled images
+    :param frame_side: Longest side the images are resized to, the side of the camera frames
+    :return: List of (name, BGR image), unreadable images are skipped
+    """
+    import cv2
+
+    sample = []
+    for entry in entries:
+        image = cv2.imread(entry.path)
+        if image is None:
+            logger.error(f"Unreadable calibration image {entry.path}, skipping it")
+            continue
+        factor = frame_side / max(image.shape[:2])
+        sample.append((entry.name, cv2.resize(image, (0, 0), fx=factor, fy=factor)))
+    return sample
+
+
+def measure_profile(profile : DetectionProfile, sample : Sequence[Tuple[str, np.ndarray]], tolerance : float = 0.6) -> dict:
+    """
+    Time and score one profile on the sample
+
+    :param profile: Profile to measure
+    :param sample: List of (name, BGR image) from load_sample
+    :param tolerance: Distance under which a face matches a reference, the one of the live matcher
+    :return: Dict with the profile settings, the seconds per image, the detection rate, the recall, the false matches and their rate
+    """
+    import cv2
+
+    def process(frame):
+        small = cv2.resize(frame, (0, 0), fx=profile.scale, fy=profile.scale) if profile.scale != 1.0 else frame
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        locations = profile.detect(rgb)
+        if not locations:
+            return None
+        largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+        return np.asarray(profile.encode(rgb, [largest])[0], dtype=np.float32)
+
+    # The first call loads the models (the cnn detector takes seconds), it is not part of the measure
+    process(sample[0][1])
+
+    seconds, encodings = [], []
+    for _, frame in sample:
+        start = time.perf_counter()
+        encodings.append(process(frame))
+        seconds.append(time.perf_counter() - start)
+
+    # The first image of each person is the reference, the others are the queries
+    reference_rows = {}
+    for row, (name, _) in enumerate(sample):
+        reference_rows.setdefault(name, row)
+    queries = [row for row in range(len(sample)) if reference_rows[sample[row][0]] != row]
+    references = [row for row in reference_rows.values() if encodings[row] is not None]
+
+    correct = false_matches = 0
+    if queries and references:
+        gallery = np.stack([encodings[row] for row in references])
+        for row in queries:
+            if encodings[row] is None:
+                continue
+            distances = np.linalg.norm(gallery - encodings[row], axis=1)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= tolerance:
+                if sample[references[nearest]][0] == sample[row][0]:
+                    correct += 1
+                else:
+                    false_matches += 1
+
+    detected = sum(encoding is not None for encoding in encodings)
+    return {
+        "profile": profile.name,
+        **profile._asdict(),
+        "seconds_per_image": float(np.mean(seconds)),
+        "p95_ms": round(1000 * float(np.percentile(seconds, 95)), 2),
+        "detection_rate": detected / len(sample),
+        "recall": correct / len(queries) if queries else detected / len(sample),
+        "false_matches": false_matches,
+        "false_match_rate": false_matches / len(queries) if queries else 0.0
+    }
+
+
+def calibrate(entries : Sequence[EnrollmentEntry], profiles : Sequence[DetectionProfile], recall_target : float = 0.95, tolerance : float = 0.6, frame_side : int = 1280, progress : Optional[Callable[[int, int, dict], None]] = None, max_false_match_rate : float = 0.01) -> Tuple[Optional[DetectionProfile], dict]:
+    """
+    Benchmark the candidate profiles on a labeled sample and pick the fastest one reaching the recall target
+    with at most max_false_match_rate of the queries matched to the wrong person
+
+    :param entries: Labeled sample images
+    :param profiles: Candidate profiles (see host_profile.candidate_profiles)
+    :param recall_target: Smallest acceptable recall
+    :param tolerance: Matching tolerance of the live recognizer
+    :param frame_side: Longest side of the camera frames the sample stands for
+    :param progress: Optional callback(done, total, result) called after every profile
+    :param max_false_match_rate: Largest acceptable share of queries matched to another person
+    :return: Tuple (chosen profile, report dict), the profile with the best recall among the ones within the
+             false-match rate (then fewest false matches) when none is eligible, None if the sample is empty
+    """
+    sample = load_sample(entries, frame_side)
+    report = {
+        "recall_target": recall_target,
+        "max_false_match_rate": max_false_match_rate,
+        "tolerance": tolerance,
+        "frame_side": frame_side,
+        "images": len(sample),
+        "identities": len({name for name, _ in sample}),
+        "results": []
+    }
+    if not sample:
+        return None, report
+    if report["identities"] == len(sample):
+        logger.warning("One calibration image per person: the recall is the detection rate, the encoding settings are not scored")
+
+    results = []
+    for profile in profiles:
+        result = measure_profile(profile, sample, tolerance)
+        results.append((profile, result))
+        report["results"].append(result)
+        if progress is not None:
+            progress(len(results), len(profiles), result)
+
+    # A profile that recognizes more faces by also matching strangers to enrolled people is not acceptable
+    eligible = [(profile, result) for profile, result in results if result["recall"] >= recall_target and result["false_match_rate"] <= max_false_match_rate]
+    if eligible:
+        chosen, result = min(eligible, key=lambda item: (item[1]["seconds_per_image"], item[1]["false_match_rate"]))
+    else:
+        chosen, result = max(results, key=lambda item: (item[1]["false_match_rate"] <= max_false_match_rate, item[1]["recall"], -item[1]["false_match_rate"], -item[1]["seconds_per_image"]))
+        logger.warning(f"No profile reaches a recall of {recall_target} with a false-match rate of at most {max_false_match_rate}, keeping the most accurate one ({chosen.name}, recall {result['recall']:.3f}, false-match rate {result['false_match_rate']:.3f})")
+
+    report["chosen"] = chosen.name
+    report["met_target"] = bool(eligible)
+    logger.info(f"Calibration chose {chosen.name}: {1000 * result['seconds_per_image']:.1f} ms per image, recall {result['recall']:.3f}, false-match rate {result['false_match_rate']:.3f}")
+    return chosen, report
@@ -0,0 +1,278 @@
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from config import setup_logger
+from src.utils.latest_slot import LatestSlot
+from src.utils.frame_buffers import FrameBuffers
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class RateMeter:
+    def __init__(self, smoothing : float = 0.9):
+        """
+        Exponentially smoothed events per second
+
+        :param smoothing: Weight of the previous estimate (0 = no smoothing)
+        """
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self.count = 0
+        self._last_time = None
+
+    def tick(self) -> None:
+        now = time.monotonic()
+        if self._last_time is not None and now > self._last_time:
+            instant_rate = 1.0 / (now - self._last_time)
+            self.rate = instant_rate if self.count <= 1 else self.smoothing * self.rate + (1 - self.smoothing) * instant_rate
+        self._last_time = now
+        self.count += 1
+
+
+def source_key(uri : Any) -> Any:
+    """
+    :param uri: USB camera index ("0", 1...), stream URL or video file path
+    :return: The uri as opened by cv2.VideoCapture: camera indices as int, anything else unchanged
+    """
+    return int(uri) if str(uri).isdigit() else uri
+
+
+class CameraSource:
+    def __init__(self, uri : Any, name : Optional[str] = None, priority : float = 1.0, condition : Optional[threading.Condition] = None, tracker : Optional[Any] = None, motion_gate : Optional[Any] = None):
+        """
+        Initialize CameraSource: one video stream with its own capture thread
+
+        :param uri: USB camera index ("0", 1...), stream URL (rtsp://, http://...) or video file path
+        :param name: Display name of the source (default: the uri)
+        :param priority: Share of the inference budget relative to the other sources (higher = more inferences)
+        :param condition: Condition shared by the slots of all the sources so the scheduler can wait for any of them
+        :param tracker: Optional face tracker of the stream, caches identities between frames
+        :param motion_gate: Optional motion gate of the stream, skips or restricts detection on static scenes
+        """
+        self.uri = source_key(uri)
+        self.name = name or str(uri)
+        self.priority = priority
+        self.tracker = tracker
+        self.motion_gate = motion_gate
+        self.is_file = isinstance(self.uri, str) and os.path.isfile(self.uri)
+
+        self.frame_slot = LatestSlot(f"{self.name} inference", condition)
+        self.render_slot = LatestSlot(f"{self.name} render", condition)
+        self.overlay_slot = LatestSlot(f"{self.name} overlay")
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.display_rate = RateMeter()
+
+        # Reusable preprocessing buffers, one set per consuming stage since they run in different threads
+        self.inference_buffers = FrameBuffers()
+        self.display_buffers = FrameBuffers()
+
+        # Latest captured frame and its number, for the consumers that sample the stream (enrollment)
+        # without taking frames from the inference and render slots
+        self.frame_count = 0
+        self._latest_frame = None
+        self._frame_ready = threading.Condition()
+
+        # Scheduler state
+        self.virtual_time = 0.0
+        self.min_interval = 0.0
+        self.last_inference_time = 0.0
+        self.last_inference_frame = 0
+        self.stride = 1
+        self.in_inference = False
+        self.controller = None
+
+        self.opened = threading.Event()
+        self.error = None
+        self._thread = None
+
+    def start(self, stop_flag : threading.Event) -> None:
+        self._thread = threading.Thread(target=self.capture_loop, args=(stop_flag,), daemon=True)
+        self._thread.start()
+
+    def join(self, timeout : Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def capture_loop(self, stop_flag : threading.Event) -> None:
+        """Capture thread: read frames as fast as the source delivers them and publish the latest one"""
+        cap = cv2.VideoCapture(self.uri)
+        if not cap.isOpened():
+            self.error = "Unable to access the camera"
+            self.opened.set()
+            return
+        self.opened.set()
+
+        # Video files are paced at their native rate so they behave like a live stream
+        frame_interval = 0.0
+        if self.is_file:
+            file_fps = cap.get(cv2.CAP_PROP_FPS)
+            frame_interval = 1.0 / file_fps if file_fps and file_fps > 0 else 1.0 / 30
+        next_frame_time = time.monotonic()
+
+        try:
+            while not stop_flag.is_set():
+                read_start = time.perf_counter()
+                ret, frame = cap.read()
+                metrics.observe_stage("capture_read", time.perf_counter() - read_start)
+                if not ret:
+                    self.error = "End of stream" if self.is_file else "Failed to read frame"
+                    break
+
+                self.capture_rate.tick()
+                # Both stages only read the captured frame: inference downscales it and render
+                # draws on its own display-size buffer, so no copy is needed
+                self.frame_slot.put(frame)
+                self.render_slot.put(frame)
+                with self._frame_ready:
+                    self._latest_frame = frame
+                    self.frame_count += 1
+                    self._frame_ready.notify_all()
+
+                if frame_interval:
+                    next_frame_time += frame_interval
+                    delay = next_frame_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_frame_time = time.monotonic()
+        finally:
+            cap.release()
+            # Wake up the frame samplers so they notice the end of the stream
+            with self._frame_ready:
+                self._frame_ready.notify_all()
+
+    def next_frame(self, after : int, timeout : float) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Wait for a frame captured after a given frame number, without consuming it
+
+        :param after: Number of the last frame the caller has seen (0 = any frame)
+        :param timeout: Maximum seconds to wait
+        :return: Tuple (frame number, frame), the frame is None if no new frame arrived before the timeout
+        """
+        with self._frame_ready:
+            self._frame_ready.wait_for(lambda: self.frame_count > after or not self.is_alive, timeout)
+            if self.frame_count > after:
+                return self.frame_count, self._latest_frame
+            return self.frame_count, None
+
+    def burst(self, count : int, timeout : float, skip_frames : int = 0) -> List[np.ndarray]:
+        """
+        Sample consecutive new frames of the running stream
+
+        :param count: Number of frames to collect
+        :param timeout: Maximum seconds for the whole burst
+        :param skip_frames: Frames to let pass since the camera opened (the first frames of a camera are often underexposed)
+        :return: List of frames, shorter than count if the stream ended or the timeout elapsed
+        """
+        deadline = time.monotonic() + timeout
+        frames = []
+        last = max(self.frame_count, skip_frames)
+        while len(frames) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            last, frame = self.next_frame(last, remaining)
+            if frame is None:
+                if not self.is_alive:
+                    break
+                continue
+            frames.append(frame)
+        return frames
+
+    @property
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> dict:
+        return {
+            "capture_fps": round(self.capture_rate.rate, 2),
+            "inference_fps": round(self.inference_rate.rate, 2),
+            "display_fps": round(self.display_rate.rate, 2),
+            "min_interval": round(self.min_interval, 3),
+            "error": self.error,
+            "motion": self.motion_gate.stats() if self.motion_gate is not None else None,
+            "inference": self.frame_slot.stats(),
+            "render": self.render_slot.stats()
+        }
+
+
+class CameraSessionManager:
+    def __init__(self):
+        """
+        Initialize CameraSessionManager: opens each camera once and shares its CameraSource between the
+        users of the stream (live recognition loop, enrollment...). A source is reference counted and its
+        capture thread is stopped when its last user releases it, so enrollment samples the running
+        stream instead of paying for a camera open / close and the underexposed first frames.
+        """
+        # Condition shared by the slots of all the sources so one scheduler can wait for any of them
+        self.condition = threading.Condition()
+        self._lock = threading.Lock()
+        self._sessions : Dict[Any, list] = {}  # source key -> [source, stop flag, users]
+
+    def acquire(self, uri : Any, name : Optional[str] = None) -> CameraSource:
+        """
+        Get the running source of a uri, opening it if nobody uses it. Does not wait for the camera
+        to open: wait on source.opened and check source.error. Every acquire must be paired with a release.
+
+        :param uri: USB camera index ("0", 1...), stream URL or video file path
+        :param name: Display name of the source if it has to be opened (default: the uri)
+        :return: CameraSource
+        """
+        key = source_key(uri)
+        with self._lock:
+            session = self._sessions.get(key)
+            # A stream that ended (file, camera unplugged) is opened again
+            if session is not None and (session[0].is_alive or not session[0].opened.is_set()):
+                session[2] += 1
+                return session[0]
+
+            source = CameraSource(uri, name=name, condition=self.condition)
+            stop_flag = threading.Event()
+            source.start(stop_flag)
+            self._sessions[key] = [source, stop_flag, 1]
+            logger.info(f"Camera session '{source.name}' opened")
+            return source
+
+    def release(self, source : CameraSource, timeout : float = 1.0) -> None:
+        """
+        Give back a source obtained with acquire, its capture thread stops with the last user
+
+        :param source: Source to release
+        :param timeout: Seconds to wait for the capture thread to end
+        """
+        with self._lock:
+            session = self._sessions.get(source.uri)
+            if session is None or session[0] is not source:
+                # Already replaced by a reopened stream: it only has to be stopped
+                return
+            session[2] -= 1
+            if session[2] > 0:
+                return
+            del self._sessions[source.uri]
+            session[1].set()
+        source.join(timeout=timeout)
+        logger.info(f"Camera session '{source.name}' closed")
+
+    def get(self, uri : Any) -> Optional[CameraSource]:
+        """
+        :param uri: USB camera index, stream URL or video file path
+        :return: The running source of the uri, None if nobody uses it
+        """
+        with self._lock:
+            session = self._sessions.get(source_key(uri))
+            return session[0] if session is not None and session[0].is_alive else None
+
+    def close(self) -> None:
+        """Stop every source, whoever still uses it"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for source, stop_flag, users in sessions:
+            stop_flag.set()
+        for source, stop_flag, users in sessions:
+            source.join(timeout=1.0)
@@ -0,0 +1,236 @@
+"""
+Durable audit log of the recognitions: who was seen, when and on which camera.
+
+The camera threads only put events in a bounded queue, a writer thread inserts them in batches
+(one transaction per batch) into a SQLite database in WAL mode, so the readers (history view,
+reports) never block the writer and a recognition never waits for the disk.
+"""
+from typing import Any, List, Optional, Sequence
+from collections import deque
+from queue import Queue, Empty, Full
+import sqlite3
+import threading
+import time
+from config import setup_logger
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    camera TEXT NOT NULL,
+    name TEXT NOT NULL,
+    distance REAL,
+    track_id INTEGER NOT NULL DEFAULT -1,
+    top INTEGER, right INTEGER, bottom INTEGER, left INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_name_time ON events (name, timestamp);
+CREATE INDEX IF NOT EXISTS events_camera_time ON events (camera, timestamp);
+CREATE INDEX IF NOT EXISTS events_time ON events (timestamp);
+"""
+
+INSERT = "INSERT INTO events (timestamp, camera, name, distance, track_id, top, right, bottom, left) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+COLUMNS = ("id", "timestamp", "camera", "name", "distance", "track_id", "top", "right", "bottom", "left")
+
+
+def connect(path : str) -> sqlite3.Connection:
+    """
+    Open the event database, creating the table and its indexes if needed
+
+    :param path: SQLite database file
+    :return: Connection in WAL mode
+    """
+    connection = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    # WAL: readers see the last committed batch while the writer appends the next one.
+    # synchronous=NORMAL: a commit is a WAL append without fsync, the WAL is synced at checkpoints
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class EventLog:
+    def __init__(self, path : str = "recognition_events.db", batch_size : int = 512, flush_interval : float = 0.5, max_queue : int = 10000, block_timeout : float = 0.0):
+        """
+        Initialize EventLog: recognition events are queued by the callers and inserted in batches by a writer thread
+
+        :param path: SQLite database file
+        :param batch_size: Maximum number of events inserted in one transaction
+        :param flush_interval: Seconds the writer waits for a batch to fill before committing it
+        :param max_queue: Maximum number of events waiting for the writer
+        :param block_timeout: Seconds a caller waits for room in a full queue (back-pressure), 0 = drop the event at once
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.queue = Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._batches = deque(maxlen=64)  # (commit time, events) of the last batches, for the write rate
+        self._thread = None
+        self._reader = None
+        self._reader_lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        connection = connect(self.path)
+        self._thread = threading.Thread(target=self._writer, args=(connection,), daemon=True)
+        self._thread.start()
+
+    def record(self, camera : str, recognition : Any, timestamp : Optional[float] = None) -> bool:
+        """
+        Queue one recognition event, never blocks longer than block_timeout
+
+        :param camera: Name of the camera the face was seen on
+        :param recognition: Recognition (location, name, distance, track_id)
+        :param timestamp: Unix time of the frame (default: now)
+        :return: False if the event was dropped because the queue is full
+        """
+        top, right, bottom, left = (int(value) for value in recognition.location)
+        distance = None if recognition.distance == float("inf") else float(recognition.distance)
+        event = (time.time() if timestamp is None else timestamp, str(camera), recognition.name, distance, int(recognition.track_id), top, right, bottom, left)
+        try:
+            if self.block_timeout > 0:
+                self.queue.put(event, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(event)
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def query(self, name : Optional[str] = None, camera : Optional[str] = None, since : Optional[float] = None, until : Optional[float] = None, limit : int = 200) -> List[dict]:
+        """
+        Events of a name and / or a camera in a time range, most recent first (served by the indexes)
+
+        :param name: Exact name, None for every name
+        :param camera: Camera name, None for every camera
+        :param since: Oldest unix time (inclusive)
+        :param until: Newest unix time (exclusive)
+        :param limit: Maximum number of events returned
+        :return: List of event dicts
+        """
+        conditions, parameters = [], []
+        for column, operator, value in (("name", "=", name), ("camera", "=", camera), ("timestamp", ">=", since), ("timestamp", "<", until)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._read(f"SELECT {', '.join(COLUMNS)} FROM events {where} ORDER BY timestamp DESC LIMIT ?", parameters + [limit])
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def name_counts(self, since : Optional[float] = None, until : Optional[float] = None, limit : int = 50) -> List[tuple]:
+        """
+        Number of events and last sighting per name in a time range
+
+        :return: List of (name, events, last timestamp), most seen first
+        """
+        rows = self._read(
+            "SELECT name, COUNT(*), MAX(timestamp) FROM events WHERE timestamp >= ? AND timestamp < ? GROUP BY name ORDER BY COUNT(*) DESC LIMIT ?",
+            [since if since is not None else float("-inf"), until if until is not None else float("inf"), limit]
+        )
+        return [tuple(row) for row in rows]
+
+    def events_per_second(self) -> float:
+        """
+        :return: Insert throughput of the writer over its last batches (0 when idle for more than 10 seconds)
+        """
+        batches = list(self._batches)
+        if not batches or time.monotonic() - batches[-1][0] > 10.0:
+            return 0.0
+        if len(batches) == 1:
+            return batches[0][1] / max(self.flush_interval, 1e-3)
+        seconds = batches[-1][0] - batches[0][0]
+        return sum(events for _, events in batches[1:]) / seconds if seconds > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queue_depth": self.queue.qsize(),
+            "events_per_second": round(self.events_per_second(), 1)
+        }
+
+    def publish_metrics(self) -> None:
+        metrics.set_gauge("event_log_written", self.written)
+        metrics.set_gauge("event_log_dropped", self.dropped)
+        metrics.set_gauge("event_log_queue_depth", self.queue.qsize())
+        metrics.set_gauge("event_log_events_per_second", self.events_per_second())
+
+    def flush(self, timeout : float = 5.0) -> bool:
+        """
+        Wait until every queued event is committed
+
+        :return: False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout : float = 5.0) -> None:
+        """
+        Commit the queued events and stop the writer
+        """
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def _read(self, sql : str, parameters : Sequence[Any]) -> list:
+        # One reader connection shared by the UI threads, WAL readers are never blocked by the writer
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = connect(self.path)
+            return self._reader.execute(sql, parameters).fetchall()
+
+    def _writer(self, connection : sqlite3.Connection) -> None:
+        """Writer thread: sleeps on the queue, then collects a batch for up to flush_interval and commits it"""
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    self.queue.task_done()
+                    return
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.0)) if time.monotonic() < deadline else self.queue.get_nowait()
+                    except Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        self.queue.task_done()
+                        break
+                    batch.append(item)
+
+                try:
+                    with metrics.time_stage("event_log_commit"):
+                        with connection:  # One transaction per batch
+                            connection.executemany(INSERT, batch)
+                    self.written += len(batch)
+                    self._batches.append((time.monotonic(), len(batch)))
+                except sqlite3.Error as e:
+                    self.failed += len(batch)
+                    logger.error(f"Failed to write {len(batch)} recognition events to {self.path}: {e}")
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+                if stop:
+                    return
+        finally:
+            connection.close()
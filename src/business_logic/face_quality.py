@@ -0,0 +1,49 @@
+from typing import Any, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+
+
+def face_quality(gray_frame : np.ndarray, location : Tuple[int, int, int, int]) -> float:
+    """
+    Cheap quality score of a detected face, used to pick the best frame of an enrollment burst:
+    sharpness (variance of the Laplacian of the face crop) x size (side of the box) x exposure
+
+    :param gray_frame: Grayscale frame
+    :param location: (top, right, bottom, left) box of the face in the frame
+    :return: Score, higher is better, 0 for an empty box
+    """
+    top, right, bottom, left = location
+    crop = gray_frame[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+    if crop.size == 0:
+        return 0.0
+
+    sharpness = float(cv2.Laplacian(crop, cv2.CV_32F).var())
+    size = float(np.sqrt(crop.shape[0] * crop.shape[1]))
+    # 1 for a mid-gray face, close to 0 for a black (underexposed) or white (overexposed) one
+    exposure = max(1.0 - abs(float(crop.mean()) - 128.0) / 128.0, 0.05)
+    return float(np.log1p(sharpness) * size * exposure)
+
+
+def best_face(frames : Sequence[np.ndarray], detect : Any, detect_scale : float = 0.5) -> Optional[Tuple[np.ndarray, Tuple[int, int, int, int], float]]:
+    """
+    Detect the faces of a burst of frames and pick the best one
+
+    :param frames: BGR frames
+    :param detect: Face detector called with a small RGB frame, returns (top, right, bottom, left) boxes (e.g. face_recognition.face_locations)
+    :param detect_scale: Downscale factor of the frames used for detection, the score is computed on the full frame
+    :return: Tuple (frame, location in full frame coordinates, score), None if no face was found
+    """
+    best = None
+    for frame in frames:
+        small_rgb = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=detect_scale, fy=detect_scale), cv2.COLOR_BGR2RGB)
+        locations = detect(small_rgb)
+        if not locations:
+            continue
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        for top, right, bottom, left in locations:
+            location = (int(top / detect_scale), int(right / detect_scale), int(bottom / detect_scale), int(left / detect_scale))
+            score = face_quality(gray, location)
+            if best is None or score > best[2]:
+                best = (frame, location, score)
+    return best
@@ -0,0 +1,154 @@
+from typing import Any, List, Tuple
+import numpy as np
+
+
+class Track:
+    def __init__(self, track_id : int, location : Tuple[int, int, int, int], frame_index : int):
+        """
+        One face followed across frames, with its cached identity
+
+        :param track_id: Unique id of the track in its tracker
+        :param location: (top, right, bottom, left) box of the face in the last frame it was seen
+        :param frame_index: Tracker frame index of the creation
+        """
+        self.track_id = track_id
+        self.location = location
+        self.name = None
+        self.distance = float("inf")
+        self.verified_frame = -1
+        self.generation = None  # Gallery generation the identity was matched against
+        self.created_frame = frame_index
+        self.missed = 0
+
+    @property
+    def has_identity(self) -> bool:
+        return self.name is not None
+
+
+def box_iou(boxes_a : np.ndarray, boxes_b : np.ndarray) -> np.ndarray:
+    """
+    Intersection over union of every box of boxes_a with every box of boxes_b
+
+    :param boxes_a: (N, 4) array of (top, right, bottom, left) boxes
+    :param boxes_b: (M, 4) array of (top, right, bottom, left) boxes
+    :return: (N, M) IoU matrix
+    """
+    top = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    right = np.minimum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    bottom = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    left = np.maximum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+
+    area_a = (boxes_a[:, 1] - boxes_a[:, 3]) * (boxes_a[:, 2] - boxes_a[:, 0])
+    area_b = (boxes_b[:, 1] - boxes_b[:, 3]) * (boxes_b[:, 2] - boxes_b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold : float = 0.3, max_centroid_shift : float = 0.6, max_missed : int = 5, reverify_interval : int = 30, low_confidence_margin : float = 0.08, low_confidence_interval : int = 5):
+        """
+        Initialize FaceTracker: IoU / centroid tracker between consecutive face_locations results.
+        Each track caches its identity, which is re-verified on a schedule, sooner when the last match was
+        close to the tolerance, so a stationary face is not encoded and matched on every frame.
+
+        :param iou_threshold: Minimum IoU between a track and a detection to associate them
+        :param max_centroid_shift: Maximum centroid shift, relative to the face size, to re-associate a detection that failed the IoU test
+        :param max_missed: Number of processed frames a track survives without detection (short re-association)
+        :param reverify_interval: Number of processed frames between two verifications of a confident identity
+        :param low_confidence_margin: A match distance within this margin of the tolerance (or above it) is a low confidence one
+        :param low_confidence_interval: Number of processed frames between two verifications of a low confidence identity
+        """
+        self.iou_threshold = iou_threshold
+        self.max_centroid_shift = max_centroid_shift
+        self.max_missed = max_missed
+        self.reverify_interval = reverify_interval
+        self.low_confidence_margin = low_confidence_margin
+        self.low_confidence_interval = low_confidence_interval
+
+        self.tracks = []
+        self.frame_index = 0
+        self._next_id = 1
+
+    def update(self, face_locations : List[Tuple[int, int, int, int]]) -> List[Track]:
+        """
+        Associate the detections of a new frame with the existing tracks
+
+        :param face_locations: (top, right, bottom, left) boxes detected in the frame
+        :return: List of tracks, one per face location in the same order
+        """
+        self.frame_index += 1
+        assigned = [None] * len(face_locations)
+        unmatched_tracks = list(range(len(self.tracks)))
+
+        if face_locations and self.tracks:
+            detections = np.asarray(face_locations, dtype=np.float64).reshape(-1, 4)
+            previous = np.asarray([track.location for track in self.tracks], dtype=np.float64)
+            iou = box_iou(previous, detections)
+
+            # Greedy association, best overlaps first
+            for track_index, detection_index in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[track_index, detection_index] < self.iou_threshold:
+                    break
+                if assigned[detection_index] is None and track_index in unmatched_tracks:
+                    assigned[detection_index] = self.tracks[track_index]
+                    unmatched_tracks.remove(track_index)
+
+            # Fast moving faces: fall back to the centroid distance relative to the face size
+            for detection_index, location in enumerate(face_locations):
+                if assigned[detection_index] is not None or not unmatched_tracks:
+                    continue
+                center, size = self._center_and_size(location)
+                shifts = [np.linalg.norm(center - self._center_and_size(self.tracks[i].location)[0]) / size for i in unmatched_tracks]
+                closest = int(np.argmin(shifts))
+                if shifts[closest] <= self.max_centroid_shift:
+                    assigned[detection_index] = self.tracks[unmatched_tracks.pop(closest)]
+
+        for track_index in unmatched_tracks:
+            self.tracks[track_index].missed += 1
+
+        for detection_index, location in enumerate(face_locations):
+            track = assigned[detection_index]
+            if track is None:
+                track = Track(self._next_id, location, self.frame_index)
+                self._next_id += 1
+                self.tracks.append(track)
+            track.location = tuple(location)
+            track.missed = 0
+            assigned[detection_index] = track
+
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+        return assigned
+
+    def needs_identity(self, track : Track, tolerance : float, generation : Any = None) -> bool:
+        """
+        Check if the face of a track has to be encoded and matched in this frame
+
+        :param track: Track returned by update
+        :param tolerance: Match tolerance of the gallery
+        :param generation: Current gallery generation, an identity matched against another one is expired
+                           (the person may have been enrolled, deleted or renamed since)
+        """
+        if not track.has_identity or (generation is not None and track.generation != generation):
+            return True
+        frames_since_verification = self.frame_index - track.verified_frame
+        if track.distance > tolerance - self.low_confidence_margin:
+            return frames_since_verification >= self.low_confidence_interval
+        return frames_since_verification >= self.reverify_interval
+
+    def set_identity(self, track : Track, name : str, distance : float, generation : Any = None) -> None:
+        track.name = name
+        track.distance = distance
+        track.verified_frame = self.frame_index
+        track.generation = generation
+
+    @property
+    def active_track_ids(self) -> List[int]:
+        return [track.track_id for track in self.tracks]
+
+    @staticmethod
+    def _center_and_size(location : Tuple[int, int, int, int]):
+        top, right, bottom, left = location
+        center = np.array([(left + right) / 2.0, (top + bottom) / 2.0])
+        size = max(right - left, bottom - top, 1)
+        return center, size
@@ -0,0 +1,197 @@
+from typing import Any, List, Optional, Sequence, Tuple
+import os
+import threading
+import numpy as np
+from config import setup_logger
+from src.business_logic.gallery_matcher import GalleryMatcher, GallerySnapshot, ENCODING_SIZE
+from src.business_logic.gallery_store import GalleryStore, migrate_pickle
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class Gallery:
+    def __init__(self, directory : str = "known_faces_gallery", data_file : str = "known_faces.pkl", matcher : Optional[GalleryMatcher] = None):
+        """
+        Initialize Gallery: owns the known faces, on disk (GalleryStore) and in memory (the snapshots of the matcher).
+        Reads (match, count, names, rows of a name) use the current snapshot without a lock, so the camera
+        threads are never blocked by a commit. Writes are serialized, also with the other processes of the
+        gallery directory (store lock), written to the store first and then published as a new snapshot.
+
+        :param directory: Directory of the binary gallery
+        :param data_file: Legacy pickle file, migrated once into the directory
+        :param matcher: Matcher holding the in-memory gallery (default: exact GalleryMatcher)
+        """
+        self.store = GalleryStore(directory)
+        self.data_file = data_file
+        self.matcher = matcher if matcher is not None else GalleryMatcher()
+        self._write_lock = threading.Lock()
+        self._file_signature = None
+
+    @property
+    def snapshot(self) -> GallerySnapshot:
+        return self.matcher.snapshot
+
+    def count(self) -> int:
+        """
+        :return: Number of templates
+        """
+        return len(self.matcher.snapshot)
+
+    def identity_count(self) -> int:
+        """
+        :return: Number of distinct names
+        """
+        return len(self.matcher.snapshot.name_rows)
+
+    def names(self) -> Tuple[str, ...]:
+        """
+        :return: Name of every template, in row order (immutable, nothing is copied)
+        """
+        return self.matcher.snapshot.names
+
+    def identities(self) -> List[str]:
+        """
+        :return: Distinct names in enrollment order
+        """
+        return self.matcher.snapshot.identities
+
+    def rows_of(self, name : str) -> np.ndarray:
+        """
+        :param name: Identity name
+        :return: Rows of the templates of the identity
+        """
+        return self.matcher.snapshot.rows_of(name)
+
+    def load(self) -> int:
+        """
+        Load the gallery from disk, migrating the legacy pickle the first time
+
+        :return: Number of templates
+        """
+        with self._write_lock:
+            count = self._load()
+        metrics.set_gauge("gallery_size", count)
+        return count
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the gallery if its files were changed by another process (bulk import, maintenance tool...),
+        a stat of the gallery directory otherwise
+
+        :return: True if the gallery was reloaded
+        """
+        with self._write_lock:
+            if not self._changed_on_disk():
+                return False
+            count = self._load()
+        metrics.set_gauge("gallery_size", count)
+        return True
+
+    def add(self, encoding : Any, name : str) -> None:
+        """
+        Add a template, the name gets one more template if it is already known
+
+        :param encoding: 128-d face encoding
+        :param name: Name of the person
+        """
+        with self._write_lock, self.store.lock():
+            self._sync()
+            with metrics.time_stage("gallery_append"):
+                self.store.append(encoding, name)
+            self.matcher.add(encoding, name)
+            self._file_signature = self._read_signature()
+        metrics.set_gauge("gallery_size", self.count())
+
+    def add_many(self, encodings : Sequence[Any], names : Sequence[str]) -> None:
+        """
+        Add a batch of templates in one commit (one new generation of the store)
+
+        :param encodings: 128-d face encodings
+        :param names: Names of the encodings
+        """
+        if not len(names):
+            return
+        with self._write_lock, self.store.lock():
+            self._sync()
+            snapshot = self.matcher.snapshot
+            self._write(np.concatenate([snapshot.encodings, np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)]), snapshot.names + tuple(names))
+        metrics.set_gauge("gallery_size", self.count())
+
+    def remove(self, name : str) -> int:
+        """
+        Remove every template of an identity
+
+        :param name: Identity name
+        :return: Number of removed templates
+        """
+        with self._write_lock, self.store.lock():
+            self._sync()
+            rows = self.matcher.snapshot.rows_of(name)
+            if not len(rows):
+                return 0
+            with metrics.time_stage("gallery_delete"):
+                # Highest rows first, the store rows of the lower ones do not shift
+                for row in sorted(rows.tolist(), reverse=True):
+                    self.store.delete(row)
+            self.matcher.remove_rows(rows.tolist())
+            self._file_signature = self._read_signature()
+        metrics.set_gauge("gallery_size", self.count())
+        return len(rows)
+
+    def replace(self, encodings : Sequence[Any], names : Sequence[str]) -> None:
+        """
+        Replace the whole gallery (rewrites the store as a new generation)
+
+        :param encodings: Face encodings (list of 128-d arrays or an (N, 128) matrix)
+        :param names: Names of the encodings
+        """
+        with self._write_lock, self.store.lock():
+            self._write(encodings, names)
+        metrics.set_gauge("gallery_size", self.count())
+
+    def compact(self) -> None:
+        """
+        Fold the journaled adds and deletes into the gallery file
+        """
+        with self._write_lock, self.store.lock():
+            self._sync()
+            with metrics.time_stage("gallery_compact"):
+                self.store.compact()
+            self._file_signature = self._read_signature()
+
+    def _load(self) -> int:
+        with metrics.time_stage("gallery_load"):
+            with self.store.lock():
+                # One-shot migration of the legacy pickle database, done by the first process only
+                if not self.store.exists() and os.path.exists(self.data_file):
+                    migrate_pickle(self.data_file, self.store)
+                # The encodings file stays memory-mapped, only the journaled adds are held in memory
+                base, base_rows, adds, names = self.store.load_parts()
+                self._file_signature = self._read_signature()
+            self.matcher.rebuild_parts(base, base_rows, adds, names)
+        return len(names)
+
+    def _write(self, encodings : Sequence[Any], names : Sequence[str]) -> None:
+        with metrics.time_stage("gallery_save"):
+            self.store.write(encodings, names)
+        # Matched from the memory map of the file just written instead of the matrix given here
+        self.matcher.rebuild_parts(*self.store.load_parts())
+        self._file_signature = self._read_signature()
+
+    def _sync(self) -> None:
+        # The rows of the store and of the matcher must be the same before a journaled write
+        if self._changed_on_disk():
+            logger.info(f"Gallery {self.store.directory} changed on disk, reloading it")
+            self._load()
+
+    def _changed_on_disk(self) -> bool:
+        return self._file_signature is None or self._read_signature() != self._file_signature
+
+    def _read_signature(self) -> Optional[tuple]:
+        """Name, size and modification time of every file of the gallery directory"""
+        try:
+            with os.scandir(self.store.directory) as entries:
+                return tuple(sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in entries))
+        except FileNotFoundError:
+            return ()
@@ -0,0 +1,172 @@
+"""
+Gallery-wide duplicate analysis.
+
+All the template pairs closer than the tolerance are found with blocked matrix products over the
+upper triangle of the distance matrix, so memory stays at block_size x block_size distances whatever
+the gallery size. The pairs are grouped into clusters (connected components, single linkage), which
+reveal the same person enrolled several times and the same face enrolled under different names.
+"""
+from typing import Any, List, Optional, Sequence, Tuple
+from collections import Counter
+import numpy as np
+from config import setup_logger
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+def close_pairs(encodings : Any, tolerance : float, block_size : int = 2048) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find every pair of templates within tolerance of each other
+
+    :param encodings: (N, 128) encodings (the memory-mapped gallery matrix is read block by block)
+    :param tolerance: Maximum distance of a pair
+    :param block_size: Rows and columns of one block of the distance matrix
+    :return: Tuple (rows, columns, distances) of the pairs, row < column
+    """
+    count = len(encodings)
+    norms = np.empty(count, dtype=np.float32)
+    for start in range(0, count, block_size):
+        block = np.asarray(encodings[start:start + block_size], dtype=np.float32)
+        norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+
+    threshold = np.float32(tolerance * tolerance)
+    rows, columns, squared_distances = [], [], []
+    for row_start in range(0, count, block_size):
+        row_block = np.asarray(encodings[row_start:row_start + block_size], dtype=np.float32)
+
+        # Upper triangle only: the column blocks start at the row block
+        for column_start in range(row_start, count, block_size):
+            column_block = row_block if column_start == row_start else np.asarray(encodings[column_start:column_start + block_size], dtype=np.float32)
+
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b  -> one GEMM per block, the rest in place
+            squared = row_block @ column_block.T
+            squared *= -2.0
+            squared += norms[row_start:row_start + len(row_block), None]
+            squared += norms[None, column_start:column_start + len(column_block)]
+            if column_start == row_start:
+                # Diagonal block: keep the pairs above the diagonal
+                squared[np.tril_indices(len(row_block))] = np.inf
+
+            block_rows, block_columns = np.nonzero(squared <= threshold)
+            rows.append(block_rows + row_start)
+            columns.append(block_columns + column_start)
+            squared_distances.append(squared[block_rows, block_columns])
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    # Rounding can make the squared distance of identical vectors slightly negative
+    return np.concatenate(rows), np.concatenate(columns), np.sqrt(np.maximum(np.concatenate(squared_distances), 0.0))
+
+
+def connected_components(count : int, rows : np.ndarray, columns : np.ndarray) -> np.ndarray:
+    """
+    Label the connected components of a graph given by its edges, without a Python loop over the edges
+
+    :param count: Number of nodes
+    :param rows: First node of every edge
+    :param columns: Second node of every edge
+    :return: Component label of every node (the smallest node index of its component)
+    """
+    labels = np.arange(count)
+    while True:
+        # Both ends of every edge take the smallest label, then labels point straight to their root
+        smallest = np.minimum(labels[rows], labels[columns])
+        updated = labels.copy()
+        np.minimum.at(updated, rows, smallest)
+        np.minimum.at(updated, columns, smallest)
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def analyze_gallery(encodings : Any, names : Sequence[str], tolerance : float, block_size : int = 2048) -> dict:
+    """
+    Cluster the templates of a gallery and report the suspected duplicates and conflicting names
+
+    :param encodings: (N, 128) gallery encodings
+    :param names: Names of the templates
+    :param tolerance: Distance under which two templates are considered the same face
+    :param block_size: Block size of the pairwise distance computation
+    :return: Report dict: counters and one entry per cluster of more than one template, largest first.
+             A cluster is "duplicate" when all its templates have the same name, "conflict" otherwise
+    """
+    with metrics.time_stage("gallery_pairs"):
+        rows, columns, distances = close_pairs(encodings, tolerance, block_size)
+    labels = connected_components(len(names), rows, columns)
+
+    # Longest link of every cluster, indexed by its label
+    max_link = np.zeros(len(names), dtype=np.float32)
+    np.maximum.at(max_link, labels[rows], distances)
+
+    order = np.argsort(labels, kind="stable")
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    clusters = []
+    for members in np.split(order, boundaries):
+        if len(members) < 2:
+            continue
+        member_names = [names[i] for i in members]
+        name_counts = Counter(member_names)
+        clusters.append({
+            "rows": members.tolist(),
+            "names": dict(name_counts.most_common()),
+            "kind": "duplicate" if len(name_counts) == 1 else "conflict",
+            "max_link_distance": round(float(max_link[labels[members[0]]]), 4)
+        })
+    clusters.sort(key=lambda cluster: len(cluster["rows"]), reverse=True)
+
+    return {
+        "templates": len(names),
+        "tolerance": tolerance,
+        "close_pairs": len(rows),
+        "clusters": len(clusters),
+        "duplicate_clusters": sum(1 for cluster in clusters if cluster["kind"] == "duplicate"),
+        "conflict_clusters": sum(1 for cluster in clusters if cluster["kind"] == "conflict"),
+        "redundant_templates": sum(len(cluster["rows"]) - 1 for cluster in clusters),
+        "cluster_details": clusters
+    }
+
+
+def merge_clusters(encodings : Any, names : Sequence[str], clusters : List[dict], collapse : bool = False, max_cluster_size : Optional[int] = None) -> Tuple[np.ndarray, List[str], int]:
+    """
+    Merge the clusters of an analysis report: every template of a cluster takes its most frequent name
+    (the first one enrolled on a tie), and with collapse only the medoid template of the cluster is kept
+
+    :param encodings: (N, 128) gallery encodings
+    :param names: Names of the templates
+    :param clusters: cluster_details of analyze_gallery
+    :param collapse: Keep one template per cluster instead of renaming all of them
+    :param max_cluster_size: Clusters larger than this are left untouched (long single-linkage chains are likely different people)
+    :return: Tuple (merged encodings, merged names, number of merged clusters)
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    names = list(names)
+    keep = np.ones(len(names), dtype=bool)
+    merged = 0
+    for cluster in clusters:
+        members = cluster["rows"]
+        if max_cluster_size is not None and len(members) > max_cluster_size:
+            logger.info(f"Cluster of {len(members)} templates {cluster['names']} is larger than {max_cluster_size}, not merged")
+            continue
+
+        counts = Counter(names[i] for i in members)
+        top_count = max(counts.values())
+        name = next(names[i] for i in sorted(members) if counts[names[i]] == top_count)
+        for i in members:
+            names[i] = name
+
+        if collapse:
+            member_encodings = encodings[members]
+            member_norms = np.einsum("ij,ij->i", member_encodings, member_encodings)
+            squared = member_norms[:, None] + member_norms[None, :] - 2.0 * (member_encodings @ member_encodings.T)
+            medoid = members[int(np.argmin(squared.sum(axis=1)))]
+            keep[members] = False
+            keep[medoid] = True
+        merged += 1
+
+    return encodings[keep], [name for name, kept in zip(names, keep) if kept], merged
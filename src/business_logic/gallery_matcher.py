@@ -0,0 +1,480 @@
+from typing import Dict, Iterator, List, Any, Optional, Sequence, NamedTuple, Tuple
+from collections.abc import Mapping
+import threading
+import numpy as np
+from src.business_logic.ann_index import ExactIndex
+
+ENCODING_SIZE = 128
+
+
+class MatchResult(NamedTuple):
+    """
+    Result of matching one face encoding against the gallery
+
+    :param index: Row index of the closest known face, -1 if the gallery is empty
+    :param distance: Euclidean distance to the closest known face
+    :param name: Name of the closest known face if it is within tolerance, otherwise "Unknown"
+    :param top_k: List of (index, distance) tuples of the k closest known faces, closest first
+    """
+    index: int
+    distance: float
+    name: str
+    top_k: List[tuple]
+
+
+class NameRows(Mapping):
+    def __init__(self, ids : Dict[str, int], order : np.ndarray, offsets : np.ndarray, added : Dict[str, np.ndarray], new_names : int = 0):
+        """
+        Read-only mapping {name: rows of its templates}, compact for galleries of millions of templates: the rows
+        sorted by identity and the offset of every identity in them (CSR layout) instead of one array per identity.
+        The rows of an identity are built on lookup. Adds go to a small dict on top of the shared arrays, they
+        are only sorted again when rows are removed
+
+        :param ids: Dict {name: identity id}, ids in the order of the first template of every identity
+        :param order: Template rows sorted by identity id (rows of one identity in increasing order)
+        :param offsets: (I + 1,) start of the rows of every identity in order
+        :param added: Dict {name: rows added after the build}
+        :param new_names: Number of names of added that are not in ids
+        """
+        self._ids = ids
+        self._order = order
+        self._offsets = offsets
+        self._added = added
+        self._new_names = new_names
+
+    @classmethod
+    def build(cls, names : Sequence[str]) -> "NameRows":
+        """
+        :param names: Name of every template
+        """
+        ids = {}
+        identities = np.fromiter((ids.setdefault(name, len(ids)) for name in names), dtype=np.int64, count=len(names))
+        order = np.argsort(identities, kind="stable")
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(identities, minlength=len(ids)), out=offsets[1:])
+        # Shared by the snapshots, the rows returned are views of order
+        order.flags.writeable = False
+        return cls(ids, order, offsets, {})
+
+    def with_row(self, name : str, row : int) -> "NameRows":
+        """
+        :return: Copy with one more template row for name, the sorted arrays are shared
+        """
+        added = dict(self._added)
+        new_name = name not in self._ids and name not in added
+        added[name] = np.append(added.get(name, np.empty(0, dtype=np.int64)), row)
+        return NameRows(self._ids, self._order, self._offsets, added, self._new_names + new_name)
+
+    def __getitem__(self, name : str) -> np.ndarray:
+        identity = self._ids.get(name)
+        added = self._added.get(name)
+        if identity is None:
+            if added is None:
+                raise KeyError(name)
+            return added
+        rows = self._order[self._offsets[identity]:self._offsets[identity + 1]]
+        return rows if added is None else np.concatenate([rows, added])
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._ids
+        yield from (name for name in self._added if name not in self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids) + self._new_names
+
+
+class GallerySnapshot:
+    __slots__ = ("base", "base_rows", "tail", "squared_norms", "names", "name_rows", "index", "generation", "_centroids")
+
+    def __init__(self, base : np.ndarray, base_rows : Optional[np.ndarray], tail : np.ndarray, squared_norms : np.ndarray, names : Tuple[str, ...], name_rows : NameRows, index : Any, generation : int = 0):
+        """
+        State of the gallery at one point in time, never modified once published: a reader takes the
+        current snapshot once and uses it for a whole match, without a lock, while writers publish new ones.
+
+        The templates are the live rows of base, which stays the read-only memory map of the gallery file
+        when there is one, followed by the tail of the templates added since, the only ones held in memory.
+        Adds and deletes never copy base.
+
+        :param base: (B, 128) float32 templates, e.g. the memory-mapped gallery file
+        :param base_rows: Live rows of base in order, None if every row of base is live
+        :param tail: (T, 128) float32 templates added after base
+        :param squared_norms: Squared norms of the templates
+        :param names: Name of every template (an identity can have several templates)
+        :param name_rows: Mapping {name: rows of its templates}
+        :param index: Candidate index built over these templates
+        :param generation: Number of the snapshot in its matcher, every publication increments it
+        """
+        self.base = base
+        self.base_rows = base_rows
+        self.tail = tail
+        self.squared_norms = squared_norms
+        self.names = names
+        self.name_rows = name_rows
+        self.index = index
+        self.generation = generation
+        self._centroids = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def base_count(self) -> int:
+        """Number of templates stored in base"""
+        return len(self.base) if self.base_rows is None else len(self.base_rows)
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """
+        (N, 128) float32 matrix of the templates: base itself when no template was added or removed since it
+        was loaded, otherwise a copy (bulk tools only, matching uses dot and take)
+        """
+        if self.base_rows is None and not len(self.tail):
+            return self.base
+        live_base = self.base if self.base_rows is None else self.base[self.base_rows]
+        return np.concatenate([live_base, self.tail])
+
+    def take(self, rows : np.ndarray) -> np.ndarray:
+        """
+        :param rows: Template rows
+        :return: (len(rows), 128) float32 templates, only these rows are read from base
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        base_count = self.base_count
+        in_base = rows < base_count
+        templates = np.empty((len(rows), ENCODING_SIZE), dtype=np.float32)
+        base_rows = rows[in_base]
+        templates[in_base] = self.base[base_rows if self.base_rows is None else self.base_rows[base_rows]]
+        templates[~in_base] = self.tail[rows[~in_base] - base_count]
+        return templates
+
+    def dot(self, queries : np.ndarray) -> np.ndarray:
+        """
+        :param queries: (M, 128) float32 matrix
+        :return: (M, N) dot products of the queries with every template, one GEMM over base and one over the tail
+        """
+        products = queries @ self.base.T
+        if self.base_rows is not None:
+            products = products[:, self.base_rows]
+        if len(self.tail):
+            products = np.concatenate([products, queries @ self.tail.T], axis=1)
+        return products
+
+    @property
+    def identities(self) -> List[str]:
+        return list(self.name_rows)
+
+    def rows_of(self, name : str) -> np.ndarray:
+        """
+        :param name: Identity name
+        :return: Rows of the templates of the identity, empty if it is unknown
+        """
+        return self.name_rows.get(name, np.empty(0, dtype=np.int64))
+
+    def centroids(self) -> Tuple[List[str], np.ndarray]:
+        """
+        Mean template of every identity, computed on first use
+
+        :return: Tuple (identity names, (I, 128) float32 centroids)
+        """
+        if self._centroids is None:
+            identities = self.identities
+            centroids = np.empty((len(identities), ENCODING_SIZE), dtype=np.float32)
+            for i, name in enumerate(identities):
+                centroids[i] = self.take(self.name_rows[name]).mean(axis=0)
+            self._centroids = (identities, centroids)
+        return self._centroids
+
+
+class TemplateRows:
+    def __init__(self, snapshot : GallerySnapshot):
+        """
+        Read-only (N, 128) view of the templates of a snapshot for building an index: a slice or an array of rows
+        reads only those rows from the base and the tail, the two are never joined into one matrix
+
+        :param snapshot: Snapshot whose templates are read
+        """
+        self.snapshot = snapshot
+        self.shape = (len(snapshot), ENCODING_SIZE)
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key : Any) -> np.ndarray:
+        if isinstance(key, slice):
+            key = np.arange(*key.indices(len(self)))
+        return self.snapshot.take(key)
+
+
+class GalleryMatcher:
+    def __init__(self, known_encodings : Optional[Sequence[Any]] = None, known_names : Optional[Sequence[str]] = None, tolerance : float = 0.6, index : Optional[Any] = None, prefilter_identities : int = 0):
+        """
+        Initialize GalleryMatcher with the known faces
+
+        :param known_encodings: Known face encodings (list of 128-d arrays or an (N, 128) matrix)
+        :param known_names: Names corresponding to the known face encodings, a name can have several templates
+        :param tolerance: Maximum distance for a face to be considered a match (same default as face_recognition.compare_faces)
+        :param index: Candidate index (ExactIndex, IVFIndex, QuantizedIndex...), candidates are always re-ranked with exact distances
+        :param prefilter_identities: If > 0, a face is only compared with the templates of the prefilter_identities identities
+                                     whose centroid is the closest (0 = best of all the templates)
+        """
+        self.tolerance = tolerance
+        self.prefilter_identities = prefilter_identities
+        self._lock = threading.Lock()
+        empty = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._snapshot = GallerySnapshot(empty, None, empty, np.empty(0, dtype=np.float32), (), {}, index if index is not None else ExactIndex())
+        self.rebuild(known_encodings if known_encodings is not None else [], known_names if known_names is not None else [])
+
+    @property
+    def snapshot(self) -> GallerySnapshot:
+        """Current snapshot of the gallery, safe to use from any thread"""
+        return self._snapshot
+
+    @property
+    def generation(self) -> int:
+        """Changes with every add, delete or rebuild, e.g. to expire identities cached from an older gallery"""
+        return self._snapshot.generation
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """All the templates as one matrix, a copy once templates were added or removed (see GallerySnapshot.encodings)"""
+        return self._snapshot.encodings
+
+    @property
+    def squared_norms(self) -> np.ndarray:
+        return self._snapshot.squared_norms
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return self._snapshot.names
+
+    @property
+    def index(self) -> Any:
+        return self._snapshot.index
+
+    def __len__(self) -> int:
+        return len(self._snapshot)
+
+    def rebuild(self, known_encodings : Sequence[Any], known_names : Sequence[str]) -> None:
+        """
+        Replace the gallery with new encodings and names
+
+        :param known_encodings: Known face encodings (list of 128-d arrays or an (N, 128) matrix)
+        :param known_names: Names corresponding to the known face encodings
+        """
+        if len(known_encodings) != len(known_names):
+            raise ValueError("known_encodings and known_names must have the same length")
+
+        # Keep all the templates in one contiguous float32 matrix so a match is a single matrix product.
+        # A float32 matrix (e.g. the memory-mapped gallery) is used as is, without a copy
+        if len(known_encodings):
+            base = np.ascontiguousarray(known_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        else:
+            base = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self.rebuild_parts(base, None, np.empty((0, ENCODING_SIZE), dtype=np.float32), known_names)
+
+    def rebuild_parts(self, base : np.ndarray, base_rows : Optional[np.ndarray], tail : np.ndarray, known_names : Sequence[str]) -> None:
+        """
+        Replace the gallery with the parts of a GalleryStore (see GalleryStore.load_parts): the memory-mapped
+        base is kept as is, the journaled deletes and adds become base_rows and the in-memory tail
+
+        :param base: (B, 128) float32 matrix, e.g. the read-only memory map of the gallery file
+        :param base_rows: Live rows of base in order, None if every row is live
+        :param tail: (T, 128) float32 templates following the live rows of base
+        :param known_names: Names of the live rows of base then of the tail
+        """
+        tail = np.ascontiguousarray(tail, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        base_count = len(base) if base_rows is None else len(base_rows)
+        if base_count + len(tail) != len(known_names):
+            raise ValueError("known_encodings and known_names must have the same length")
+
+        # Squared norms of the templates, precomputed once per gallery change instead of once per frame
+        base_norms = np.einsum("ij,ij->i", base, base)
+        norms_buffer = np.concatenate([base_norms if base_rows is None else base_norms[base_rows], np.einsum("ij,ij->i", tail, tail)])
+
+        with self._lock:
+            index = self._snapshot.index.clone()
+            # The exact index needs no build. The others read the templates by chunks, the base (memory map of
+            # the gallery file) is not joined with the journaled rows into a heap copy
+            if not isinstance(index, ExactIndex):
+                if base_rows is None and not len(tail):
+                    index.build(base)
+                else:
+                    index.build(TemplateRows(GallerySnapshot(base, base_rows, tail, norms_buffer, tuple(known_names), NameRows.build(()), index)))
+            self._base, self._base_rows, self._tail, self._norms_buffer = base, base_rows, tail, norms_buffer
+            self._publish(len(known_names), tuple(known_names), NameRows.build(known_names), index)
+
+    def add(self, face_encoding : Any, name : str) -> None:
+        """
+        Append a new face to the gallery without rebuilding it
+
+        :param face_encoding: 128-d face encoding to add
+        :param name: Name associated with the face, an existing name gets one more template
+        """
+        row = np.asarray(face_encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+
+        with self._lock:
+            snapshot = self._snapshot
+            size = len(snapshot)
+            tail_size = len(snapshot.tail)
+
+            # Only the tail grows, base (the memory-mapped gallery file) is never copied. The buffers grow
+            # geometrically so a series of adds costs amortized O(1) copies, the new row is written past the
+            # end of the published snapshot, which never reads it
+            if tail_size == len(self._tail) or not self._tail.flags.writeable:
+                tail = np.empty((max(16, 2 * tail_size), ENCODING_SIZE), dtype=np.float32)
+                tail[:tail_size] = snapshot.tail
+                self._tail = tail
+            if size == len(self._norms_buffer):
+                norms_buffer = np.empty(max(16, 2 * size), dtype=np.float32)
+                norms_buffer[:size] = snapshot.squared_norms
+                self._norms_buffer = norms_buffer
+
+            self._tail[tail_size] = row
+            self._norms_buffer[size] = row @ row
+
+            index = snapshot.index.clone()
+            index.add(row)
+            self._publish(size + 1, snapshot.names + (name,), snapshot.name_rows.with_row(name, size), index)
+
+    def remove(self, index : int) -> None:
+        """
+        Remove a face from the gallery by row index, the following rows shift down by one
+
+        :param index: Row index of the face to remove
+        """
+        self.remove_rows([index])
+
+    def remove_rows(self, rows : Sequence[int]) -> None:
+        """
+        Remove several faces from the gallery at once, the following rows shift down
+
+        :param rows: Row indices of the faces to remove
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            for row in rows:
+                if not 0 <= row < len(snapshot):
+                    raise IndexError(f"Row {row} is out of range for a gallery of {len(snapshot)} faces")
+
+            # Copy on write: the published snapshot keeps reading the old buffers. A deleted row of base
+            # only leaves base_rows, base itself is not copied
+            keep = np.ones(len(snapshot), dtype=bool)
+            keep[list(rows)] = False
+            base_count = snapshot.base_count
+            if not keep[:base_count].all():
+                live_rows = snapshot.base_rows if snapshot.base_rows is not None else np.arange(base_count)
+                self._base_rows = live_rows[keep[:base_count]]
+            self._tail = snapshot.tail[keep[base_count:]]
+            self._norms_buffer = snapshot.squared_norms[keep]
+            names = tuple(name for name, kept in zip(snapshot.names, keep) if kept)
+
+            index = snapshot.index.clone()
+            for row in sorted(rows, reverse=True):
+                index.remove(row)
+            self._publish(len(names), names, NameRows.build(names), index)
+
+    def _publish(self, size : int, names : Tuple[str, ...], name_rows : NameRows, index : Any) -> None:
+        # A single reference assignment, readers see either the old or the new snapshot
+        base_count = len(self._base) if self._base_rows is None else len(self._base_rows)
+        self._snapshot = GallerySnapshot(self._base, self._base_rows, self._tail[:size - base_count], self._norms_buffer[:size], names, name_rows, index, self._snapshot.generation + 1)
+
+    def distances(self, face_encodings : Sequence[Any], snapshot : Optional[GallerySnapshot] = None) -> np.ndarray:
+        """
+        Compute the distances between every given face and every known face in one batched call
+
+        :param face_encodings: Face encodings found in a frame (list of 128-d arrays or an (M, 128) matrix)
+        :param snapshot: Gallery snapshot to compare with (default: the current one)
+        :return: (M, N) matrix of euclidean distances
+        """
+        snapshot = snapshot if snapshot is not None else self._snapshot
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+        # ||q - k||^2 = ||q||^2 + ||k||^2 - 2 q.k  -> one GEMM for all faces against all templates
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        squared = query_norms[:, None] + snapshot.squared_norms[None, :] - 2.0 * snapshot.dot(queries)
+
+        # Rounding can make the squared distance of identical vectors slightly negative
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared, out=squared)
+
+    def match(self, face_encodings : Sequence[Any], top_k : int = 1) -> List[MatchResult]:
+        """
+        Match every face of a frame against the gallery, an identity matches with its closest template (best of)
+
+        :param face_encodings: Face encodings found in a frame
+        :param top_k: Number of closest known faces to return per face
+        :return: List of MatchResult, one per given face encoding
+        """
+        if len(face_encodings) == 0:
+            return []
+
+        # One snapshot for the whole match, enrollment or deletion may publish a new one meanwhile
+        snapshot = self._snapshot
+        if len(snapshot) == 0:
+            return [MatchResult(-1, float("inf"), "Unknown", []) for _ in range(len(face_encodings))]
+
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        candidates = snapshot.index.candidates(queries, top_k)
+        if candidates is None and 0 < self.prefilter_identities < len(snapshot.name_rows):
+            candidates = self._centroid_candidates(snapshot, queries)
+
+        if candidates is None:
+            # Exact scan: all faces against all templates at once
+            distances = self.distances(queries, snapshot)
+            return [self._top_k_result(snapshot, None, row_distances, top_k) for row_distances in distances]
+
+        # Approximate index: exact re-ranking of the proposed rows only, a query without a proposal is scanned exactly
+        results = []
+        for query, rows in zip(queries, candidates):
+            if rows is None:
+                results.append(self._top_k_result(snapshot, None, self.distances(query[None, :], snapshot)[0], top_k))
+                continue
+            if len(rows) == 0:
+                results.append(MatchResult(-1, float("inf"), "Unknown", []))
+                continue
+            squared = snapshot.squared_norms[rows] + query @ query - 2.0 * (snapshot.take(rows) @ query)
+            row_distances = np.sqrt(np.maximum(squared, 0.0))
+            results.append(self._top_k_result(snapshot, rows, row_distances, top_k))
+
+        return results
+
+    def _centroid_candidates(self, snapshot : GallerySnapshot, queries : np.ndarray) -> List[np.ndarray]:
+        """
+        Rows of the templates of the identities whose centroid is the closest to every query
+        """
+        identities, centroids = snapshot.centroids()
+        k = self.prefilter_identities
+        # The query norm is constant per row so it does not change the ranking
+        scores = np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2.0 * (queries @ centroids.T)
+        nearest = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        return [np.concatenate([snapshot.name_rows[identities[i]] for i in query_nearest]) for query_nearest in nearest]
+
+    def _top_k_result(self, snapshot : GallerySnapshot, rows : Optional[np.ndarray], row_distances : np.ndarray, top_k : int) -> MatchResult:
+        """
+        Build the MatchResult of one face from its distances to the candidate rows
+
+        :param snapshot: Gallery snapshot the distances were computed on
+        :param rows: Gallery rows of the distances, None if the distances cover the whole gallery
+        :param row_distances: Exact distances to the candidate rows
+        :param top_k: Number of closest known faces to return
+        """
+        k = min(top_k, len(row_distances))
+
+        # argpartition selects the k closest templates without sorting the whole row
+        if k < len(row_distances):
+            nearest = np.argpartition(row_distances, k - 1)[:k]
+        else:
+            nearest = np.arange(len(row_distances))
+        nearest = nearest[np.argsort(row_distances[nearest])]
+        indices = nearest if rows is None else rows[nearest]
+
+        best_index = int(indices[0])
+        best_distance = float(row_distances[nearest[0]])
+        name = snapshot.names[best_index] if best_distance <= self.tolerance else "Unknown"
+        return MatchResult(
+            best_index,
+            best_distance,
+            name,
+            [(int(i), float(row_distances[j])) for i, j in zip(indices, nearest)]
+        )
@@ -0,0 +1,414 @@
+"""
+Binary on-disk gallery format.
+
+A gallery directory holds one generation of:
+    encodings.<gen>.npy - (N, 128) float32 matrix, opened with mmap so loading does not read it into memory
+    names.<gen>.txt     - UTF-8 names, one per line, in the same order as the matrix rows
+    journal.<gen>.bin   - append-only log of adds and delete tombstones since the generation was written
+and meta.json which points to the current generation. Compaction folds the journal into a new
+generation and atomically switches meta.json to it.
+
+Several processes share a gallery (app, inference process, recognition service, batch and bulk tools):
+loads, migration, journal appends and compaction hold an exclusive lock on gallery.lock.
+"""
+from typing import List, Any, Tuple, Optional, Sequence
+import contextlib
+import json
+import os
+import pickle
+import struct
+import sys
+import threading
+import numpy as np
+from config import setup_logger
+
+logger = setup_logger(__name__)
+
+ENCODING_SIZE = 128
+FORMAT_VERSION = 1
+
+ADD_RECORD = b"A"
+DELETE_RECORD = b"D"
+ENCODING_BYTES = ENCODING_SIZE * 4
+LOCK_FILE = "gallery.lock"
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after 10 seconds, the other process is still writing
+            continue
+
+
+def _unlock_file(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class GalleryStore:
+    def __init__(self, directory : str = "known_faces_gallery", compact_threshold : int = 1024):
+        """
+        Initialize GalleryStore
+
+        :param directory: Directory holding the gallery files
+        :param compact_threshold: Number of journal records after which the journal is folded into a new generation
+        """
+        self.directory = directory
+        self.compact_threshold = compact_threshold
+
+        self._state_loaded = False
+        self._generation = 0
+        self._next_id = 0
+        self._journal_records = 0
+        self._live_ids = None  # Stable ids of the live rows in order, None means arange(count)
+        self._count = 0
+        self._journal_size = 0  # Bytes of the journal accounted for by this instance
+
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_handle = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self._meta_path())
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Exclusive lock of the gallery directory shared by every process, reentrant for this store
+        """
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                os.makedirs(self.directory, exist_ok=True)
+                handle = open(os.path.join(self.directory, LOCK_FILE), "a+b")
+                try:
+                    _lock_file(handle)
+                except BaseException:
+                    handle.close()
+                    raise
+                self._lock_handle = handle
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    handle, self._lock_handle = self._lock_handle, None
+                    try:
+                        _unlock_file(handle)
+                    finally:
+                        handle.close()
+
+    def load(self) -> Tuple[np.ndarray, List[str]]:
+        """
+        Load the gallery
+
+        When the journal is empty the returned matrix is the read-only memory map of the encodings file,
+        so a large gallery is not copied into memory. Otherwise the journal is replayed on top of it.
+
+        :return: Tuple (encodings (N, 128) float32 matrix, names)
+        """
+        base, base_rows, adds, names = self.load_parts()
+        if base_rows is None and not len(adds):
+            return base, names
+        live_base = base if base_rows is None else base[base_rows]
+        return np.concatenate([live_base, adds]) if len(adds) else np.ascontiguousarray(live_base), names
+
+    def load_parts(self) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, List[str]]:
+        """
+        Load the gallery without replaying the journal into one matrix: the encodings file stays memory-mapped
+        and only the journaled adds are read into memory (see GalleryMatcher.rebuild_parts)
+
+        :return: Tuple (read-only memory map of the encodings file, its live rows in order or None if every row is live,
+                 (A, 128) float32 journaled adds that are still live, names of the live rows then of the adds)
+        """
+        if not self.exists():
+            self._reset_state(0, 0)
+            empty = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+            return empty, None, empty, []
+
+        # A compaction of another process would remove the files of the generation between the reads
+        with self.lock():
+            return self._load()
+
+    def _load(self) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, List[str]]:
+        meta = self._read_meta()
+        generation = meta["generation"]
+        base = np.load(self._path("encodings", generation, "npy"), mmap_mode="r")
+        names = self._read_names(generation)
+        adds, add_names, tombstones, records = self._read_journal(generation, len(base))
+
+        self._generation = generation
+        self._journal_size = self._journal_bytes(generation)
+        self._next_id = len(base) + len(adds)
+        self._journal_records = records
+        self._state_loaded = True
+
+        if not records:
+            self._live_ids = None
+            self._count = len(base)
+            return base, None, adds, names
+
+        # Replay the journal: drop tombstoned rows, then append the added rows in order
+        all_ids = np.arange(self._next_id)
+        alive = np.ones(self._next_id, dtype=bool)
+        alive[list(tombstones)] = False
+        self._live_ids = all_ids[alive]
+        self._count = len(self._live_ids)
+
+        base_alive = alive[:len(base)]
+        add_alive = alive[len(base):]
+        names = [name for name, keep in zip(names, base_alive) if keep] + [name for name, keep in zip(add_names, add_alive) if keep]
+        return base, None if base_alive.all() else np.flatnonzero(base_alive), adds[add_alive], names
+
+    def count(self) -> int:
+        """
+        :return: Number of faces in the gallery
+        """
+        self._ensure_state()
+        return self._count
+
+    def names(self) -> List[str]:
+        """
+        :return: Names of the faces in the gallery
+        """
+        return self.load()[1]
+
+    def write(self, encodings : Sequence[Any], names : Sequence[str]) -> None:
+        """
+        Write the whole gallery as a new generation (also used for compaction)
+
+        :param encodings: Face encodings (list of 128-d arrays or an (N, 128) matrix)
+        :param names: Names corresponding to the face encodings
+        """
+        if len(encodings) != len(names):
+            raise ValueError("encodings and names must have the same length")
+
+        with self.lock():
+            self._write(encodings, names)
+
+    def _write(self, encodings : Sequence[Any], names : Sequence[str]) -> None:
+        old_generation = self._read_meta()["generation"] if self.exists() else None
+        generation = (old_generation + 1) if old_generation is not None else 0
+
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE) if len(encodings) else np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        np.save(self._path("encodings", generation, "npy"), matrix)
+        with open(self._path("names", generation, "txt"), "w", encoding="utf-8", newline="\n") as f:
+            for name in names:
+                f.write(str(name).replace("\n", " ") + "\n")
+        open(self._path("journal", generation, "bin"), "wb").close()
+
+        # Switching meta.json is the commit point, a crash before it leaves the old generation in place
+        meta = {"version": FORMAT_VERSION, "generation": generation, "count": len(matrix), "dim": ENCODING_SIZE, "dtype": "float32"}
+        tmp_meta_path = self._meta_path() + ".tmp"
+        with open(tmp_meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_meta_path, self._meta_path())
+
+        self._reset_state(generation, len(matrix))
+        self._remove_stale_generations(generation)
+
+    def append(self, encoding : Any, name : str) -> None:
+        """
+        Append a new face to the journal, O(1) disk write
+
+        :param encoding: 128-d face encoding
+        :param name: Name associated with the face
+        """
+        with self.lock():
+            if not self.exists():
+                self._write([encoding], [name])
+                return
+            # Another process journaled or compacted since this store was loaded: the ids of the new record follow its state
+            if not self._state_loaded or self._is_stale():
+                self._load()
+            self._append(encoding, name)
+
+    def _append(self, encoding : Any, name : str) -> None:
+        name_bytes = str(name).replace("\n", " ").encode("utf-8")
+        record = ADD_RECORD + struct.pack("<H", len(name_bytes)) + name_bytes + np.asarray(encoding, dtype="<f4").reshape(ENCODING_SIZE).tobytes()
+        self._append_record(record)
+
+        if self._live_ids is not None:
+            self._live_ids = np.append(self._live_ids, self._next_id)
+        self._next_id += 1
+        self._count += 1
+        self._maybe_compact()
+
+    def delete(self, row : int) -> None:
+        """
+        Write a tombstone for a face, O(1) disk write
+
+        :param row: Row index of the face in the loaded gallery
+        """
+        with self.lock():
+            self._ensure_state()
+            if self._is_stale():
+                raise RuntimeError(f"Gallery {self.directory} was changed by another process, reload it before deleting rows")
+            self._delete(row)
+
+    def _delete(self, row : int) -> None:
+        if not 0 <= row < self._count:
+            raise IndexError(f"Row {row} is out of range for a gallery of {self._count} faces")
+
+        if self._live_ids is None:
+            self._live_ids = np.arange(self._count)
+        stable_id = int(self._live_ids[row])
+        self._append_record(DELETE_RECORD + struct.pack("<Q", stable_id))
+
+        self._live_ids = np.delete(self._live_ids, row)
+        self._count -= 1
+        self._maybe_compact()
+
+    def compact(self) -> None:
+        """
+        Fold the journal into a new generation, nothing is written when the journal is empty
+        """
+        with self.lock():
+            self._ensure_state()
+            if not self._journal_records and not self._is_stale():
+                return
+
+            encodings, names = self.load()
+            if self._journal_records:
+                self._write(encodings, names)
+
+    def _maybe_compact(self) -> None:
+        if self._journal_records >= self.compact_threshold:
+            logger.info(f"Compacting gallery journal of {self._journal_records} records")
+            self.compact()
+
+    def _append_record(self, record : bytes) -> None:
+        with open(self._path("journal", self._generation, "bin"), "ab") as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records += 1
+        self._journal_size += len(record)
+
+    def _is_stale(self) -> bool:
+        """True if the files on disk are not the generation and journal this store loaded or wrote"""
+        if not self.exists():
+            return self._count > 0
+        return self._read_meta()["generation"] != self._generation or self._journal_bytes(self._generation) != self._journal_size
+
+    def _journal_bytes(self, generation : int) -> int:
+        try:
+            return os.path.getsize(self._path("journal", generation, "bin"))
+        except FileNotFoundError:
+            return 0
+
+    def _ensure_state(self) -> None:
+        if not self._state_loaded:
+            self.load()
+
+    def _reset_state(self, generation : int, count : int) -> None:
+        self._generation = generation
+        self._next_id = count
+        self._journal_records = 0
+        self._live_ids = None
+        self._count = count
+        self._journal_size = 0
+        self._state_loaded = True
+
+    def _read_meta(self) -> dict:
+        with open(self._meta_path(), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported gallery format version {meta.get('version')}")
+        return meta
+
+    def _read_names(self, generation : int) -> List[str]:
+        with open(self._path("names", generation, "txt"), "r", encoding="utf-8", newline="\n") as f:
+            return f.read().split("\n")[:-1]
+
+    def _read_journal(self, generation : int, base_count : int):
+        """
+        Parse the journal, a torn record at the end (crash during append) is ignored
+
+        :return: Tuple (added encodings matrix, added names, tombstoned stable ids, number of records)
+        """
+        path = self._path("journal", generation, "bin")
+        data = open(path, "rb").read() if os.path.exists(path) else b""
+
+        add_chunks, add_names, tombstones = [], [], set()
+        records, offset = 0, 0
+        while offset < len(data):
+            kind = data[offset:offset + 1]
+            if kind == ADD_RECORD and offset + 3 <= len(data):
+                name_length = struct.unpack_from("<H", data, offset + 1)[0]
+                end = offset + 3 + name_length + ENCODING_BYTES
+                if end > len(data):
+                    break
+                add_names.append(data[offset + 3:offset + 3 + name_length].decode("utf-8"))
+                add_chunks.append(data[end - ENCODING_BYTES:end])
+                offset = end
+            elif kind == DELETE_RECORD and offset + 9 <= len(data):
+                tombstones.add(struct.unpack_from("<Q", data, offset + 1)[0])
+                offset += 9
+            else:
+                logger.error(f"Ignoring corrupted gallery journal tail at byte {offset} of {path}")
+                break
+            records += 1
+
+        adds = np.frombuffer(b"".join(add_chunks), dtype="<f4").reshape(-1, ENCODING_SIZE).astype(np.float32)
+        tombstones = {stable_id for stable_id in tombstones if stable_id < base_count + len(adds)}
+        return adds, add_names, tombstones, records
+
+    def _remove_stale_generations(self, generation : int) -> None:
+        for file_name in os.listdir(self.directory):
+            parts = file_name.split(".")
+            if len(parts) == 3 and parts[0] in ("encodings", "names", "journal") and parts[1].isdigit() and int(parts[1]) != generation:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    # A memory map of the old generation may still be open (Windows), retried on the next write
+                    pass
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _path(self, kind : str, generation : int, extension : str) -> str:
+        return os.path.join(self.directory, f"{kind}.{generation}.{extension}")
+
+
+def migrate_pickle(pickle_path : str, store : GalleryStore) -> int:
+    """
+    One-shot migration of a known_faces.pkl file into a GalleryStore
+
+    :param pickle_path: Path of the pickle written by the old FaceAdder.save_known_faces
+    :param store: Destination store
+    :return: Number of migrated faces
+    """
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+    encodings = data.get("encodings", [])
+    names = data.get("names", [])
+
+    store.write(encodings, names)
+    logger.info(f"Migrated {len(names)} faces from {pickle_path} to {store.directory}")
+    return len(names)
+
+
+if __name__ == "__main__":
+    # python -m src.business_logic.gallery_store known_faces.pkl known_faces_gallery
+    source = sys.argv[1] if len(sys.argv) > 1 else "known_faces.pkl"
+    destination = sys.argv[2] if len(sys.argv) > 2 else "known_faces_gallery"
+    migrate_pickle(source, GalleryStore(destination))
@@ -0,0 +1,110 @@
+"""
+Detector and encoder profile of the host, chosen once per machine by the calibration command
+(python -m src.cli.calibrate) and loaded at startup by the app and by FaceAdder.
+"""
+from typing import Any, Iterable, List, NamedTuple, Optional
+import itertools
+import json
+import os
+import platform
+import time
+from config import setup_logger
+
+logger = setup_logger(__name__)
+
+PROFILE_FILE = "host_profile.json"
+
+
+class DetectionProfile(NamedTuple):
+    """
+    Speed / accuracy settings of face_recognition
+
+    :param model: Face detector, "hog" (CPU) or "cnn" (much slower without a GPU, finds more faces)
+    :param upsample: Number of times the detector upsamples the image (finds faces half as large per upsample)
+    :param num_jitters: Number of re-samplings averaged per encoding (slower, slightly more stable)
+    :param landmark_model: "small" (5 points, the library default) or "large" (68 points) landmarks aligning the face before encoding.
+                           The gallery templates should be encoded with the same landmarks as the live faces
+    :param scale: Downscale factor of the camera frames before detection
+    """
+    model: str = "hog"
+    upsample: int = 1
+    num_jitters: int = 1
+    landmark_model: str = "small"
+    scale: float = 0.25
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}/up{self.upsample}/jit{self.num_jitters}/{self.landmark_model}/x{self.scale:g}"
+
+    def detect(self, rgb_image : Any, upsample : Optional[int] = None) -> List[tuple]:
+        """
+        :param rgb_image: RGB image
+        :param upsample: Upsample count overriding the profile one (e.g. set by an AdaptiveController)
+        :return: (top, right, bottom, left) boxes of the faces
+        """
+        import face_recognition
+        return face_recognition.face_locations(rgb_image, self.upsample if upsample is None else upsample, self.model)
+
+    def encode(self, rgb_image : Any, face_locations : List[tuple]) -> List[Any]:
+        """
+        :param rgb_image: RGB image
+        :param face_locations: (top, right, bottom, left) boxes of the faces to encode
+        :return: 128-d encodings in the order of face_locations
+        """
+        import face_recognition
+        return face_recognition.face_encodings(rgb_image, face_locations, self.num_jitters, self.landmark_model)
+
+
+# The library defaults, used when the host was never calibrated
+DEFAULT_PROFILE = DetectionProfile()
+
+
+def candidate_profiles(models : Iterable[str] = ("hog",), upsamples : Iterable[int] = (0, 1, 2), jitters : Iterable[int] = (1,), landmark_models : Iterable[str] = (DEFAULT_PROFILE.landmark_model,), scales : Iterable[float] = (0.25, 0.5, 1.0)) -> List[DetectionProfile]:
+    """
+    :param landmark_models: Landmark models to try, by default only the library one: the gallery templates were
+                            encoded with one landmark model and live faces encoded with another do not match them
+    :return: Every combination of the settings, as DetectionProfile
+    """
+    return [DetectionProfile(*values) for values in itertools.product(models, upsamples, jitters, landmark_models, scales)]
+
+
+def load_profile(path : str = PROFILE_FILE) -> DetectionProfile:
+    """
+    Load the calibrated profile of the host
+
+    :param path: Profile file written by save_profile
+    :return: The calibrated profile, DEFAULT_PROFILE if the host was never calibrated or the file is invalid
+    """
+    if not os.path.exists(path):
+        return DEFAULT_PROFILE
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            values = json.load(f)["profile"]
+        profile = DetectionProfile(**{field: values[field] for field in DetectionProfile._fields if field in values})
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Invalid host profile {path}, using the default profile: {e}")
+        return DEFAULT_PROFILE
+    logger.info(f"Loaded host profile {profile.name} from {path}")
+    return profile
+
+
+def save_profile(profile : DetectionProfile, path : str = PROFILE_FILE, calibration : Optional[dict] = None) -> None:
+    """
+    Persist the profile of the host, with the calibration that chose it
+
+    :param profile: Chosen profile
+    :param path: Profile file
+    :param calibration: Optional calibration report stored next to the profile
+    """
+    document = {
+        "profile": profile._asdict(),
+        "host": {"node": platform.node(), "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()},
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "calibration": calibration
+    }
+    # Written next to the target and renamed, a crash never leaves a truncated profile
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    os.replace(temporary_path, path)
+    logger.info(f"Saved host profile {profile.name} to {path}")
@@ -0,0 +1,136 @@
+from typing import List, Tuple
+import cv2
+import numpy as np
+
+SKIP = "skip"
+ROI = "roi"
+FULL = "full"
+
+
+class MotionGate:
+    def __init__(self, pixel_threshold : int = 25, motion_fraction : float = 0.002, background_rate : float = 0.05, full_scan_interval : int = 10, max_static_frames : int = 50, roi_padding : float = 0.5):
+        """
+        Initialize MotionGate: decides per frame whether face detection can be skipped (static scene),
+        restricted to padded regions around the previous faces (ROI), or has to scan the whole frame.
+        Motion is measured by background subtraction on the small frame, which is much cheaper than detection.
+
+        :param pixel_threshold: Gray level difference above which a pixel is considered changed
+        :param motion_fraction: Fraction of changed pixels above which the scene is considered in motion
+        :param background_rate: Learning rate of the running-average background
+        :param full_scan_interval: Maximum number of frames between two full scans while there is motion
+        :param max_static_frames: Maximum number of skipped frames in a row (a full scan refreshes the faces)
+        :param roi_padding: Padding around a previous face box, relative to the box size
+        """
+        self.pixel_threshold = pixel_threshold
+        self.motion_fraction = motion_fraction
+        self.background_rate = background_rate
+        self.full_scan_interval = full_scan_interval
+        self.max_static_frames = max_static_frames
+        self.roi_padding = roi_padding
+
+        # Face boxes of the last processed frame, in small frame coordinates
+        self.locations = []
+
+        self._background = None
+        # Reused per-frame buffers, written through dst=
+        self._gray = None
+        self._blurred = None
+        self._background_u8 = None
+        self._motion_mask = None
+        self._frames_since_full = 0
+        self._static_frames = 0
+        self.counts = {SKIP: 0, ROI: 0, FULL: 0}
+
+    def decide(self, small_frame : np.ndarray) -> str:
+        """
+        Decide how to run detection on a frame
+
+        :param small_frame: Downscaled BGR frame (the one detection runs on)
+        :return: "skip", "roi" or "full"
+        """
+        if self._background is None or self._background.shape != small_frame.shape[:2]:
+            gray = cv2.GaussianBlur(cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+            self._background = gray.astype(np.float32)
+            self._gray, self._blurred = gray.copy(), gray
+            self._background_u8, self._motion_mask = np.empty_like(gray), np.empty_like(gray)
+            return self._count(FULL)
+
+        cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        gray = cv2.GaussianBlur(self._gray, (5, 5), 0, dst=self._blurred)
+
+        cv2.convertScaleAbs(self._background, dst=self._background_u8)
+        cv2.absdiff(gray, self._background_u8, dst=self._motion_mask)
+        cv2.threshold(self._motion_mask, self.pixel_threshold, 1, cv2.THRESH_BINARY, dst=self._motion_mask)
+        motion_mask = self._motion_mask
+        cv2.accumulateWeighted(gray, self._background, self.background_rate)
+        self._frames_since_full += 1
+
+        if cv2.countNonZero(motion_mask) < self.motion_fraction * motion_mask.size:
+            self._static_frames += 1
+            if self._static_frames <= self.max_static_frames:
+                return self._count(SKIP)
+            # Refresh scan of a static scene, then skip again for max_static_frames
+            self._static_frames = 0
+            return self._count(FULL)
+        self._static_frames = 0
+
+        if not self.locations or self._frames_since_full >= self.full_scan_interval:
+            return self._count(FULL)
+
+        # Motion outside the regions of the known faces may be a new face: scan everything
+        outside = motion_mask
+        for top, right, bottom, left in self.regions(gray.shape):
+            outside[top:bottom, left:right] = 0
+        if cv2.countNonZero(outside) >= self.motion_fraction * outside.size:
+            return self._count(FULL)
+        return self._count(ROI)
+
+    def regions(self, shape : Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        """
+        Padded regions around the previous face boxes, overlapping regions are merged
+
+        :param shape: Shape of the small frame
+        :return: List of (top, right, bottom, left) regions clipped to the frame
+        """
+        height, width = shape[:2]
+        regions = []
+        for top, right, bottom, left in self.locations:
+            pad_y = int((bottom - top) * self.roi_padding)
+            pad_x = int((right - left) * self.roi_padding)
+            regions.append([max(top - pad_y, 0), min(right + pad_x, width), min(bottom + pad_y, height), max(left - pad_x, 0)])
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    a, b = regions[i], regions[j]
+                    if a[3] < b[1] and b[3] < a[1] and a[0] < b[2] and b[0] < a[2]:
+                        regions[i] = [min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3])]
+                        del regions[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        return [tuple(region) for region in regions]
+
+    def _count(self, decision : str) -> str:
+        self.counts[decision] += 1
+        if decision == FULL:
+            self._frames_since_full = 0
+        return decision
+
+    def stats(self) -> dict:
+        """
+        :return: Dict with the number of frames per decision and the skipped / ROI-only fractions
+        """
+        frames = sum(self.counts.values())
+        return {
+            "frames": frames,
+            "skipped": self.counts[SKIP],
+            "roi": self.counts[ROI],
+            "full": self.counts[FULL],
+            "skipped_fraction": round(self.counts[SKIP] / frames, 3) if frames else 0.0,
+            "roi_fraction": round(self.counts[ROI] / frames, 3) if frames else 0.0
+        }
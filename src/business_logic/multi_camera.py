@@ -0,0 +1,288 @@
+from typing import List, Any, Callable, Optional, Sequence, Tuple
+import threading
+import time
+from config import setup_logger
+from src.business_logic.recognizer import FaceRecognizer
+from src.business_logic.face_tracker import FaceTracker
+from src.business_logic.motion_gate import MotionGate
+from src.business_logic.camera_session import CameraSessionManager, CameraSource
+from src.business_logic.adaptive_controller import AdaptiveController
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class FairScheduler:
+    def __init__(self, sources : Sequence[CameraSource], condition : threading.Condition, workers : int = 1, shed_threshold : float = 0.9, window : float = 2.0, max_interval : float = 2.0):
+        """
+        Initialize FairScheduler: picks the next source to run inference on.
+        Each source is charged its inference time divided by its priority (weighted fair queuing),
+        and the source with the lowest charge and a pending frame runs next. When inference is busy
+        more than shed_threshold of the time, sources below the highest priority are throttled.
+
+        :param sources: Camera sources to schedule
+        :param condition: Condition shared by the frame slots of the sources
+        :param workers: Number of inference workers (the budget is workers * wall time)
+        :param shed_threshold: Inference busy ratio above which load is shed
+        :param window: Seconds between two load measurements
+        :param max_interval: Maximum seconds between two inferences of a throttled source
+        """
+        self.sources = list(sources)
+        self.condition = condition
+        self.workers = workers
+        self.shed_threshold = shed_threshold
+        self.window = window
+        self.max_interval = max_interval
+
+        self.utilization = 0.0
+        self._busy_time = 0.0
+        self._window_start = time.monotonic()
+
+    def next(self, timeout : float) -> Optional[Tuple[CameraSource, Any]]:
+        """
+        Wait for the next (source, frame) to run inference on
+
+        :param timeout: Maximum seconds to wait
+        :return: Tuple (source, frame) or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                pending = [source for source in self.sources if source.frame_slot.depth]
+                # A source is never processed by two workers at once, its frames (and tracker) stay in order.
+                # The stride of a source (set by its controller) skips captured frames
+                eligible = [
+                    source for source in pending
+                    if not source.in_inference and now - source.last_inference_time >= source.min_interval
+                    and source.frame_slot.put_count - source.last_inference_frame >= source.stride
+                ]
+
+                if eligible:
+                    source = min(eligible, key=lambda s: s.virtual_time)
+                    # A source that was idle does not get to catch up on the budget it did not use
+                    source.virtual_time = max(source.virtual_time, min(s.virtual_time for s in pending))
+                    source.last_inference_time = now
+                    source.last_inference_frame = source.frame_slot.put_count
+                    source.in_inference = True
+                    return source, source.frame_slot.get(timeout=0)
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None
+
+                # Wake up on a new frame, or when a throttled source becomes eligible again
+                wake_times = [source.last_inference_time + source.min_interval - now for source in pending if not source.in_inference]
+                self.condition.wait(min([remaining] + [max(wake_time, 0.001) for wake_time in wake_times]))
+
+    def report(self, source : CameraSource, seconds : float) -> None:
+        """
+        Charge a source for an inference and adapt the load shedding
+
+        :param source: Source the inference ran on
+        :param seconds: Duration of the inference
+        """
+        with self.condition:
+            source.in_inference = False
+            source.virtual_time += seconds / max(source.priority, 1e-6)
+            self.condition.notify_all()
+            self._busy_time += seconds
+
+            now = time.monotonic()
+            if now - self._window_start < self.window:
+                return
+
+            self.utilization = self._busy_time / ((now - self._window_start) * self.workers)
+            self._busy_time = 0.0
+            self._window_start = now
+
+            top_priority = max(s.priority for s in self.sources)
+            for s in self.sources:
+                if s.priority >= top_priority:
+                    continue
+                if self.utilization > self.shed_threshold:
+                    s.min_interval = min(max(2 * s.min_interval, 0.1), self.max_interval)
+                elif self.utilization < self.shed_threshold - 0.2 and s.min_interval:
+                    s.min_interval = s.min_interval / 2 if s.min_interval > 0.1 else 0.0
+                else:
+                    continue
+                logger.info(f"Inference utilization {self.utilization:.2f}: '{s.name}' inference interval set to {s.min_interval:.2f}s")
+
+
+class MultiCameraRecognizer:
+    def __init__(self, sources : Sequence[Any], recognizer : FaceRecognizer, on_recognitions : Optional[Callable] = None, inference_workers : int = 1, track_faces : bool = True, gate_motion : bool = True, sessions : Optional[CameraSessionManager] = None, target_fps : Optional[float] = None, max_latency : float = 0.15):
+        """
+        Initialize MultiCameraRecognizer: one capture thread per source, one shared recognizer
+        (and so one shared gallery) for all the sources, and a fair scheduler over the inference workers
+
+        :param sources: Source uris ("0", "rtsp://...", "video.mp4"), or (uri, priority) tuples
+        :param recognizer: Recognizer shared by all the sources
+        :param on_recognitions: Optional callback(source, recognitions) called from the inference workers
+        :param inference_workers: Number of inference threads
+        :param track_faces: Track faces per source and re-encode them only on a schedule instead of on every frame
+        :param gate_motion: Skip detection on static scenes and detect around the previous faces between full scans
+        :param sessions: Camera session manager the streams are acquired from, so other users (enrollment) can
+                         share them while recognition runs (default: a private manager)
+        :param target_fps: Processed frames per second per source. When set, an AdaptiveController per source adjusts
+                           the detection scale, upsample count and frame stride, otherwise the recognizer settings are used
+        :param max_latency: Maximum seconds of one inference, with target_fps
+        """
+        self.sessions = sessions if sessions is not None else CameraSessionManager()
+        self.condition = self.sessions.condition
+        self.track_faces = track_faces
+        self.gate_motion = gate_motion
+        self.source_specs = [source if isinstance(source, tuple) else (source, 1.0) for source in sources]
+        self.sources = []
+        self.recognizer = recognizer
+        self.on_recognitions = on_recognitions
+        self.inference_workers = inference_workers
+        self.target_fps = target_fps
+        self.max_latency = max_latency
+        self.scheduler = FairScheduler(self.sources, self.condition, workers=inference_workers)
+
+        self.stop_flag = threading.Event()
+        self._threads = []
+
+    def _acquire_source(self, uri : Any, priority : float) -> CameraSource:
+        # The stream may already be running for another user, the recognition state is reset for this run
+        source = self.sessions.acquire(uri)
+        with self.condition:
+            source.priority = priority
+            source.tracker = FaceTracker() if self.track_faces else None
+            source.motion_gate = MotionGate() if self.gate_motion else None
+            source.controller = AdaptiveController(self.target_fps, self.max_latency, self.recognizer.scale, self.recognizer.upsample, name=source.name) if self.target_fps else None
+            source.stride = 1
+            source.last_inference_frame = 0
+            source.virtual_time = 0.0
+            source.min_interval = 0.0
+            source.last_inference_time = 0.0
+            source.in_inference = False
+        source.overlay_slot.clear()
+        return source
+
+    def start(self, open_timeout : float = 10.0) -> List[CameraSource]:
+        """
+        Acquire the streams from the session manager and start the inference workers
+
+        :param open_timeout: Seconds to wait for the sources to open
+        :return: List of the sources that opened successfully
+        """
+        self.stop_flag.clear()
+        self.sources = [self._acquire_source(uri, priority) for uri, priority in self.source_specs]
+        self.scheduler = FairScheduler(self.sources, self.condition, workers=self.inference_workers)
+
+        deadline = time.monotonic() + open_timeout
+        for source in self.sources:
+            source.opened.wait(max(deadline - time.monotonic(), 0))
+        opened = [source for source in self.sources if source.opened.is_set() and source.error is None]
+
+        for _ in range(self.inference_workers):
+            thread = threading.Thread(target=self.inference_worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return opened
+
+    def stop(self) -> None:
+        self.stop_flag.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
+
+        # The capture threads stop with the last user of their stream
+        for source in self.sources:
+            self.sessions.release(source)
+        self.sources = []
+
+    @property
+    def is_running(self) -> bool:
+        """True while at least one source is still capturing"""
+        return not self.stop_flag.is_set() and any(source.is_alive for source in self.sources)
+
+    def inference_worker(self) -> None:
+        """Inference stage: recognize the frame picked by the scheduler and publish the overlay of its source"""
+        while not self.stop_flag.is_set():
+            scheduled = self.scheduler.next(timeout=0.5)
+            if scheduled is None:
+                continue
+            source, frame = scheduled
+
+            controller = source.controller
+            settings = controller.settings if controller is not None else None
+            timings = {}
+            start = time.perf_counter()
+            try:
+                if settings is not None:
+                    recognitions = self.recognizer.recognize(frame, source.tracker, source.motion_gate, source.inference_buffers, settings.scale, settings.upsample, timings)
+                else:
+                    recognitions = self.recognizer.recognize(frame, source.tracker, source.motion_gate, source.inference_buffers)
+            finally:
+                duration = time.perf_counter() - start
+                # The source stays out of the scheduler until report(), its slot still holds the time of this frame
+                metrics.observe_stage("recognition_latency", time.time() - source.frame_slot.taken_time)
+                self.scheduler.report(source, duration)
+                metrics.observe_stage("inference", duration)
+
+            # Closed loop: the measured stage times and face sizes set the scale, upsample and stride of the next frames
+            if controller is not None:
+                source.stride = controller.update(frame.shape, timings, duration, recognitions, source.capture_rate.rate).stride
+
+            source.inference_rate.tick()
+            source.overlay_slot.put(recognitions)
+            if self.on_recognitions is not None:
+                self.on_recognitions(source, recognitions)
+
+    def next_render_frames(self, timeout : float) -> List[Tuple[CameraSource, Any]]:
+        """
+        Wait for new frames to display and take all of them
+
+        :param timeout: Maximum seconds to wait
+        :return: List of (source, frame), empty on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.stop_flag.is_set() or any(source.render_slot.depth for source in self.sources), timeout)
+            frames = [(source, source.render_slot.get(timeout=0)) for source in self.sources if source.render_slot.depth]
+        now = time.time()
+        for source, _ in frames:
+            metrics.observe_stage("render_latency", now - source.render_slot.taken_time)
+        return frames
+
+    def stats(self) -> dict:
+        """
+        :return: Dict {source name: source stats} plus the inference utilization
+        """
+        stats = {source.name: source.stats() for source in self.sources}
+        stats["utilization"] = round(self.scheduler.utilization, 3)
+        stats["faces_detected"] = self.recognizer.faces_detected
+        stats["faces_encoded"] = self.recognizer.faces_encoded
+        for source in self.sources:
+            if source.controller is not None:
+                stats[source.name]["controller"] = source.controller.stats()
+        return stats
+
+    def decision_log(self) -> List[dict]:
+        """
+        :return: Decisions of the adaptive controllers of all the sources, oldest first
+        """
+        decisions = [decision for source in self.sources if source.controller is not None for decision in source.controller.decision_log()]
+        return sorted(decisions, key=lambda decision: decision["time"])
+
+    def publish_metrics(self) -> None:
+        """
+        Copy the per-stream rates and pipeline counters into the metrics registry gauges
+        """
+        for source in self.sources:
+            metrics.set_gauge("capture_fps", source.capture_rate.rate, source=source.name)
+            metrics.set_gauge("inference_fps", source.inference_rate.rate, source=source.name)
+            metrics.set_gauge("display_fps", source.display_rate.rate, source=source.name)
+            if source.controller is not None:
+                metrics.set_gauge("detection_scale", source.controller.settings.scale, source=source.name)
+                metrics.set_gauge("detection_upsample", source.controller.settings.upsample, source=source.name)
+                metrics.set_gauge("inference_stride", source.controller.settings.stride, source=source.name)
+            metrics.set_gauge("frames_dropped", source.frame_slot.stats()["dropped"], source=source.name, stage="inference")
+            metrics.set_gauge("frames_dropped", source.render_slot.stats()["dropped"], source=source.name, stage="render")
+        metrics.set_gauge("inference_utilization", self.scheduler.utilization)
+        metrics.set_gauge("faces_detected", self.recognizer.faces_detected)
+        metrics.set_gauge("faces_encoded", self.recognizer.faces_encoded)
+        metrics.set_gauge("gallery_size", len(self.recognizer.matcher))
@@ -0,0 +1,196 @@
+from typing import List, Any, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import shared_memory
+import multiprocessing
+import os
+import threading
+import numpy as np
+
+ENCODING_SIZE = 128
+
+# Worker process state: the dlib models are loaded once by the initializer and the
+# shared memory blocks are attached once per block name
+_worker_blocks = {}
+
+
+def _attach(name : str) -> shared_memory.SharedMemory:
+    try:
+        # Python >= 3.13: the creating process owns the block, the worker must not unlink it on exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker() -> None:
+    """Load the face_recognition models once per worker process"""
+    import face_recognition
+    face_recognition.face_encodings(np.zeros((64, 64, 3), dtype=np.uint8), [(8, 56, 56, 8)])
+
+
+def _encode_shard(frame_name : str, frame_shape : Tuple[int, ...], output_name : str, capacity : int, face_locations : List[tuple], first_row : int, num_jitters : int, model : str = "small") -> int:
+    """
+    Encode a shard of the faces of a frame read from shared memory, results are written in shared memory
+
+    :param frame_name: Shared memory block holding the RGB frame
+    :param frame_shape: Shape of the frame
+    :param output_name: Shared memory block of the (capacity, 128) float64 output matrix
+    :param capacity: Number of rows of the output matrix
+    :param face_locations: (top, right, bottom, left) boxes of the shard
+    :param first_row: Output row of the first face of the shard
+    :param num_jitters: face_recognition num_jitters
+    :param model: face_recognition landmark model, "small" or "large"
+    :return: Number of encoded faces
+    """
+    import face_recognition
+
+    for name in (frame_name, output_name):
+        if name not in _worker_blocks:
+            _worker_blocks[name] = _attach(name)
+
+    frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=_worker_blocks[frame_name].buf)
+    output = np.ndarray((capacity, ENCODING_SIZE), dtype=np.float64, buffer=_worker_blocks[output_name].buf)
+
+    encodings = face_recognition.face_encodings(frame, face_locations, num_jitters=num_jitters, model=model)
+    output[first_row:first_row + len(encodings)] = encodings
+    return len(encodings)
+
+
+class _FrameBlock:
+    def __init__(self, frame_bytes : int, capacity : int):
+        """
+        Shared memory input (frame) and output (encodings) buffers of one in-flight frame
+        """
+        self.frame = shared_memory.SharedMemory(create=True, size=frame_bytes)
+        self.output = shared_memory.SharedMemory(create=True, size=capacity * ENCODING_SIZE * 8)
+        self.frame_bytes = frame_bytes
+        self.capacity = capacity
+
+    def close(self) -> None:
+        for block in (self.frame, self.output):
+            block.close()
+            block.unlink()
+
+
+class EncodingJob:
+    def __init__(self, encoder : "ParallelFaceEncoder", block : _FrameBlock, futures : List[Future], face_count : int):
+        """
+        Handle of a frame submitted to ParallelFaceEncoder
+        """
+        self._encoder = encoder
+        self._block = block
+        self._futures = futures
+        self._face_count = face_count
+        self._result = None
+
+    def done(self) -> bool:
+        return all(future.done() for future in self._futures)
+
+    def result(self) -> List[np.ndarray]:
+        """
+        Wait for the frame and return its encodings in the order of the submitted face locations
+
+        :return: List of 128-d float64 encodings, identical to face_recognition.face_encodings
+        """
+        if self._result is None:
+            try:
+                encoded = sum(future.result() for future in self._futures)
+                if encoded != self._face_count:
+                    raise RuntimeError(f"Expected {self._face_count} encodings, got {encoded}")
+                output = np.ndarray((self._block.capacity, ENCODING_SIZE), dtype=np.float64, buffer=self._block.output.buf)
+                self._result = [output[row].copy() for row in range(self._face_count)]
+            finally:
+                self._encoder._release(self._block)
+        return self._result
+
+
+class ParallelFaceEncoder:
+    def __init__(self, workers : Optional[int] = None, max_in_flight : Optional[int] = None, max_faces_per_frame : int = 64, num_jitters : int = 1, model : str = "small"):
+        """
+        Initialize ParallelFaceEncoder: face_recognition.face_encodings sharded across a warm process pool.
+        The faces of a frame are split across the workers and consecutive frames can be in flight at the same time.
+        Frames and encodings travel through shared memory, only the face boxes are pickled.
+
+        :param workers: Number of worker processes (None = number of CPUs)
+        :param max_in_flight: Maximum number of frames submitted and not collected yet (None = 2 per worker)
+        :param max_faces_per_frame: Maximum number of faces encoded per frame
+        :param num_jitters: face_recognition num_jitters
+        :param model: face_recognition landmark model, "small" or "large"
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_faces_per_frame = max_faces_per_frame
+        self.num_jitters = num_jitters
+        self.model = model
+        self.max_in_flight = max_in_flight or 2 * self.workers
+
+        # spawn: same behaviour on every platform and no fork of a process that runs OpenCV / Flet threads
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker)
+        self._free_blocks = []
+        self._all_blocks = []
+        self._blocks_available = threading.Semaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+
+    def submit(self, rgb_frame : Any, face_locations : Sequence[tuple]) -> EncodingJob:
+        """
+        Submit the faces of a frame for encoding, blocks while max_in_flight frames are pending
+        (a single producer thread must collect its oldest job before submitting more than max_in_flight frames)
+
+        :param rgb_frame: RGB uint8 frame
+        :param face_locations: (top, right, bottom, left) boxes as returned by face_recognition.face_locations
+        :return: EncodingJob whose result() are the encodings in the order of face_locations
+        """
+        face_locations = [tuple(int(value) for value in location) for location in face_locations[:self.max_faces_per_frame]]
+        frame = np.ascontiguousarray(rgb_frame, dtype=np.uint8)
+        block = self._acquire(frame.nbytes)
+
+        # The only copy of the frame: into the shared memory block read by the workers
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=block.frame.buf)[...] = frame
+
+        futures = []
+        shard_count = min(self.workers, len(face_locations))
+        for shard in range(shard_count):
+            first = shard * len(face_locations) // shard_count
+            last = (shard + 1) * len(face_locations) // shard_count
+            futures.append(self._executor.submit(
+                _encode_shard, block.frame.name, frame.shape, block.output.name, block.capacity,
+                face_locations[first:last], first, self.num_jitters, self.model
+            ))
+
+        return EncodingJob(self, block, futures, len(face_locations))
+
+    def encode(self, rgb_frame : Any, face_locations : Sequence[tuple]) -> List[np.ndarray]:
+        """
+        Drop-in replacement of face_recognition.face_encodings(rgb_frame, face_locations)
+
+        :return: List of 128-d encodings in the order of face_locations
+        """
+        if len(face_locations) == 0:
+            return []
+        return self.submit(rgb_frame, face_locations).result()
+
+    def close(self) -> None:
+        """
+        Stop the worker processes and free the shared memory
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for block in self._all_blocks:
+                block.close()
+            self._all_blocks = []
+            self._free_blocks = []
+
+    def _acquire(self, frame_bytes : int) -> _FrameBlock:
+        self._blocks_available.acquire()
+        with self._lock:
+            # Reuse a free block big enough for the frame, blocks are allocated once per camera resolution
+            for block in self._free_blocks:
+                if block.frame_bytes >= frame_bytes:
+                    self._free_blocks.remove(block)
+                    return block
+            block = _FrameBlock(frame_bytes, self.max_faces_per_frame)
+            self._all_blocks.append(block)
+            return block
+
+    def _release(self, block : _FrameBlock) -> None:
+        with self._lock:
+            self._free_blocks.append(block)
+        self._blocks_available.release()
@@ -0,0 +1,699 @@
+"""
+Capture, inference and display in separate processes, so dlib inference, OpenCV decoding and the Flet UI
+do not share one GIL.
+
+    capture process (one per source)  --frames-->   inference process (all sources)  --results-->  UI process
+                                      --frames-------------------------------------------------->  (render)
+
+Frames are decoded straight into a SharedRing of the source and never copied again: the inference process
+and the render loop of the UI process read them in place. Recognitions are written the same way into a
+result ring. Only FrameDescriptor tuples (sequence, slot, shape, capture timestamp) travel over the pipes.
+ProcessCameraRecognizer has the interface of MultiCameraRecognizer used by the app.
+"""
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple
+from collections import deque
+from multiprocessing.connection import wait
+import multiprocessing
+import os
+import threading
+import time
+import numpy as np
+from config import setup_logger
+from src.business_logic.camera_session import RateMeter, source_key
+from src.utils.frame_buffers import FrameBuffers
+from src.utils.latest_slot import LatestSlot
+from src.utils.metrics import metrics
+from src.utils.shared_ring import FrameDescriptor, RingSpec, SharedRing
+
+logger = setup_logger(__name__)
+
+MAX_RESULTS = 64  # Faces per frame sent back to the UI
+# A name longer than the field (UTF-8 bytes) is sent with the result message instead, never truncated
+RESULT_DTYPE = np.dtype([
+    ("top", np.int32), ("right", np.int32), ("bottom", np.int32), ("left", np.int32),
+    ("distance", np.float32), ("track_id", np.int32), ("name", "S64")
+])
+
+
+class TrackSnapshot(NamedTuple):
+    """
+    Active face tracks of a source, as last reported by the tracker of the inference process
+
+    :param active_track_ids: Ids of the tracks alive after the last processed frame
+    """
+    active_track_ids: Tuple[int, ...] = ()
+
+
+def _capture_main(uri : Any, ring_spec : RingSpec, connections : Sequence[Any], stop_event : Any, is_file : bool) -> None:
+    """
+    Capture process: decode the frames of one source into its ring and send their descriptors to every consumer
+
+    :param uri: Source uri
+    :param ring_spec: Frame ring of the source
+    :param connections: Pipe ends of the consumers, the last one is the UI (it also gets the status messages)
+    :param stop_event: Set by the UI process to stop
+    :param is_file: The source is a video file, paced at its native rate so it behaves like a live stream
+    """
+    import cv2
+
+    ring = SharedRing.attach(ring_spec)
+    status = connections[-1]
+    cap = cv2.VideoCapture(source_key(uri))
+    if not cap.isOpened():
+        status.send(("error", "Unable to access the camera"))
+        ring.close()
+        return
+    status.send(("opened", None))
+
+    frame_interval = 0.0
+    if is_file:
+        file_fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / file_fps if file_fps and file_fps > 0 else 1.0 / 30
+
+    # Known resolution: even the first frame is decoded in place
+    shape = None
+    height, width = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    if 0 < height * width * 3 <= ring_spec.slot_bytes:
+        shape = (height, width, 3)
+    sequence = 0
+    copies = 0
+    capture_rate = RateMeter()
+    error = None
+    next_frame_time = time.monotonic()
+    last_stats_time = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            slot = ring.reserve()
+            if slot is None:
+                # Every slot is pinned by a consumer: the frame is dropped, the stream keeps its pace
+                if not cap.grab():
+                    error = "End of stream" if is_file else "Failed to read frame"
+                    break
+            else:
+                # Decoded straight into the slot, the ring is the only memory a frame is ever written to.
+                # A frame of another resolution is decoded by OpenCV and copied once
+                target = ring.array(slot, shape) if shape is not None else None
+                ret, frame = cap.read(target) if target is not None else cap.read()
+                if not ret:
+                    error = "End of stream" if is_file else "Failed to read frame"
+                    break
+                if target is None or not np.shares_memory(frame, target):
+                    if frame.nbytes > ring_spec.slot_bytes:
+                        error = f"Frame of {frame.shape} larger than the ring slots"
+                        break
+                    shape = frame.shape
+                    ring.array(slot, shape)[...] = frame
+                    copies += 1
+                del target, frame
+
+                sequence += 1
+                capture_rate.tick()
+                ring.publish(slot, sequence)
+                descriptor = FrameDescriptor(sequence, slot, shape, time.time())
+                for connection in connections:
+                    connection.send(("frame", descriptor))
+
+            now = time.monotonic()
+            if now - last_stats_time >= 1.0:
+                status.send(("stats", {"copies": copies, "ring_full": ring.full_count, "frames": sequence, "fps": capture_rate.rate}))
+                last_stats_time = now
+
+            # Video files are paced at their native rate so they behave like a live stream
+            if frame_interval:
+                next_frame_time += frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.monotonic()
+    except (BrokenPipeError, EOFError):
+        # A consumer went away: the pipeline is stopping
+        pass
+    finally:
+        cap.release()
+        try:
+            status.send(("stats", {"copies": copies, "ring_full": ring.full_count, "frames": sequence, "fps": capture_rate.rate}))
+            if error is not None:
+                status.send(("error", error))
+        except (BrokenPipeError, EOFError, OSError):
+            pass
+        ring.close()
+
+
+class _InferenceSource:
+    def __init__(self, index : int, name : str, priority : float, ring_spec : RingSpec, connection : Any):
+        """
+        State of one source in the inference process
+        """
+        self.index = index
+        self.name = name
+        self.priority = priority
+        self.ring = SharedRing.attach(ring_spec)
+        self.connection = connection
+        self.pending = None
+        self.ended = False
+        self.last_sequence = 0
+        self.virtual_time = 0.0
+        self.stride = 1
+        self.tracker = None
+        self.motion_gate = None
+        self.controller = None
+        self.buffers = FrameBuffers()
+        self.capture_fps = 0.0  # From the sequence numbers and capture times of the processed frames
+        self.last_timestamp = 0.0
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+
+def _inference_main(sources : Sequence[Tuple[str, float, RingSpec, Any]], result_spec : RingSpec, result_connection : Any, stop_event : Any, options : dict) -> None:
+    """
+    Inference process: recognize the latest frame of the sources in weighted fair order, in place in their rings,
+    and write the recognitions into the result ring
+
+    :param sources: (name, priority, frame ring spec, receiving pipe end) of every source
+    :param result_spec: Result ring, read by the UI process
+    :param result_connection: Pipe end the result descriptors and the stats are sent to
+    :param stop_event: Set by the UI process to stop
+    :param options: gallery_dir, data_file, tolerance, profile, target_fps, max_latency, track_faces, gate_motion, gallery_index
+    """
+    try:
+        from src.business_logic.add_known_face import FaceAdder
+        from src.business_logic.adaptive_controller import AdaptiveController
+        from src.business_logic.ann_index import make_index
+        from src.business_logic.face_tracker import FaceTracker
+        from src.business_logic.gallery_matcher import GalleryMatcher
+        from src.business_logic.motion_gate import MotionGate
+        from src.business_logic.recognizer import FaceRecognizer
+
+        # The gallery is loaded from disk, enrollments of the UI process are picked up by reload_if_changed
+        face_adder = FaceAdder(data_file=options["data_file"], gallery_dir=options["gallery_dir"], matcher=GalleryMatcher(index=make_index(options["gallery_index"]), tolerance=options["tolerance"]), profile=options["profile"])
+        face_adder.load_known_faces()
+        recognizer = FaceRecognizer(face_adder.matcher, profile=face_adder.profile)
+    except Exception as e:
+        result_connection.send(("error", f"Failed to load the face recognition models: {e}"))
+        return
+
+    states = [_InferenceSource(index, *source) for index, source in enumerate(sources)]
+    for state in states:
+        state.tracker = FaceTracker() if options["track_faces"] else None
+        state.motion_gate = MotionGate() if options["gate_motion"] else None
+        if options["target_fps"]:
+            state.controller = AdaptiveController(options["target_fps"], options["max_latency"], recognizer.scale, recognizer.upsample, name=state.name)
+
+    result_ring = SharedRing.attach(result_spec)
+    result_sequence = 0
+    busy_time = 0.0
+    window_start = last_stats_time = time.monotonic()
+    decisions_sent = {state.index: 0 for state in states}
+
+    try:
+        while not stop_event.is_set() and not all(state.ended for state in states):
+            # Keep only the latest descriptor of every source, older frames are left to the producer
+            ready = wait([state.connection for state in states if not state.ended], timeout=0.1)
+            for state in states:
+                if state.connection not in ready:
+                    continue
+                try:
+                    while state.connection.poll():
+                        kind, payload = state.connection.recv()
+                        if kind == "frame":
+                            state.received += 1
+                            if state.pending is not None:
+                                state.dropped += 1
+                            state.pending = payload
+                except (EOFError, OSError):
+                    state.ended = True
+
+            # Weighted fair order: the source that used the least inference time runs next, the stride
+            # of its controller skips frames
+            eligible = [state for state in states if state.pending is not None and state.pending.sequence - state.last_sequence >= state.stride]
+            if eligible:
+                state = min(eligible, key=lambda s: s.virtual_time)
+                descriptor, state.pending = state.pending, None
+                if not state.ring.lease(descriptor):
+                    # The producer already reused the slot of this frame
+                    state.dropped += 1
+                    continue
+
+                settings = state.controller.settings if state.controller is not None else None
+                timings = {}
+                start = time.perf_counter()
+                try:
+                    # In place: the frame is read from the ring by the preprocessing, never copied
+                    frame = state.ring.array(descriptor.slot, descriptor.shape)
+                    if settings is not None:
+                        recognitions = recognizer.recognize(frame, state.tracker, state.motion_gate, state.buffers, settings.scale, settings.upsample, timings)
+                    else:
+                        recognitions = recognizer.recognize(frame, state.tracker, state.motion_gate, state.buffers)
+                    del frame
+                finally:
+                    state.ring.release(descriptor.slot)
+                duration = time.perf_counter() - start
+                busy_time += duration
+                state.virtual_time += duration / max(state.priority, 1e-6)
+                if state.last_sequence and descriptor.timestamp > state.last_timestamp:
+                    capture_fps = (descriptor.sequence - state.last_sequence) / (descriptor.timestamp - state.last_timestamp)
+                    state.capture_fps = capture_fps if not state.capture_fps else 0.8 * state.capture_fps + 0.2 * capture_fps
+                state.last_sequence = descriptor.sequence
+                state.last_timestamp = descriptor.timestamp
+                state.processed += 1
+
+                if state.controller is not None:
+                    state.stride = state.controller.update(descriptor.shape, timings, duration, recognitions, state.capture_fps).stride
+
+                slot = result_ring.reserve()
+                if slot is not None:
+                    rows = result_ring.array(slot, (MAX_RESULTS,), RESULT_DTYPE)
+                    count = min(len(recognitions), MAX_RESULTS)
+                    long_names = {}
+                    for i, (row, recognition) in enumerate(zip(rows, recognitions[:count])):
+                        row["top"], row["right"], row["bottom"], row["left"] = recognition.location
+                        row["distance"] = min(recognition.distance, np.finfo(np.float32).max)
+                        row["track_id"] = recognition.track_id
+                        name = recognition.name.encode("utf-8")
+                        if len(name) > RESULT_DTYPE["name"].itemsize:
+                            long_names[i] = recognition.name
+                            name = b""
+                        row["name"] = name
+                    del rows
+                    result_sequence += 1
+                    result_ring.publish(slot, result_sequence)
+                    active_tracks = tuple(state.tracker.active_track_ids) if state.tracker is not None else None
+                    result_connection.send(("result", state.index, FrameDescriptor(result_sequence, slot, (MAX_RESULTS,), descriptor.timestamp, count), active_tracks, duration, long_names))
+
+            now = time.monotonic()
+            if now - last_stats_time >= 1.0:
+                face_adder.gallery.reload_if_changed()
+                utilization = busy_time / (now - window_start)
+                busy_time, window_start = 0.0, now
+                source_stats = {}
+                for state in states:
+                    source_stats[state.index] = {
+                        "inference": {"depth": int(state.pending is not None), "put": state.received, "taken": state.processed, "dropped": state.dropped},
+                        "motion": state.motion_gate.stats() if state.motion_gate is not None else None,
+                        "controller": state.controller.stats() if state.controller is not None else None,
+                        "decisions": state.controller.decision_log()[decisions_sent[state.index]:] if state.controller is not None else []
+                    }
+                    decisions_sent[state.index] += len(source_stats[state.index]["decisions"])
+                result_connection.send(("stats", {
+                    "sources": source_stats,
+                    "utilization": utilization,
+                    "faces_detected": recognizer.faces_detected,
+                    "faces_encoded": recognizer.faces_encoded,
+                    "gallery_size": len(recognizer.matcher)
+                }))
+                last_stats_time = now
+    except (BrokenPipeError, EOFError):
+        pass
+    finally:
+        for state in states:
+            state.ring.close()
+        result_ring.close()
+
+
+class BusSource:
+    def __init__(self, uri : Any, name : Optional[str] = None, priority : float = 1.0):
+        """
+        UI process side of a source captured by its own process: the render loop reads its frames
+        in place from its ring, the recognitions arrive from the inference process
+
+        :param uri: USB camera index, stream URL or video file path
+        :param name: Display name of the source (default: the uri)
+        :param priority: Kept for the interface of CameraSource, the inference process schedules the sources fairly
+        """
+        self.uri = source_key(uri)
+        self.name = name or str(uri)
+        self.priority = priority
+        self.ring = None
+        self.connection = None
+        self.process = None
+
+        self.overlay_slot = LatestSlot(f"{self.name} overlay")
+        self.display_buffers = FrameBuffers()
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.display_rate = RateMeter()
+        self.tracker = None  # TrackSnapshot of the inference process tracker
+
+        self.opened = threading.Event()
+        self.error = None
+        self.ended = False
+        self.capture_stats = {}
+        self.inference_stats = {}
+        self.frames_received = 0
+        self.frames_rendered = 0
+        self.frames_stale = 0
+        self.frame_count = 0
+
+        self._render_slot = None  # Slot leased by the render loop, released at the next render frame
+        self._burst = None
+        self._burst_count = 0
+        self._burst_skip = 0
+        self._frame_ready = threading.Condition()
+
+    @property
+    def is_alive(self) -> bool:
+        return not self.ended and self.process is not None and self.process.is_alive()
+
+    def burst(self, count : int, timeout : float, skip_frames : int = 0) -> List[np.ndarray]:
+        """
+        Sample consecutive new frames of the running stream (enrollment), filled by the render loop
+
+        :param count: Number of frames to collect
+        :param timeout: Maximum seconds for the whole burst
+        :param skip_frames: Frames to let pass since the camera opened
+        :return: List of frames, shorter than count if the stream ended or the timeout elapsed
+        """
+        with self._frame_ready:
+            self._burst, self._burst_count, self._burst_skip = [], count, skip_frames
+            self._frame_ready.wait_for(lambda: len(self._burst) >= count or not self.is_alive, timeout)
+            frames, self._burst = self._burst, None
+        return frames
+
+    def offer(self, sequence : int, frame : np.ndarray) -> None:
+        """Render loop: hand a frame to a pending burst"""
+        if self._burst is None:
+            return
+        with self._frame_ready:
+            if self._burst is not None and len(self._burst) < self._burst_count and sequence > self._burst_skip:
+                # Enrollment keeps its frames after the slot is released: the one copy out of the ring
+                self._burst.append(frame.copy())
+                self._frame_ready.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "capture_fps": round(self.capture_rate.rate, 2),
+            "inference_fps": round(self.inference_rate.rate, 2),
+            "display_fps": round(self.display_rate.rate, 2),
+            "min_interval": 0.0,
+            "error": self.error,
+            "motion": self.inference_stats.get("motion"),
+            "inference": self.inference_stats.get("inference", {"depth": 0, "put": 0, "taken": 0, "dropped": 0}),
+            "render": {"depth": 0, "put": self.frames_received, "taken": self.frames_rendered, "dropped": self.frames_received - self.frames_rendered},
+            "stale": self.frames_stale,
+            "copies": self.capture_stats.get("copies", 0),
+            "ring_full": self.capture_stats.get("ring_full", 0)
+        }
+
+
+class ProcessCameraRecognizer:
+    def __init__(self, sources : Sequence[Any], on_recognitions : Optional[Callable] = None, gallery_dir : str = "known_faces_gallery", data_file : str = "known_faces.pkl", tolerance : float = 0.6, profile : Optional[Any] = None, target_fps : Optional[float] = None, max_latency : float = 0.15, track_faces : bool = True, gate_motion : bool = True, sessions : Optional[Any] = None, max_frame_size : Tuple[int, int] = (1080, 1920), ring_slots : int = 4, gallery_index : str = "exact"):
+        """
+        Initialize ProcessCameraRecognizer: one capture process per source and one inference process,
+        connected to this (UI) process by shared memory rings. Same interface as MultiCameraRecognizer
+
+        :param sources: Source uris ("0", "rtsp://...", "video.mp4"), or (uri, priority) tuples
+        :param on_recognitions: Optional callback(source, recognitions) called from the result receiver thread
+        :param gallery_dir: Gallery the inference process loads, and reloads when it changes on disk
+        :param data_file: Legacy pickle migrated if the gallery does not exist
+        :param tolerance: Matching tolerance of the inference process
+        :param profile: Detector and encoder profile of the inference process (default: the host profile file)
+        :param target_fps: Processed frames per second per source, see MultiCameraRecognizer
+        :param max_latency: Maximum seconds of one inference, with target_fps
+        :param track_faces: Track faces per source and re-encode them only on a schedule
+        :param gate_motion: Skip detection on static scenes and detect around the previous faces between full scans
+        :param sessions: Optional CameraSessionManager for the streams this pipeline does not capture (enrollment
+                         from another camera), see acquire
+        :param max_frame_size: (height, width) of the largest frame, sets the size of the ring slots
+        :param ring_slots: Slots per frame ring: one per consumer (inference, render) plus two free for the producer
+        :param gallery_index: Candidate index of the gallery of the inference process (see ann_index.make_index)
+        """
+        self.source_specs = [source if isinstance(source, tuple) else (source, 1.0) for source in sources]
+        self.sources = []
+        self.on_recognitions = on_recognitions
+        self.options = {
+            "gallery_dir": gallery_dir, "data_file": data_file, "tolerance": tolerance, "profile": profile,
+            "target_fps": target_fps, "max_latency": max_latency, "track_faces": track_faces, "gate_motion": gate_motion,
+            "gallery_index": gallery_index
+        }
+        self.sessions = sessions
+        self.max_frame_size = max_frame_size
+        self.ring_slots = ring_slots
+
+        self.utilization = 0.0
+        self.faces_detected = 0
+        self.faces_encoded = 0
+        self.gallery_size = 0
+        self.error = None
+        self.decisions = deque(maxlen=10000)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = None
+        self._inference_process = None
+        self._result_ring = None
+        self._result_connection = None
+        self._receiver = None
+        self._stopped = threading.Event()
+
+    def start(self, open_timeout : float = 10.0) -> List[BusSource]:
+        """
+        Start the capture and inference processes
+
+        :param open_timeout: Seconds to wait for the sources to open
+        :return: List of the sources that opened successfully
+        """
+        self._stopped.clear()
+        self._stop_event = self._context.Event()
+        height, width = self.max_frame_size
+        inference_inputs = []
+        self.sources = []
+        for uri, priority in self.source_specs:
+            source = BusSource(uri, priority=priority)
+            source.ring = SharedRing.create(height * width * 3, self.ring_slots, self._context)
+            inference_end, inference_send = self._context.Pipe(duplex=False)
+            source.connection, ui_send = self._context.Pipe(duplex=False)
+
+            is_file = isinstance(source.uri, str) and os.path.isfile(source.uri)
+            source.process = self._context.Process(target=_capture_main, args=(source.uri, source.ring.spec, [inference_send, ui_send], self._stop_event, is_file), daemon=True, name=f"capture {source.name}")
+            source.process.start()
+            # The children own the sending ends: a dead process shows up as EOF on the receiving end
+            inference_send.close()
+            ui_send.close()
+            inference_inputs.append((source.name, priority, source.ring.spec, inference_end))
+            self.sources.append(source)
+
+        self._result_ring = SharedRing.create(MAX_RESULTS * RESULT_DTYPE.itemsize, self.ring_slots, self._context)
+        self._result_connection, result_send = self._context.Pipe(duplex=False)
+        self._inference_process = self._context.Process(target=_inference_main, args=(inference_inputs, self._result_ring.spec, result_send, self._stop_event, self.options), daemon=True, name="inference")
+        self._inference_process.start()
+        result_send.close()
+        for _, _, _, inference_end in inference_inputs:
+            inference_end.close()
+
+        self._receiver = threading.Thread(target=self._receive_results, daemon=True)
+        self._receiver.start()
+
+        # The first message of a capture process tells whether its source opened
+        deadline = time.monotonic() + open_timeout
+        for source in self.sources:
+            if source.connection.poll(max(deadline - time.monotonic(), 0)):
+                self._handle_status(source, *source.connection.recv())
+        return [source for source in self.sources if source.opened.is_set() and source.error is None]
+
+    def stop(self) -> None:
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        self._stopped.set()
+        processes = [source.process for source in self.sources] + [self._inference_process]
+        for process in processes:
+            if process is not None:
+                process.join(timeout=5.0)
+                if process.is_alive():
+                    process.terminate()
+        if self._receiver is not None:
+            self._receiver.join(timeout=1.0)
+
+        for source in self.sources:
+            source.ended = True
+            with source._frame_ready:
+                source._frame_ready.notify_all()
+            if source._render_slot is not None:
+                source.ring.release(source._render_slot)
+                source._render_slot = None
+            source.connection.close()
+            source.ring.close()
+        self._result_connection.close()
+        self._result_ring.close()
+        self._stop_event = None
+        self.sources = []
+
+    @property
+    def is_running(self) -> bool:
+        """True while at least one source is still capturing"""
+        return not self._stopped.is_set() and any(source.is_alive for source in self.sources)
+
+    def next_render_frames(self, timeout : float) -> List[Tuple[BusSource, np.ndarray]]:
+        """
+        Wait for new frames to display and take the latest one of every source. The frames are views
+        of the rings, valid until the next call (their slots stay leased until then)
+
+        :param timeout: Maximum seconds to wait
+        :return: List of (source, frame), empty on timeout
+        """
+        connections = {source.connection: source for source in self.sources if not source.ended}
+        if not connections:
+            time.sleep(min(timeout, 0.1))
+            return []
+
+        frames = []
+        for connection in wait(list(connections), timeout):
+            source = connections[connection]
+            latest = None
+            try:
+                while connection.poll():
+                    kind, payload = connection.recv()
+                    if kind == "frame":
+                        source.frames_received += 1
+                        latest = payload
+                    else:
+                        self._handle_status(source, kind, payload)
+            except (EOFError, OSError):
+                source.ended = True
+            if latest is None:
+                continue
+
+            # The previous frame was drawn and encoded by now: its slot goes back to the producer
+            if source._render_slot is not None:
+                source.ring.release(source._render_slot)
+                source._render_slot = None
+            if not source.ring.lease(latest):
+                source.frames_stale += 1
+                continue
+            source._render_slot = latest.slot
+            source.frames_rendered += 1
+            source.frame_count = latest.sequence
+            frame = source.ring.array(latest.slot, latest.shape)
+            metrics.observe_stage("render_latency", time.time() - latest.timestamp)
+            source.offer(latest.sequence, frame)
+            frames.append((source, frame))
+        return frames
+
+    def acquire(self, uri : Any, name : Optional[str] = None) -> Any:
+        """
+        CameraSessionManager interface for enrollment: a stream captured by this pipeline is sampled through
+        its ring (its camera is held by the capture process), any other stream is opened by the sessions
+
+        :param uri: USB camera index, stream URL or video file path
+        :param name: Display name if the stream has to be opened
+        :return: BusSource or CameraSource, to give back with release
+        """
+        for source in self.sources:
+            if source.uri == source_key(uri) and source.is_alive:
+                return source
+        if self.sessions is None:
+            from src.business_logic.camera_session import CameraSessionManager
+            self.sessions = CameraSessionManager()
+        return self.sessions.acquire(uri, name)
+
+    def release(self, source : Any, timeout : float = 1.0) -> None:
+        if not isinstance(source, BusSource):
+            self.sessions.release(source, timeout)
+
+    def stats(self) -> dict:
+        """
+        :return: Dict {source name: source stats} plus the inference utilization, like MultiCameraRecognizer.stats
+        """
+        stats = {source.name: source.stats() for source in self.sources}
+        stats["utilization"] = round(self.utilization, 3)
+        stats["faces_detected"] = self.faces_detected
+        stats["faces_encoded"] = self.faces_encoded
+        for source in self.sources:
+            if source.inference_stats.get("controller"):
+                stats[source.name]["controller"] = source.inference_stats["controller"]
+        return stats
+
+    def decision_log(self) -> List[dict]:
+        """
+        :return: Decisions of the adaptive controllers of the inference process, oldest first
+        """
+        return sorted(self.decisions, key=lambda decision: decision["time"])
+
+    def publish_metrics(self) -> None:
+        """
+        Copy the per-stream rates and pipeline counters into the metrics registry gauges
+        """
+        for source in self.sources:
+            stats = source.stats()
+            metrics.set_gauge("capture_fps", source.capture_rate.rate, source=source.name)
+            metrics.set_gauge("inference_fps", source.inference_rate.rate, source=source.name)
+            metrics.set_gauge("display_fps", source.display_rate.rate, source=source.name)
+            controller = source.inference_stats.get("controller")
+            if controller:
+                metrics.set_gauge("detection_scale", controller["scale"], source=source.name)
+                metrics.set_gauge("detection_upsample", controller["upsample"], source=source.name)
+                metrics.set_gauge("inference_stride", controller["stride"], source=source.name)
+            metrics.set_gauge("frames_dropped", stats["inference"]["dropped"], source=source.name, stage="inference")
+            metrics.set_gauge("frames_dropped", stats["render"]["dropped"], source=source.name, stage="render")
+            metrics.set_gauge("frame_copies", stats["copies"], source=source.name)
+        metrics.set_gauge("inference_utilization", self.utilization)
+        metrics.set_gauge("faces_detected", self.faces_detected)
+        metrics.set_gauge("faces_encoded", self.faces_encoded)
+        metrics.set_gauge("gallery_size", self.gallery_size)
+
+    def _handle_status(self, source : BusSource, kind : str, payload : Any) -> None:
+        if kind == "opened":
+            source.opened.set()
+        elif kind == "stats":
+            # Measured by the capture process, the descriptors arrive here in batches
+            source.capture_stats = payload
+            source.capture_rate.rate = payload["fps"]
+        elif kind == "error":
+            source.error = payload
+            source.opened.set()
+            logger.info(f"Source '{source.name}': {payload}")
+
+    def _receive_results(self) -> None:
+        """Receiver thread: read the recognitions from the result ring and publish them like the inference workers do"""
+        from src.business_logic.recognizer import Recognition
+
+        while not self._stopped.is_set():
+            try:
+                if not self._result_connection.poll(0.5):
+                    continue
+                message = self._result_connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == "stats":
+                self._update_stats(message[1])
+                continue
+            if message[0] == "error":
+                self.error = message[1]
+                logger.error(message[1])
+                for source in self.sources:
+                    source.error = source.error or message[1]
+                continue
+
+            _, index, descriptor, active_tracks, duration, long_names = message
+            if not self._result_ring.lease(descriptor):
+                continue
+            try:
+                rows = self._result_ring.array(descriptor.slot, descriptor.shape, RESULT_DTYPE)[:descriptor.count]
+                recognitions = [
+                    Recognition((int(row["top"]), int(row["right"]), int(row["bottom"]), int(row["left"])), long_names.get(i) or row["name"].decode("utf-8"), float(row["distance"]), int(row["track_id"]))
+                    for i, row in enumerate(rows)
+                ]
+                del rows
+            finally:
+                self._result_ring.release(descriptor.slot)
+
+            source = self.sources[index]
+            metrics.observe_stage("recognition_latency", time.time() - descriptor.timestamp)
+            metrics.observe_stage("inference", duration)
+            if active_tracks is not None:
+                source.tracker = TrackSnapshot(active_tracks)
+            source.inference_rate.tick()
+            source.overlay_slot.put(recognitions)
+            if self.on_recognitions is not None:
+                self.on_recognitions(source, recognitions)
+
+    def _update_stats(self, stats : dict) -> None:
+        self.utilization = stats["utilization"]
+        self.faces_detected = stats["faces_detected"]
+        self.faces_encoded = stats["faces_encoded"]
+        self.gallery_size = stats["gallery_size"]
+        for index, source_stats in stats["sources"].items():
+            self.decisions.extend(source_stats.pop("decisions"))
+            self.sources[index].inference_stats = source_stats
@@ -0,0 +1,319 @@
+"""
+Client of the local recognition service (see recognition_service), and the matcher / gallery adapters that let
+the kiosk app, FaceAdder and FaceRecognizer use the gallery of the service instead of loading their own.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import base64
+import http.client
+import json
+import socket
+import threading
+import numpy as np
+from config import setup_logger
+from src.business_logic.gallery_matcher import MatchResult
+
+logger = setup_logger(__name__)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path : str, timeout : float):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # A blocking connect waits for room in the backlog of the service, with a timeout it fails at once (EAGAIN)
+        self.sock.connect(self.path)
+        self.sock.settimeout(self.timeout)
+
+
+def encode_image(image : np.ndarray, extension : str = ".jpg", quality : int = 95) -> str:
+    """
+    :param image: BGR image, as read by OpenCV
+    :param extension: Image file format sent to the service
+    :param quality: JPEG quality
+    :return: Base64 image file
+    """
+    import cv2
+
+    ok, buffer = cv2.imencode(extension, image, (cv2.IMWRITE_JPEG_QUALITY, quality))
+    if not ok:
+        raise ValueError(f"Unable to encode the image as {extension}")
+    return base64.b64encode(buffer.tobytes()).decode("ascii")
+
+
+class ServiceRequestError(Exception):
+    """The service refused a request (invalid request, unknown endpoint, service error)"""
+    def __init__(self, message : str, status : int):
+        super().__init__(message)
+        self.status = status
+
+
+class RecognitionClient:
+    def __init__(self, address : str, timeout : float = 30.0):
+        """
+        Initialize RecognitionClient: one persistent connection to the service per thread using the client
+
+        :param address: "http://host:port", "unix:<socket path>" or a socket path
+        :param timeout: Socket timeout in seconds
+        """
+        self.address = address
+        self.timeout = timeout
+        self.generation = None  # Gallery generation of the last answer
+        self._local = threading.local()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.address.startswith("http://"):
+            host, _, port = self.address[len("http://"):].rstrip("/").partition(":")
+            return http.client.HTTPConnection(host, int(port) if port else 80, timeout=self.timeout)
+        path = self.address[len("unix:"):] if self.address.startswith("unix:") else self.address
+        return _UnixHTTPConnection(path, self.timeout)
+
+    def request(self, method : str, path : str, body : Optional[dict] = None) -> dict:
+        """
+        Send one request on the connection of the calling thread
+
+        :param method: "GET" or "POST"
+        :param path: Endpoint path
+        :param body: JSON body of a POST
+        :return: Decoded answer
+        """
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        connection = getattr(self._local, "connection", None)
+        reused = connection is not None
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        try:
+            connection.request(method, path, data, headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            self._local.connection = None
+            # The service closed an idle connection (or restarted), the request never reached it: send it again once
+            if not reused:
+                raise
+            return self.request(method, path, body)
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            raise
+
+        answer = json.loads(payload)
+        if response.status != 200:
+            raise ServiceRequestError(answer.get("error", response.reason), response.status)
+        if "generation" in answer:
+            self.generation = answer["generation"]
+        return answer
+
+    def close(self) -> None:
+        """Close the connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def encode(self, images : Sequence[np.ndarray], scale : float = 1.0) -> List[List[Tuple[Tuple[int, int, int, int], np.ndarray]]]:
+        """
+        :param images: BGR images
+        :param scale: Downscale factor of the images before detection
+        :return: For every image, a list of (location, 128-d float32 encoding) of its faces
+        """
+        answer = self.request("POST", "/encode", {"images": [encode_image(image) for image in images], "scale": scale})
+        return [
+            [(tuple(face["location"]), np.asarray(face["encoding"], dtype=np.float32)) for face in image["faces"]]
+            for image in answer["images"]
+        ]
+
+    def match(self, encodings : Sequence[Any], top_k : int = 1) -> List[Dict[str, Any]]:
+        """
+        :param encodings: 128-d face encodings
+        :param top_k: Number of closest known faces returned per encoding
+        :return: For every encoding, a dict {"name", "distance" (None if the gallery is empty), "index", "top_k" if top_k > 1}
+        """
+        if len(encodings) == 0:
+            return []
+        values = np.asarray(encodings, dtype=np.float32).reshape(len(encodings), -1).tolist()
+        return self.request("POST", "/match", {"encodings": values, "top_k": top_k})["matches"]
+
+    def recognize(self, frames : Sequence[np.ndarray], scale : Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        :param frames: BGR camera frames
+        :param scale: Downscale factor before detection (default: the profile scale of the service)
+        :return: For every frame, a list of {"location", "name", "distance"} of its faces, in frame coordinates
+        """
+        body = {"images": [encode_image(frame) for frame in frames]}
+        if scale is not None:
+            body["scale"] = scale
+        return [image["faces"] for image in self.request("POST", "/recognize", body)["images"]]
+
+    def enroll(self, name : Optional[str], encoding : Optional[Any] = None, image : Optional[np.ndarray] = None, duplicate_check : bool = True) -> Tuple[bool, str]:
+        """
+        Add a template to the gallery of the service, from an encoding or from the largest face of an image
+
+        :param name: Name of the person (None = generated by the service)
+        :param encoding: 128-d face encoding
+        :param image: BGR image, used if no encoding is given
+        :param duplicate_check: Refuse a face close to another person
+        :return: Tuple (success, message)
+        """
+        body = {"name": name, "duplicate_check": duplicate_check}
+        if encoding is not None:
+            body["encoding"] = np.asarray(encoding, dtype=np.float32).tolist()
+        elif image is not None:
+            body["image"] = encode_image(image)
+        else:
+            raise ValueError("enroll needs an encoding or an image")
+        answer = self.request("POST", "/enroll", body)
+        return answer["success"], answer["message"]
+
+    def delete(self, name : str) -> Tuple[bool, str, int]:
+        """
+        :param name: Person to delete (all the templates of the name)
+        :return: Tuple (success, message, number of removed templates)
+        """
+        answer = self.request("POST", "/delete", {"name": name})
+        return answer["success"], answer["message"], answer["removed"]
+
+    def faces(self) -> dict:
+        return self.request("GET", "/faces")
+
+    def health(self) -> dict:
+        return self.request("GET", "/health")
+
+
+class RemoteMatcher:
+    def __init__(self, client : RecognitionClient, tolerance : float = 0.6):
+        """
+        Matcher of the gallery of the service, with the match / tolerance / len of a GalleryMatcher
+        (for FaceRecognizer and FaceAdder)
+
+        :param client: Client of the service
+        :param tolerance: Tolerance of the service, updated by RemoteGallery.load
+        """
+        self.client = client
+        self.tolerance = tolerance
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def generation(self) -> Optional[int]:
+        """Gallery generation of the service in its last answer"""
+        return self.client.generation
+
+    def match(self, face_encodings : Sequence[Any], top_k : int = 1) -> List[MatchResult]:
+        """
+        :param face_encodings: Face encodings found in a frame
+        :param top_k: Number of closest known faces to return per face
+        :return: List of MatchResult, one per given face encoding (top_k holds (name, distance) tuples)
+        """
+        if len(face_encodings) == 0:
+            return []
+        return [
+            MatchResult(match["index"], match["distance"] if match["distance"] is not None else float("inf"), match["name"], [tuple(item) for item in match.get("top_k", [])])
+            for match in self.client.match(face_encodings, top_k)
+        ]
+
+
+class RemoteGallery:
+    def __init__(self, client : RecognitionClient):
+        """
+        Initialize RemoteGallery: the gallery of the service, in place of a Gallery for FaceAdder.
+        Adds and deletes are sent to the service, the names and template counts are cached and refreshed
+        when the gallery generation of the service changes.
+
+        :param client: Client of the service
+        """
+        self.client = client
+        self.matcher = RemoteMatcher(client)
+        self.store = None  # The gallery files belong to the service
+        self.data_file = None
+        self._identities = {}
+        self._count = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, force : bool = False) -> bool:
+        with self._lock:
+            if not force and self._generation is not None and self.client.generation == self._generation:
+                return False
+            answer = self.client.faces()
+            self._identities = {name: templates for name, templates in answer["identities"]}
+            self._count = answer["count"]
+            self._generation = answer["generation"]
+            self.matcher.size = self._count
+        return True
+
+    def count(self) -> int:
+        """
+        :return: Number of templates
+        """
+        self._refresh()
+        return self._count
+
+    def identity_count(self) -> int:
+        """
+        :return: Number of distinct names
+        """
+        self._refresh()
+        return len(self._identities)
+
+    def identities(self) -> List[str]:
+        """
+        :return: Distinct names in enrollment order
+        """
+        self._refresh()
+        return list(self._identities)
+
+    def rows_of(self, name : str) -> np.ndarray:
+        """
+        :param name: Identity name
+        :return: One entry per template of the identity (the rows themselves are the service's)
+        """
+        self._refresh()
+        return np.arange(self._identities.get(name, 0), dtype=np.int64)
+
+    def load(self) -> int:
+        """
+        Read the tolerance and the identities of the service
+
+        :return: Number of templates
+        """
+        self.matcher.tolerance = self.client.health()["tolerance"]
+        self._refresh(force=True)
+        return self._count
+
+    def reload_if_changed(self) -> bool:
+        """
+        :return: True if the gallery of the service changed since the last refresh (another client enrolled or deleted)
+        """
+        self.matcher.tolerance = self.client.health()["tolerance"]
+        return self._refresh()
+
+    def add(self, encoding : Any, name : str) -> None:
+        """
+        Add a template through the service, the caller (FaceAdder) already checked the duplicates
+
+        :param encoding: 128-d face encoding
+        :param name: Name of the person
+        """
+        success, message = self.client.enroll(name, encoding, duplicate_check=False)
+        if not success:
+            raise RuntimeError(message)
+        self._refresh()
+
+    def remove(self, name : str) -> int:
+        """
+        :param name: Identity name
+        :return: Number of removed templates
+        """
+        _, _, removed = self.client.delete(name)
+        self._refresh()
+        return removed
+
+    def compact(self) -> None:
+        # The service folds its journal into the gallery file when it stops
+        pass
@@ -0,0 +1,576 @@
+"""
+Local recognition service: one long-lived process holds the gallery and the face_recognition models, the kiosk
+processes and the tools send it images or encodings instead of loading their own copy of the gallery.
+
+HTTP/1.1 with persistent connections and JSON bodies, on a local TCP port or a Unix socket:
+    POST /encode     {"image": b64} or {"images": [b64, ...]}                -> faces (location, encoding) of every image
+    POST /match      {"encoding": [...]} or {"encodings": [[...], ...]}      -> one match per encoding
+    POST /recognize  {"image": b64} or {"images": [b64, ...]}                -> faces (location, name, distance) of every image
+    POST /enroll     {"name": str, "encoding": [...]} or {"name": str, "image": b64}
+    POST /delete     {"name": str}
+    GET  /faces      identities and their number of templates
+    GET  /health     gallery size, tolerance and batching counters
+
+Images are encoded image files (JPEG, PNG...) in base64. Every answer carries the generation of the gallery,
+incremented by each enrollment, deletion or reload, so a client knows when its cached counts are stale.
+
+Matches are micro-batched: the encodings of the requests that arrive while a batch is formed (at most max_wait
+seconds, at most max_batch encodings) are matched together in one GalleryMatcher.match call, a single matrix
+product over the gallery instead of one per request. Enrollment and deletion go through the gallery of the
+service, the very next match of every client sees them.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import json
+import math
+import os
+import socketserver
+import threading
+import time
+import numpy as np
+from config import setup_logger
+from src.business_logic.add_known_face import FaceAdder
+from src.business_logic.ann_index import make_index
+from src.business_logic.gallery_matcher import ENCODING_SIZE, GalleryMatcher, MatchResult
+from src.business_logic.host_profile import DetectionProfile, PROFILE_FILE
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+DEFAULT_PORT = 8765
+
+
+class _MatchRequest:
+    __slots__ = ("queries", "top_k", "done", "results", "error")
+
+    def __init__(self, queries : np.ndarray, top_k : int):
+        self.queries = queries
+        self.top_k = top_k
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MatchBatcher:
+    def __init__(self, matcher : GalleryMatcher, max_batch : int = 256, max_wait : float = 0.002):
+        """
+        Coalesce the match requests of concurrent callers into batched GalleryMatcher.match calls, from one thread.
+        A caller blocks until the batch holding its encodings is matched. Has the match / tolerance / len of a
+        GalleryMatcher, so a FaceAdder or a FaceRecognizer can use it as their matcher.
+
+        :param matcher: Matcher holding the gallery
+        :param max_batch: Encodings per batch, a request larger than that is matched alone
+        :param max_wait: Seconds the first request of a batch waits for others (0 = batch only what queued up
+                         while the previous batch was matched)
+        """
+        self.matcher = matcher
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+        self.batches = 0
+        self.requests = 0
+        self.queries = 0
+
+    @property
+    def tolerance(self) -> float:
+        return self.matcher.tolerance
+
+    def __len__(self) -> int:
+        return len(self.matcher)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="match-batcher", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def match(self, face_encodings : Sequence[Any], top_k : int = 1) -> List[MatchResult]:
+        """
+        Match encodings in the next batch (same results as GalleryMatcher.match)
+
+        :param face_encodings: Face encodings
+        :param top_k: Number of closest known faces to return per face
+        :return: List of MatchResult, one per encoding
+        """
+        if len(face_encodings) == 0:
+            return []
+        request = _MatchRequest(np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE), top_k)
+        with self._condition:
+            if self._closed or self._thread is None:
+                raise RuntimeError("The match batcher is not running")
+            self._pending.append(request)
+            self._condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+
+                # Give the other clients a moment to join the batch, unless it is already full
+                deadline = time.perf_counter() + self.max_wait
+                while not self._closed and sum(len(request.queries) for request in self._pending) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = [self._pending.popleft()]
+                size = len(batch[0].queries)
+                while self._pending and self._pending[0].top_k == batch[0].top_k and size + len(self._pending[0].queries) <= self.max_batch:
+                    request = self._pending.popleft()
+                    batch.append(request)
+                    size += len(request.queries)
+
+            self._match_batch(batch, size)
+
+    def _match_batch(self, batch : List[_MatchRequest], size : int) -> None:
+        try:
+            queries = batch[0].queries if len(batch) == 1 else np.concatenate([request.queries for request in batch])
+            with metrics.time_stage("service_match"):
+                results = self.matcher.match(queries, batch[0].top_k)
+            start = 0
+            for request in batch:
+                request.results = results[start:start + len(request.queries)]
+                start += len(request.queries)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            self.batches += 1
+            self.requests += len(batch)
+            self.queries += size
+            metrics.observe_value("service_match_batch", size)
+            for request in batch:
+                request.done.set()
+
+
+class ServiceError(Exception):
+    """Invalid request, answered with the given HTTP status"""
+    def __init__(self, message : str, status : int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_image(data : str) -> np.ndarray:
+    """
+    :param data: Base64 image file (JPEG, PNG...)
+    :return: RGB image
+    """
+    import cv2
+
+    try:
+        buffer = np.frombuffer(base64.b64decode(data, validate=True), dtype=np.uint8)
+    except (TypeError, ValueError):
+        raise ServiceError("Images must be base64 encoded image files")
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ServiceError("Unreadable image")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def _batch(body : dict, single : str, plural : str) -> Tuple[list, bool]:
+    """Items of the single ("image") or the batch ("images") form of a request, and whether it was a batch"""
+    if plural in body:
+        if not isinstance(body[plural], list):
+            raise ServiceError(f"'{plural}' must be a list")
+        return body[plural], True
+    if single in body:
+        return [body[single]], False
+    raise ServiceError(f"Expected '{single}' or '{plural}'")
+
+
+def _encodings(values : Sequence[Any]) -> np.ndarray:
+    try:
+        encodings = np.asarray(values, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise ServiceError("Encodings must be lists of numbers")
+    if encodings.size % ENCODING_SIZE or (encodings.ndim > 1 and encodings.shape[-1] != ENCODING_SIZE):
+        raise ServiceError(f"Encodings must have {ENCODING_SIZE} values")
+    return encodings.reshape(-1, ENCODING_SIZE)
+
+
+def _top_k(body : dict) -> int:
+    try:
+        top_k = int(body.get("top_k", 1))
+    except (TypeError, ValueError):
+        raise ServiceError("'top_k' must be an integer")
+    if top_k < 1:
+        raise ServiceError("'top_k' must be at least 1")
+    return top_k
+
+
+def _scale(body : dict, default : float) -> float:
+    try:
+        scale = float(body.get("scale", default))
+    except (TypeError, ValueError):
+        raise ServiceError("'scale' must be a number")
+    if not (math.isfinite(scale) and scale > 0):
+        raise ServiceError("'scale' must be a positive number")
+    return scale
+
+
+def _name(body : dict, required : bool = True) -> Optional[str]:
+    name = body.get("name")
+    if name is None and not required:
+        return None
+    if not isinstance(name, str) or not name.strip():
+        raise ServiceError("'name' must be a non-empty string")
+    return name
+
+
+def _location(location : Sequence[Any], scale : float = 1.0) -> List[int]:
+    return [int(value / scale) for value in location]
+
+
+class RecognitionService:
+    def __init__(self, gallery_dir : str = "known_faces_gallery", data_file : str = "known_faces.pkl", tolerance : float = 0.6, duplicate_tolerance : float = 0.4, profile : Optional[DetectionProfile] = None, profile_file : str = PROFILE_FILE, encoder : Optional[Any] = None, max_batch : int = 256, max_wait : float = 0.002, reload_interval : float = 1.0, gallery_index : str = "exact"):
+        """
+        Initialize RecognitionService: the gallery, the models and the HTTP front of the shared recognition
+
+        :param gallery_dir: Directory of the binary gallery
+        :param data_file: Legacy pickle file, migrated once into gallery_dir
+        :param tolerance: Maximum distance for a face to match a known face
+        :param duplicate_tolerance: Distance under which an enrolled face is a duplicate of another person
+        :param profile: Optional detector and encoder profile (default: the calibrated profile of the host, from profile_file)
+        :param profile_file: Host profile written by the calibration command
+        :param encoder: Optional encoding backend with an encode(rgb_frame, face_locations) method (e.g. ParallelFaceEncoder)
+        :param max_batch: Encodings per batched match
+        :param max_wait: Seconds a match waits for concurrent ones to join its batch
+        :param reload_interval: Seconds between two checks of the gallery files, changed by a bulk import for example
+        :param gallery_index: Candidate index of the gallery (see ann_index.make_index), e.g. "int8" for a large
+                              watchlist held as compact codes and re-ranked exactly
+        """
+        self.matcher = GalleryMatcher(tolerance=tolerance, index=make_index(gallery_index))
+        self.face_adder = FaceAdder(data_file=data_file, tolerance=duplicate_tolerance, matcher=self.matcher, gallery_dir=gallery_dir, encoder=encoder, profile=profile, profile_file=profile_file)
+        self.gallery = self.face_adder.gallery
+        self.profile = self.face_adder.profile
+        self.encoder = encoder
+        self.batcher = MatchBatcher(self.matcher, max_batch, max_wait)
+        self.reload_interval = reload_interval
+        self.generation = 0
+        self.started_at = None
+
+        # dlib models are shared objects, one image is detected and encoded at a time
+        self._model_lock = threading.Lock()
+        self._generation_lock = threading.Lock()
+        self._last_reload_check = 0.0
+        self._server = None
+        self._socket_path = None
+
+    def start(self) -> None:
+        """Load the gallery and start the match batcher"""
+        count = self.gallery.load()
+        self._last_reload_check = time.monotonic()
+        self.batcher.start()
+        self.started_at = time.time()
+        logger.info(f"Recognition service ready with {count} templates of {self.gallery.identity_count()} people, profile {self.profile.name}")
+
+    def close(self) -> None:
+        """Stop serving, stop the batcher and fold the journaled changes into the gallery file"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._socket_path is not None and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+        self.batcher.close()
+        self.gallery.compact()
+
+    def serve(self, port : Optional[int] = DEFAULT_PORT, host : str = "127.0.0.1", socket_path : Optional[str] = None) -> str:
+        """
+        Serve the endpoints from a daemon thread, one thread per client connection
+
+        :param port: TCP port (0 = any free port)
+        :param host: Interface to bind, local only by default
+        :param socket_path: Unix socket path, used instead of the TCP port if given
+        :return: Address of the service for RecognitionClient ("http://host:port" or "unix:<path>")
+        """
+        handler = _make_handler(self, tcp=socket_path is None)
+        if socket_path is not None:
+            # A socket file left by a killed service would make the bind fail
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._server = _UnixHTTPServer(socket_path, handler)
+            self._socket_path = socket_path
+            address = f"unix:{socket_path}"
+        else:
+            self._server = _TCPHTTPServer((host, port), handler)
+            address = f"http://{host}:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, name="recognition-service", daemon=True).start()
+        logger.info(f"Serving face recognition on {address}")
+        return address
+
+    # Endpoints, usable in-process as well
+
+    def encode(self, body : dict) -> dict:
+        """
+        :param body: {"image" | "images": base64 image files, "scale": optional downscale factor before detection (default 1)}
+        :return: {"faces": [{"location", "encoding"}...]} or, for a batch, {"images": [{"faces": [...]}...]}
+        """
+        images, is_batch = _batch(body, "image", "images")
+        scale = _scale(body, 1.0)
+        answers = []
+        for image in images:
+            locations, encodings = self._faces(decode_image(image), scale)
+            answers.append({"faces": [
+                {"location": _location(location, scale), "encoding": np.asarray(encoding, dtype=np.float32).tolist()}
+                for location, encoding in zip(locations, encodings)
+            ]})
+        return {"images": answers} if is_batch else answers[0]
+
+    def match(self, body : dict) -> dict:
+        """
+        :param body: {"encoding" | "encodings": 128-d encodings, "top_k": optional number of closest known faces}
+        :return: {"match": {...}} or, for a batch, {"matches": [{...}...]}, a match is {"name", "distance", "index", "top_k"}
+        """
+        values, is_batch = _batch(body, "encoding", "encodings")
+        top_k = _top_k(body)
+        results = self.batcher.match(_encodings(values), top_k) if values else []
+        matches = [self._match_answer(result, top_k) for result in results]
+        if is_batch:
+            return {"matches": matches}
+        if not matches:
+            raise ServiceError("Empty encoding")
+        return {"match": matches[0]}
+
+    def recognize(self, body : dict) -> dict:
+        """
+        Detect, encode and match the faces of camera frames, the faces of all the frames are matched together
+
+        :param body: {"image" | "images": base64 image files, "scale": optional downscale factor (default: the profile scale)}
+        :return: {"faces": [{"location", "name", "distance"}...]} or, for a batch, {"images": [{"faces": [...]}...]}
+        """
+        images, is_batch = _batch(body, "image", "images")
+        scale = _scale(body, self.profile.scale)
+        image_faces = [self._faces(decode_image(image), scale) for image in images]
+
+        encodings = [encoding for _, image_encodings in image_faces for encoding in image_encodings]
+        results = iter(self.batcher.match(encodings) if encodings else [])
+        answers = []
+        for locations, _ in image_faces:
+            answers.append({"faces": [
+                {"location": _location(location, scale), **self._match_answer(next(results), 0)}
+                for location in locations
+            ]})
+        return {"images": answers} if is_batch else answers[0]
+
+    def enroll(self, body : dict) -> dict:
+        """
+        :param body: {"name": optional str (default Person_<n>), "encoding": one 128-d encoding or "image": base64
+                      image file (its largest face), "duplicate_check": optional bool (default true)}
+        :return: {"success", "message", "name"}
+        """
+        name = _name(body, required=False)
+        if "encoding" in body:
+            encodings = _encodings(body["encoding"])
+            if len(encodings) != 1:
+                raise ServiceError(f"Expected one encoding, got {len(encodings)}")
+            encoding = encodings[0]
+        elif "image" in body:
+            locations, encodings = self._faces(decode_image(body["image"]), 1.0, largest=True)
+            if not encodings:
+                return {"success": False, "message": "No face detected", "name": name}
+            encoding = np.asarray(encodings[0], dtype=np.float32)
+        else:
+            raise ServiceError("Expected 'encoding' or 'image'")
+
+        if name is None:
+            name = f"Person_{self.gallery.identity_count() + 1}"
+        if body.get("duplicate_check", True):
+            success, message = self.face_adder.add_face_to_database(encoding, name)
+        else:
+            # The client already checked (e.g. a FaceAdder over a RemoteGallery)
+            try:
+                self.gallery.add(encoding, name)
+                success, message = True, f"Face added successfully as '{name}'"
+            except Exception as e:
+                success, message = False, f"Failed to save face data: {str(e)}"
+        if success:
+            self._changed()
+        return {"success": success, "message": message, "name": name}
+
+    def delete(self, body : dict) -> dict:
+        """
+        :param body: {"name": str}
+        :return: {"success", "message", "removed"}
+        """
+        name = _name(body)
+        removed = self.gallery.rows_of(name).size
+        success, message = self.face_adder.delete_face(name)
+        if success:
+            self._changed()
+        return {"success": success, "message": message, "removed": removed if success else 0}
+
+    def faces(self) -> dict:
+        """
+        :return: {"identities": [[name, templates]...] in enrollment order, "count": templates}
+        """
+        snapshot = self.gallery.snapshot
+        return {"identities": [[name, len(rows)] for name, rows in snapshot.name_rows.items()], "count": len(snapshot)}
+
+    def health(self) -> dict:
+        batcher = self.batcher
+        return {
+            "status": "ok",
+            "count": self.gallery.count(),
+            "identities": self.gallery.identity_count(),
+            "tolerance": self.matcher.tolerance,
+            "profile": self.profile.name,
+            "uptime": time.time() - self.started_at if self.started_at else 0.0,
+            "batches": batcher.batches,
+            "match_requests": batcher.requests,
+            "matched_encodings": batcher.queries,
+            "mean_batch": batcher.queries / batcher.batches if batcher.batches else 0.0
+        }
+
+    def handle(self, method : str, path : str, body : Optional[dict]) -> dict:
+        """
+        Answer one request
+
+        :param method: "GET" or "POST"
+        :param path: Endpoint path
+        :param body: Decoded JSON body of a POST
+        :return: Answer, with the gallery generation
+        """
+        self._reload_if_changed()
+        routes = {
+            ("POST", "/encode"): self.encode,
+            ("POST", "/match"): self.match,
+            ("POST", "/recognize"): self.recognize,
+            ("POST", "/enroll"): self.enroll,
+            ("POST", "/delete"): self.delete,
+            ("GET", "/faces"): lambda _: self.faces(),
+            ("GET", "/health"): lambda _: self.health()
+        }
+        route = routes.get((method, path))
+        if route is None:
+            raise ServiceError(f"No endpoint {method} {path}", 404)
+        if method == "POST" and not isinstance(body, dict):
+            raise ServiceError("The body must be a JSON object")
+        with metrics.time_stage(f"service_{path.strip('/')}"):
+            answer = route(body)
+        answer["generation"] = self.generation
+        return answer
+
+    def _faces(self, rgb_image : np.ndarray, scale : float, largest : bool = False) -> Tuple[List[tuple], List[Any]]:
+        """
+        Detect and encode the faces of an image with the profile of the service
+
+        :param scale: Downscale factor of the image before detection, the locations are in downscaled coordinates
+        :param largest: Only encode the largest face
+        :return: Tuple (locations, encodings)
+        """
+        import cv2
+
+        if scale != 1.0:
+            rgb_image = cv2.resize(rgb_image, (0, 0), fx=scale, fy=scale)
+        with self._model_lock:
+            locations = self.profile.detect(rgb_image)
+            if largest and locations:
+                locations = [max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))]
+            if not locations:
+                return [], []
+            encodings = self.encoder.encode(rgb_image, locations) if self.encoder is not None else self.profile.encode(rgb_image, locations)
+        return locations, encodings
+
+    def _match_answer(self, result : MatchResult, top_k : int) -> Dict[str, Any]:
+        answer = {"name": result.name, "distance": result.distance if np.isfinite(result.distance) else None, "index": result.index}
+        if top_k > 1:
+            snapshot = self.gallery.snapshot
+            answer["top_k"] = [[snapshot.names[index], distance] for index, distance in result.top_k if index < len(snapshot)]
+        return answer
+
+    def _changed(self) -> None:
+        with self._generation_lock:
+            self.generation += 1
+
+    def _reload_if_changed(self) -> None:
+        # The gallery files may be written by another process (bulk import), a stat at most once per interval
+        now = time.monotonic()
+        if now - self._last_reload_check < self.reload_interval:
+            return
+        self._last_reload_check = now
+        try:
+            if self.gallery.reload_if_changed():
+                logger.info(f"Gallery reloaded, {self.gallery.count()} templates")
+                self._changed()
+        except Exception as e:
+            logger.error(f"Failed to reload the gallery: {e}")
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    # Many kiosks may connect at once, the default backlog is 5
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+
+def _make_handler(service : RecognitionService, tcp : bool = True) -> type:
+    class RecognitionHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1: the connection of a client stays open between its requests
+        protocol_version = "HTTP/1.1"
+        # Headers and body are two writes: with Nagle, the body waits for the delayed ACK of the client (~40 ms)
+        disable_nagle_algorithm = tcp
+
+        def do_GET(self):
+            self._answer("GET", None)
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length)) if length else None
+            except ValueError:
+                self._send(400, {"error": "Invalid JSON body"})
+                return
+            self._answer("POST", body)
+
+        def _answer(self, method : str, body : Optional[dict]) -> None:
+            try:
+                self._send(200, service.handle(method, self.path.split("?")[0], body))
+            except ServiceError as e:
+                self._send(e.status, {"error": str(e)})
+            except Exception as e:
+                logger.error(f"Recognition service error on {method} {self.path}: {e}")
+                self._send(500, {"error": str(e)})
+
+        def _send(self, status : int, answer : dict) -> None:
+            data = json.dumps(answer).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RecognitionHandler
@@ -0,0 +1,175 @@
+from typing import List, Any, NamedTuple, Optional, Tuple
+import time
+import face_recognition
+import cv2
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.face_tracker import FaceTracker
+from src.business_logic.motion_gate import MotionGate, SKIP, ROI, FULL
+from src.business_logic.host_profile import DetectionProfile
+from src.utils.metrics import metrics
+from src.utils.frame_buffers import FrameBuffers
+
+
+class Recognition(NamedTuple):
+    """
+    One recognized face of a frame
+
+    :param location: (top, right, bottom, left) box in full frame coordinates
+    :param name: Name of the matched known face, "Unknown" if none is within tolerance
+    :param distance: Distance to the closest known face
+    :param track_id: Id of the face track when a tracker is used, -1 otherwise
+    """
+    location: Tuple[int, int, int, int]
+    name: str
+    distance: float
+    track_id: int = -1
+
+
+class FaceRecognizer:
+    def __init__(self, matcher : GalleryMatcher, scale : float = 0.25, encoder : Optional[Any] = None, upsample : int = 1, profile : Optional[DetectionProfile] = None):
+        """
+        Initialize FaceRecognizer: detection, encoding and gallery matching of a frame, without any UI
+
+        :param matcher: Gallery matcher holding the known faces
+        :param scale: Downscale factor of the frame used for detection and encoding
+        :param encoder: Optional encoding backend with an encode(rgb_frame, face_locations) method (e.g. ParallelFaceEncoder)
+        :param upsample: Number of times the detector upsamples the small frame (finds faces half as large per upsample)
+        :param profile: Optional calibrated profile of the host (see host_profile), its detector, encoding settings,
+                        scale and upsample replace the ones above
+        """
+        if profile is None:
+            profile = DetectionProfile(upsample=upsample, scale=scale)
+        self.matcher = matcher
+        self.profile = profile
+        self.scale = profile.scale
+        self.encoder = encoder
+        self.upsample = profile.upsample
+
+        # Counters of detected faces and of faces actually encoded and matched
+        self.faces_detected = 0
+        self.faces_encoded = 0
+
+    def recognize(self, frame : Any, tracker : Optional[FaceTracker] = None, gate : Optional[MotionGate] = None, buffers : Optional[FrameBuffers] = None, scale : Optional[float] = None, upsample : Optional[int] = None, timings : Optional[dict] = None) -> List[Recognition]:
+        """
+        Detect, encode and match all the faces of a frame
+
+        :param frame: BGR frame as read from cv2.VideoCapture
+        :param tracker: Optional tracker of the video source, only faces whose track needs a verification are encoded
+        :param gate: Optional motion gate of the video source, skips or restricts detection when the scene allows it
+        :param buffers: Optional preprocessing buffers of the video source, reused instead of allocating the small frames
+        :param scale: Downscale factor of this frame (default: the recognizer scale), e.g. set by an AdaptiveController
+        :param upsample: Detector upsample count of this frame (default: the recognizer upsample)
+        :param timings: Optional dict filled with the "preprocess", "detect" and "encode" seconds of this frame
+                        and the "detect_pixels" scanned by the detector
+        :return: List of Recognition, one per detected face
+        """
+        scale = self.scale if scale is None else scale
+        upsample = self.upsample if upsample is None else upsample
+        stage_start = time.perf_counter()
+
+        # Resize frame for faster processing
+        with metrics.time_stage("preprocess"):
+            if buffers is not None:
+                small_frame, rgb_small_frame = buffers.downscale(frame, scale)
+            else:
+                small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        detect_start = time.perf_counter()
+
+        with metrics.time_stage("detect"):
+            face_locations = self.detect(small_frame, rgb_small_frame, gate, upsample, timings)
+        self.faces_detected += len(face_locations)
+        metrics.observe_value("faces_per_frame", len(face_locations))
+        encode_start = time.perf_counter()
+
+        if tracker is None:
+            with metrics.time_stage("encode"):
+                face_encodings = self.encode(rgb_small_frame, face_locations)
+            self.faces_encoded += len(face_encodings)
+
+            # Match all the faces of the frame against the whole gallery in one batched call
+            with metrics.time_stage("match"):
+                results = self.matcher.match(face_encodings)
+            recognitions = [
+                Recognition(self._scale_up(location, scale), result.name, result.distance)
+                for location, result in zip(face_locations, results)
+            ]
+        else:
+            # Tracks are kept in full frame coordinates, so they survive a change of the detection scale.
+            # Only the faces of new tracks and of tracks due for a verification are encoded and matched
+            tracks = tracker.update([self._scale_up(location, scale) for location in face_locations])
+            # Read before the match: if the gallery changes during it, the identities are matched again next frame
+            generation = self.matcher.generation
+            pending = [i for i, track in enumerate(tracks) if tracker.needs_identity(track, self.matcher.tolerance, generation)]
+            if pending:
+                with metrics.time_stage("encode"):
+                    face_encodings = self.encode(rgb_small_frame, [face_locations[i] for i in pending])
+                self.faces_encoded += len(face_encodings)
+                with metrics.time_stage("match"):
+                    results = self.matcher.match(face_encodings)
+                for i, result in zip(pending, results):
+                    tracker.set_identity(tracks[i], result.name, result.distance, generation)
+
+            recognitions = [
+                Recognition(track.location, track.name or "Unknown", track.distance, track.track_id)
+                for track in tracks
+            ]
+
+        if timings is not None:
+            timings["preprocess"] = detect_start - stage_start
+            timings["detect"] = encode_start - detect_start
+            timings["encode"] = time.perf_counter() - encode_start
+        return recognitions
+
+    def detect(self, small_frame : Any, rgb_small_frame : Any, gate : Optional[MotionGate] = None, upsample : Optional[int] = None, timings : Optional[dict] = None) -> List[tuple]:
+        """
+        Find the face boxes of the small frame, as allowed by the motion gate
+
+        :param upsample: Detector upsample count (default: the recognizer upsample)
+        :param timings: Optional dict, "detect_pixels" is set to the number of pixels the detector scanned
+        :return: List of (top, right, bottom, left) boxes in small frame coordinates
+        """
+        upsample = self.upsample if upsample is None else upsample
+        # Every upsample doubles both sides of the scanned image
+        pixel_factor = 4 ** upsample
+        if timings is not None:
+            timings["detect_pixels"] = 0
+
+        decision = gate.decide(small_frame) if gate is not None else FULL
+        if decision == SKIP:
+            # Static scene: the faces are where they were
+            return gate.locations
+
+        if decision == ROI:
+            face_locations = []
+            for top, right, bottom, left in gate.regions(rgb_small_frame.shape):
+                crop = rgb_small_frame[top:bottom, left:right]
+                for crop_top, crop_right, crop_bottom, crop_left in face_recognition.face_locations(crop, upsample, self.profile.model):
+                    face_locations.append((crop_top + top, crop_right + left, crop_bottom + top, crop_left + left))
+                if timings is not None:
+                    timings["detect_pixels"] += crop.shape[0] * crop.shape[1] * pixel_factor
+        else:
+            face_locations = face_recognition.face_locations(rgb_small_frame, upsample, self.profile.model)
+            if timings is not None:
+                timings["detect_pixels"] = rgb_small_frame.shape[0] * rgb_small_frame.shape[1] * pixel_factor
+
+        if gate is not None:
+            gate.locations = face_locations
+        return face_locations
+
+    def _scale_up(self, location : Tuple[int, int, int, int], scale : Optional[float] = None) -> Tuple[int, int, int, int]:
+        # Scale back up face locations since the frame we detected in was downscaled
+        scale = self.scale if scale is None else scale
+        return tuple(int(round(coordinate / scale)) for coordinate in location)
+
+    def encode(self, rgb_frame : Any, face_locations : List[tuple]) -> List[Any]:
+        """
+        Encode the faces of a frame with the configured backend
+
+        :param rgb_frame: RGB frame
+        :param face_locations: (top, right, bottom, left) boxes in the frame
+        :return: List of 128-d encodings in the order of face_locations
+        """
+        if self.encoder is not None:
+            return self.encoder.encode(rgb_frame, face_locations)
+        return face_recognition.face_encodings(rgb_frame, face_locations, self.profile.num_jitters, self.profile.landmark_model)
@@ -0,0 +1,223 @@
+"""
+Headless batch recognition over video archives and image folders, without the Flet GUI.
+
+Usage:
+    python -m src.cli.batch_recognize footage/ stills/ entrance.mp4 --output results.jsonl --workers 8
+
+Every detected face is written as one JSON line:
+    {"source": "entrance.mp4", "frame": 1234, "timestamp": 41.13, "box": [top, right, bottom, left], "name": "Eliav", "distance": 0.31}
+Long videos are split into segments by seek offset and the segments are processed by a pool of worker processes.
+"""
+from typing import List, Iterable, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import cv2
+from config import setup_logger
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.gallery_store import GalleryStore, migrate_pickle
+from src.business_logic.recognizer import FaceRecognizer
+
+logger = setup_logger(__name__)
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".m4v", ".wmv", ".mpg", ".mpeg", ".webm"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+# Worker process state, built once by the pool initializer
+_recognizer = None
+
+
+def _init_worker(gallery_dir : str, tolerance : float, scale : float) -> None:
+    """
+    Read the gallery prepared by main once per worker, the encodings matrix is memory-mapped and shared through
+    the page cache. A failed load raises, which breaks the pool instead of matching against an empty gallery.
+    """
+    global _recognizer
+    matcher = GalleryMatcher(tolerance=tolerance)
+    matcher.rebuild_parts(*GalleryStore(gallery_dir).load_parts())
+    _recognizer = FaceRecognizer(matcher, scale=scale)
+
+
+def prepare_gallery(gallery_dir : str, data_file : str) -> int:
+    """
+    Migrate the legacy pickle once, before the workers start, so they only read the gallery
+
+    :return: Number of templates
+    """
+    store = GalleryStore(gallery_dir)
+    with store.lock():
+        if not store.exists() and os.path.exists(data_file):
+            migrate_pickle(data_file, store)
+        return store.count()
+
+
+def _records(source : str, frame_index : int, timestamp, recognitions) -> List[dict]:
+    return [
+        {
+            "source": source,
+            "frame": frame_index,
+            "timestamp": None if timestamp is None else round(timestamp, 3),
+            "box": list(recognition.location),
+            "name": recognition.name,
+            "distance": None if recognition.distance == float("inf") else round(recognition.distance, 4)
+        }
+        for recognition in recognitions
+    ]
+
+
+def _process_video_segment(task : Tuple[str, int, int, float, int]) -> Tuple[List[dict], int]:
+    """
+    Recognize the frames [start, stop) of a video
+
+    :param task: Tuple (path, start frame, stop frame, fps, frame stride)
+    :return: Tuple (JSON records, number of processed frames)
+    """
+    path, start, stop, fps, stride = task
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        logger.error(f"Unable to open {path}")
+        return [], 0
+
+    # Seek once to the segment start, then decode sequentially
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    records, processed = [], 0
+    try:
+        for frame_index in range(start, stop):
+            if (frame_index - start) % stride:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            records.extend(_records(path, frame_index, frame_index / fps if fps else None, _recognizer.recognize(frame)))
+            processed += 1
+    finally:
+        cap.release()
+    return records, processed
+
+
+def _process_images(paths : List[str]) -> Tuple[List[dict], int]:
+    """
+    Recognize a batch of still images
+
+    :return: Tuple (JSON records, number of processed images)
+    """
+    records, processed = [], 0
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            logger.error(f"Unable to read image {path}")
+            continue
+        records.extend(_records(path, 0, None, _recognizer.recognize(frame)))
+        processed += 1
+    return records, processed
+
+
+def collect_inputs(inputs : Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Expand the input paths (files and directories, recursively) into videos and images
+
+    :return: Tuple (video paths, image paths)
+    """
+    videos, images = [], []
+    for path in inputs:
+        files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in sorted(names)] if os.path.isdir(path) else [path]
+        for file_path in files:
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension in VIDEO_EXTENSIONS:
+                videos.append(file_path)
+            elif extension in IMAGE_EXTENSIONS:
+                images.append(file_path)
+    return videos, images
+
+
+def plan_tasks(videos : List[str], images : List[str], workers : int, stride : int, segment_frames : int, images_per_task : int) -> list:
+    """
+    Split the videos into segments by seek offset and the images into batches
+
+    :return: List of (function, task) in output order
+    """
+    tasks = []
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        if frame_count <= 0:
+            logger.error(f"Unable to read the frame count of {path}, skipping it")
+            continue
+
+        # At least a few segments per worker so a slow segment does not leave the other workers idle
+        length = segment_frames or max(stride, -(-frame_count // (workers * 4)))
+        length = -(-length // stride) * stride
+        for start in range(0, frame_count, length):
+            tasks.append((_process_video_segment, (path, start, min(start + length, frame_count), fps, stride)))
+
+    for i in range(0, len(images), images_per_task):
+        tasks.append((_process_images, images[i:i + images_per_task]))
+    return tasks
+
+
+def _run_task(function_and_task):
+    function, task = function_and_task
+    return function(task)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Video files, image files or directories")
+    parser.add_argument("--output", "-o", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--gallery-dir", default="known_faces_gallery")
+    parser.add_argument("--data-file", default="known_faces.pkl", help="Legacy pickle migrated if the gallery does not exist")
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--scale", type=float, default=0.25, help="Downscale factor used for detection")
+    parser.add_argument("--stride", type=int, default=1, help="Process one video frame out of N")
+    parser.add_argument("--segment-frames", type=int, default=0, help="Frames per video segment (0 = automatic)")
+    parser.add_argument("--images-per-task", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    templates = prepare_gallery(args.gallery_dir, args.data_file)
+    if not templates:
+        logger.warning(f"The gallery {args.gallery_dir} is empty, every face will be Unknown")
+
+    videos, images = collect_inputs(args.inputs)
+    tasks = plan_tasks(videos, images, args.workers, args.stride, args.segment_frames, args.images_per_task)
+    logger.info(f"{len(videos)} videos and {len(images)} images split into {len(tasks)} tasks over {args.workers} workers")
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start_time = time.perf_counter()
+    frames = faces = 0
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(args.gallery_dir, args.tolerance, args.scale)
+        ) as executor:
+            # Results are streamed in input order as soon as the segments are done
+            for records, processed in executor.map(_run_task, tasks):
+                for record in records:
+                    output.write(json.dumps(record) + "\n")
+                output.flush()
+                frames += processed
+                faces += len(records)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start_time
+    summary = {"frames": frames, "faces": faces, "seconds": round(elapsed, 2), "frames_per_second": round(frames / elapsed, 2) if elapsed else 0.0, "workers": args.workers}
+    print(json.dumps(summary), file=sys.stderr)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Bulk enrollment of known faces from an image directory or a CSV file, without the Flet GUI.
+
+Usage:
+    python -m src.cli.bulk_enroll employees/ --workers 8
+    python -m src.cli.bulk_enroll photos.csv --report enrollment.json --dry-run
+
+Directory layout: employees/<name>/<any>.jpg, or employees/<name>.jpg for one image per person.
+CSV: one "path,name" row per image, relative paths are relative to the CSV file.
+The images are encoded by a pool of worker processes, duplicates (within the import and against the
+gallery) are rejected and the gallery is written once at the end. A summary is printed on stderr.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from config import setup_logger
+from src.business_logic.add_known_face import FaceAdder
+from src.business_logic.bulk_enroll import read_entries, bulk_enroll
+
+logger = setup_logger(__name__)
+
+
+class ProgressPrinter:
+    def __init__(self, interval : float = 1.0):
+        """
+        Print the encoding progress and throughput on stderr, at most once per interval
+
+        :param interval: Seconds between two progress lines
+        """
+        self.interval = interval
+        self._start = time.perf_counter()
+        self._last_print = 0.0
+
+    def __call__(self, done : int, total : int) -> None:
+        now = time.perf_counter()
+        if done < total and now - self._last_print < self.interval:
+            return
+        self._last_print = now
+        elapsed = now - self._start
+        rate = done / elapsed if elapsed else 0.0
+        remaining = (total - done) / rate if rate else 0.0
+        print(f"{done}/{total} images encoded, {rate:.1f} images/s, {remaining:.0f}s left", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Image directory or CSV file of path,name rows")
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count() or 1, help="Encoding processes (0 = encode in this process)")
+    parser.add_argument("--gallery-dir", default="known_faces_gallery")
+    parser.add_argument("--data-file", default="known_faces.pkl", help="Legacy pickle migrated if the gallery does not exist")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="Distance under which two faces are duplicates")
+    parser.add_argument("--max-side", type=int, default=1024, help="Images are downscaled to this longest side before detection")
+    parser.add_argument("--block-size", type=int, default=1024, help="Block size of the pairwise duplicate search")
+    parser.add_argument("--report", help="Optional JSON file with the outcome of every image")
+    parser.add_argument("--dry-run", action="store_true", help="Do not write the gallery")
+    args = parser.parse_args(argv)
+
+    entries = read_entries(args.source)
+    if not entries:
+        print(f"No images found in {args.source}", file=sys.stderr)
+        return None
+
+    face_adder = FaceAdder(data_file=args.data_file, tolerance=args.tolerance, gallery_dir=args.gallery_dir)
+    gallery_size = face_adder.load_known_faces()
+    logger.info(f"Enrolling {len(entries)} images into a gallery of {gallery_size} faces with {args.workers} workers")
+
+    report = bulk_enroll(
+        face_adder, entries,
+        workers=args.workers, max_side=args.max_side, block_size=args.block_size,
+        progress=ProgressPrinter(), dry_run=args.dry_run
+    )
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps({key: value for key, value in report.items() if key != "items"}), file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
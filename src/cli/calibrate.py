@@ -0,0 +1,81 @@
+"""
+Host calibration: pick the detector and encoder profile of this machine by benchmarking.
+
+Usage:
+    python -m src.cli.calibrate samples/ --recall-target 0.95
+    python -m src.cli.calibrate samples.csv --models hog cnn --scales 0.25 0.5 --report calibration.json
+    python -m src.cli.calibrate samples/ --dry-run
+
+The sample uses the layout of bulk enrollment (samples/<name>/<any>.jpg or a path,name CSV), with two images
+or more per person: the first image of a person is enrolled and the others must be recognized. Every
+combination of detector model, upsample count, jitters and scale is timed on the sample, and the fastest
+profile reaching the recall target without exceeding the false-match rate is written to the profile file,
+which the app and FaceAdder load at startup. A table of all the profiles is printed on stderr.
+
+The landmark model stays the one of the current profile, the gallery templates were encoded with it. Trying
+others (--landmarks) is only useful before re-enrolling the whole gallery with the chosen one.
+"""
+import argparse
+import json
+import sys
+from config import setup_logger
+from src.business_logic.bulk_enroll import read_entries
+from src.business_logic.calibration import calibrate
+from src.business_logic.host_profile import PROFILE_FILE, candidate_profiles, load_profile, save_profile
+
+logger = setup_logger(__name__)
+
+
+def print_result(done : int, total : int, result : dict) -> None:
+    print(
+        f"[{done}/{total}] {result['profile']:<28} {1000 * result['seconds_per_image']:>8.1f} ms/image"
+        f"  p95 {result['p95_ms']:>7.1f} ms  detected {result['detection_rate']:>6.1%}  recall {result['recall']:>6.1%}"
+        f"  false matches {result['false_matches']}",
+        file=sys.stderr
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Labeled sample: image directory or CSV file of path,name rows")
+    parser.add_argument("--recall-target", type=float, default=0.95, help="Smallest acceptable recall")
+    parser.add_argument("--max-false-match-rate", type=float, default=0.01, help="Largest acceptable share of faces matched to another person")
+    parser.add_argument("--tolerance", type=float, default=0.6, help="Matching tolerance of the live recognizer")
+    parser.add_argument("--output", default=PROFILE_FILE, help="Profile file loaded by the app")
+    parser.add_argument("--models", nargs="+", default=["hog"], choices=["hog", "cnn"], help="Detector models (cnn is slow without a GPU)")
+    parser.add_argument("--upsample", nargs="+", type=int, default=[0, 1, 2], help="Detector upsample counts")
+    parser.add_argument("--jitters", nargs="+", type=int, default=[1], help="Encoding num_jitters values")
+    parser.add_argument("--landmarks", nargs="+", choices=["small", "large"], help="Landmark models (default: the one of the current profile, which encoded the gallery)")
+    parser.add_argument("--scales", nargs="+", type=float, default=[0.25, 0.5, 1.0], help="Frame downscale factors")
+    parser.add_argument("--frame-side", type=int, default=1280, help="Longest side of the camera frames the sample stands for")
+    parser.add_argument("--report", help="Optional JSON file with the measures of every profile")
+    parser.add_argument("--dry-run", action="store_true", help="Do not write the profile file")
+    args = parser.parse_args(argv)
+
+    entries = read_entries(args.source)
+    if not entries:
+        print(f"No images found in {args.source}", file=sys.stderr)
+        return None
+
+    gallery_landmarks = load_profile(args.output).landmark_model
+    profiles = candidate_profiles(args.models, args.upsample, args.jitters, args.landmarks or [gallery_landmarks], args.scales)
+    logger.info(f"Calibrating {len(profiles)} profiles on {len(entries)} images")
+    profile, report = calibrate(entries, profiles, args.recall_target, args.tolerance, args.frame_side, progress=print_result, max_false_match_rate=args.max_false_match_rate)
+    if profile is None:
+        print(f"No readable images in {args.source}", file=sys.stderr)
+        return None
+    if profile.landmark_model != gallery_landmarks:
+        logger.warning(f"The chosen profile uses the {profile.landmark_model} landmarks but the gallery was encoded with the {gallery_landmarks} ones, re-enroll the gallery with this profile or live faces will not match it")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if not args.dry_run:
+        save_profile(profile, args.output, report)
+
+    print(json.dumps({"profile": profile._asdict(), **{key: value for key, value in report.items() if key != "results"}}), file=sys.stderr)
+    return profile
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Gallery maintenance: find the same face enrolled several times or under different names.
+
+Usage:
+    python -m src.cli.gallery_analysis --report clusters.json
+    python -m src.cli.gallery_analysis --tolerance 0.4 --merge
+    python -m src.cli.gallery_analysis --merge --collapse --max-cluster-size 20
+
+Every pair of templates closer than the tolerance is found with blocked matrix products (bounded memory),
+the pairs are grouped into clusters, and the clusters are reported as "duplicate" (one name) or
+"conflict" (several names). --merge renames every template of a cluster to its most frequent name,
+--collapse also keeps only the medoid template of each cluster. The gallery is written once. With --merge the
+gallery stays locked from the read to the write: the enrollments and deletions of the other processes wait
+for the merged gallery instead of being overwritten by it.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+from config import setup_logger
+from src.business_logic.add_known_face import FaceAdder
+from src.business_logic.gallery_analysis import analyze_gallery, merge_clusters
+
+logger = setup_logger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gallery-dir", default="known_faces_gallery")
+    parser.add_argument("--data-file", default="known_faces.pkl", help="Legacy pickle migrated if the gallery does not exist")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="Distance under which two templates are the same face")
+    parser.add_argument("--block-size", type=int, default=2048, help="Block size of the pairwise distance computation")
+    parser.add_argument("--report", help="Optional JSON file with every cluster")
+    parser.add_argument("--top", type=int, default=10, help="Number of clusters printed")
+    parser.add_argument("--merge", action="store_true", help="Give every template of a cluster the most frequent name of the cluster")
+    parser.add_argument("--collapse", action="store_true", help="With --merge, keep only the medoid template of each cluster")
+    parser.add_argument("--max-cluster-size", type=int, default=50, help="Larger clusters are reported but never merged")
+    args = parser.parse_args(argv)
+
+    face_adder = FaceAdder(data_file=args.data_file, tolerance=args.tolerance, gallery_dir=args.gallery_dir)
+    # The lock is taken before the read, a write of another process between the read and the merge would be lost
+    with face_adder.gallery.store.lock() if args.merge else contextlib.nullcontext():
+        face_adder.load_known_faces()  # Migrates the legacy pickle if needed
+        snapshot = face_adder.gallery.snapshot
+        encodings, names = snapshot.encodings, list(snapshot.names)
+
+        start_time = time.perf_counter()
+        report = analyze_gallery(encodings, names, face_adder.tolerance, args.block_size)
+        report["seconds"] = round(time.perf_counter() - start_time, 2)
+
+        for cluster in report["cluster_details"][:args.top]:
+            names_text = ", ".join(f"{name} x{count}" for name, count in cluster["names"].items())
+            print(f"{cluster['kind']:<10} {len(cluster['rows']):>5} templates  max link {cluster['max_link_distance']:.3f}  {names_text}", file=sys.stderr)
+
+        if args.merge and report["clusters"]:
+            merged_encodings, merged_names, merged = merge_clusters(encodings, names, report["cluster_details"], args.collapse, args.max_cluster_size)
+            face_adder.save_known_faces(merged_encodings, merged_names)
+            report["merged_clusters"] = merged
+            report["gallery_size_after_merge"] = len(merged_names)
+            logger.info(f"Merged {merged} clusters, the gallery now holds {len(merged_names)} templates")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps({key: value for key, value in report.items() if key != "cluster_details"}), file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
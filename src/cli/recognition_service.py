@@ -0,0 +1,67 @@
+"""
+Local recognition service: holds the gallery and the face_recognition models once for all the kiosks and tools
+of the machine (see src/business_logic/recognition_service.py for the endpoints).
+
+Usage:
+    python -m src.cli.recognition_service --port 8765
+    python -m src.cli.recognition_service --socket /tmp/face_recognition.sock --encoding-workers 4
+
+The kiosk app uses it with FACE_APP_SERVICE=http://127.0.0.1:8765 (or unix:/tmp/face_recognition.sock):
+enrollment and deletion then go through the service and every kiosk sees them on its next match.
+Stop with Ctrl+C, the journaled changes are folded into the gallery file on exit.
+"""
+import argparse
+import signal
+import threading
+from config import setup_logger
+from src.business_logic.ann_index import INDEX_KINDS
+from src.business_logic.host_profile import PROFILE_FILE, load_profile
+from src.business_logic.recognition_service import DEFAULT_PORT, RecognitionService
+
+logger = setup_logger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Local TCP port")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind, local only by default")
+    parser.add_argument("--socket", help="Unix socket path, used instead of the TCP port")
+    parser.add_argument("--gallery-dir", default="known_faces_gallery")
+    parser.add_argument("--data-file", default="known_faces.pkl", help="Legacy pickle migrated if the gallery does not exist")
+    parser.add_argument("--tolerance", type=float, default=0.6, help="Maximum distance of a match")
+    parser.add_argument("--duplicate-tolerance", type=float, default=0.4, help="Distance under which an enrolled face is a duplicate of another person")
+    parser.add_argument("--profile", default=PROFILE_FILE, help="Host profile written by the calibration command")
+    parser.add_argument("--encoding-workers", type=int, default=0, help="Processes encoding the faces (0 = encode in the request threads)")
+    parser.add_argument("--max-batch", type=int, default=256, help="Encodings per batched match")
+    parser.add_argument("--index", default="exact", choices=INDEX_KINDS, help="Gallery index: exact scan (default), ivf clusters or compact quantized codes (int8, pq) re-ranked exactly")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Milliseconds a match waits for concurrent ones to join its batch")
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.profile)
+    encoder = None
+    if args.encoding_workers > 0:
+        from src.business_logic.parallel_encoder import ParallelFaceEncoder
+        encoder = ParallelFaceEncoder(workers=args.encoding_workers, num_jitters=profile.num_jitters, model=profile.landmark_model)
+
+    service = RecognitionService(
+        args.gallery_dir, args.data_file, args.tolerance, args.duplicate_tolerance, profile=profile, encoder=encoder,
+        max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000, gallery_index=args.index
+    )
+    service.start()
+    service.serve(args.port, args.host, args.socket)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        if encoder is not None:
+            encoder.close()
+        logger.info("Recognition service stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,47 @@
-from ctypes import alignment
-from multiprocessing.pool import CLOSE
-from re import L
-from typing import Optional
-from venv import logger
+from typing import Optional, List, Any
 import flet as ft
-import cv2
-import base64
+import importlib
+import json
 import threading
 import time
-import face_recognition
-import numpy as np
-from queue import Queue
 # import pygame
-import os
 
-from sympy import loggamma
+# Only light modules are imported with the window: OpenCV, face_recognition (which loads the dlib models)
+# and the camera pipeline are imported by the warm-up thread and on first use
+from config import setup_logger
 from src.business_logic.add_known_face import FaceAdder
-from src.utils.sound_player import play_sound_sync
+from src.business_logic.gallery_matcher import GalleryMatcher
+from src.business_logic.ann_index import make_index
+from src.business_logic.event_log import EventLog
+from src.business_logic.host_profile import PROFILE_FILE, load_profile
+from src.utils.audio_engine import AudioEngine, make_sink
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
 
 class FaceRecognitionApp:
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, encoding_workers : int = 0, sources : Optional[List[Any]] = None, metrics_file : Optional[str] = None, metrics_port : Optional[int] = None, audio_sink : str = "auto", started_at : Optional[float] = None, events_db : str = "recognition_events.db", target_fps : Optional[float] = 10.0, max_latency : float = 0.15, controller_log : Optional[str] = None, profile_file : str = PROFILE_FILE, process_pipeline : bool = False, service : Optional[str] = None, gallery_index : str = "exact"):
+        """
+        :param page: Flet page of the app
+        :param encoding_workers: Number of processes used to encode faces (0 = encode serially in the camera thread)
+        :param sources: Video sources: USB indices ("0"), stream URLs or video files, optionally (uri, priority) tuples
+        :param metrics_file: Optional Prometheus text file refreshed every second while the camera runs
+        :param metrics_port: Optional local port serving the metrics at http://127.0.0.1:<port>/metrics
+        :param audio_sink: Output of the sound alerts: "auto", "device", "null" or "file:<path.wav>"
+        :param started_at: time.perf_counter() at process start, the startup metrics are measured from it
+        :param events_db: SQLite database of the recognition events (history)
+        :param target_fps: Processed frames per second per stream, the detection resolution and frame stride adapt to it (None = fixed settings)
+        :param max_latency: Maximum seconds of one inference when adapting
+        :param controller_log: Optional JSON lines file the adaptive controller decisions are appended to when the camera stops
+        :param profile_file: Detector and encoder profile of the host written by the calibration command (default settings if missing)
+        :param process_pipeline: Capture and inference run in their own processes and share the frames through shared memory
+                                 (default: threads of this process)
+        :param service: Optional address of the local recognition service ("http://127.0.0.1:8765" or "unix:<path>"),
+                        the gallery is then the one of the service, shared with the other kiosks
+        :param gallery_index: Candidate index of the gallery, "exact" (default), "ivf" (approximate) or compact quantized codes ("int8", "pq")
+                              re-ranked exactly (see ann_index.make_index)
+        """
+        self.started_at = started_at if started_at is not None else time.perf_counter()
         self.page = page
         self.page.title = "Real-Time Face Recognition"
         self.page.window.width = 800
@@ -29,27 +51,87 @@ class FaceRecognitionApp:
         self.stop_camera_flag = threading.Event()
         self.camera_running = False
 
-        # Face recognition data - these will be managed by business logic
-        self.known_face_encodings = []
-        self.known_face_names = []
+        # Face recognition data - owned by the gallery of the business logic, the live matcher reads its snapshots.
+        # With a recognition service, the gallery and the matches are the ones of the service
+        self.gallery = None
+        if service:
+            from src.business_logic.recognition_client import RecognitionClient, RemoteGallery
+            self.gallery = RemoteGallery(RecognitionClient(service))
+            self.matcher = self.gallery.matcher
+        else:
+            self.matcher = GalleryMatcher(index=make_index(gallery_index))
 
         # # Sound initializations
         # init_sound_system()
 
-        # Sound queue for non-blocking audio
-        self.sound_queue = Queue()
-        self.sound_thread = None
-        self.stop_sound_flag = threading.Event()
+        # Non-blocking audio alerts: waveforms synthesized once, one persistent output stream
+        self.audio = AudioEngine(make_sink(audio_sink))
+        self.audio.start()
+
+        # Audit history: the recognitions are queued without blocking and inserted in batches by a writer thread
+        self.event_log = EventLog(events_db)
+        self.event_log.start()
 
-        # Track last detection to avoid spam
+        # Track last detection per face track to avoid spam
         self.last_detection_time = {}
         self.detection_cooldown = 2.0 # In seconds
 
+        # Detector and encoder settings calibrated for this host, shared by the live loop and enrollment
+        self.profile = load_profile(profile_file)
+
+        # Opt-in multi-core encoding backend shared by the camera loop and enrollment
+        self.encoder = None
+        if encoding_workers > 0:
+            from src.business_logic.parallel_encoder import ParallelFaceEncoder
+            self.encoder = ParallelFaceEncoder(workers=encoding_workers, num_jitters=self.profile.num_jitters, model=self.profile.landmark_model)
+
+        # Camera pipeline: one capture thread per source -> shared inference / render through latest-frame-wins slots.
+        # The recognizer is created by the warm-up thread once the models are loaded
+        self.sources = sources or ["0"]
+        self.recognizer = None
+        self.models_ready = threading.Event()
+        self.models_error = None
+        self.camera_started_at = None
+        self.camera_engine = None
+        self.sessions = None  # Camera session manager shared by the live loop and enrollment, created by the warm-up thread
+        self.target_fps = target_fps
+        self.max_latency = max_latency
+        self.controller_log = controller_log
+        # The inference processes read the gallery files, which belong to the service when there is one
+        self.gallery_index = gallery_index
+        self.process_pipeline = process_pipeline and not service
+        if process_pipeline and service:
+            logger.warning("The process pipeline does not use the recognition service, running the camera pipeline in threads")
+        self.enrolling = False
+        self.announced_tracks = {}
+        self.display_transports = {}
+
+        # Metrics export
+        self.metrics_file = metrics_file
+        if metrics_port:
+            metrics.serve(metrics_port)
 
         # UI elements
         self.status_text = ft.Text("Click a button to begin.", size=16, selectable=True)
         self.image_display = ft.Image(src="", width=640, height=360, fit="CONTAIN")
+
+        # One display per stream, the first one is the main image_display
+        self.stream_displays = {}
+        self.stream_captions = {}
+        for i, source in enumerate(self.sources):
+            name = str(source[0] if isinstance(source, tuple) else source)
+            if i == 0 and len(self.sources) == 1:
+                self.stream_displays[name] = self.image_display
+            else:
+                self.stream_displays[name] = ft.Image(src="", width=320, height=180, fit="CONTAIN")
+            self.stream_captions[name] = ft.Text("", size=12, selectable=True)
         self.start_button = ft.ElevatedButton("Start Camera", on_click=self.start_camera_click)
+        self.pipeline_stats_text = ft.Text("", size=12, selectable=True)
+
+        # Optional live metrics overlay drawn on top of the streams
+        self.metrics_text = ft.Text("", size=11, font_family="monospace", color="white", selectable=True)
+        self.metrics_overlay = ft.Container(self.metrics_text, left=0, top=0, padding=6, bgcolor="#99000000", visible=False)
+        self.metrics_switch = ft.Switch(label="Show metrics", value=False, on_change=self.toggle_metrics_overlay)
 
         # Delete face UI
         self.name_input_to_delete = ft.TextField(label="Enter name to delete")
@@ -83,7 +165,29 @@ class FaceRecognitionApp:
         self.add_face_button = ft.ElevatedButton("Add Known Face", on_click=self.add_face_click)
 
         # Face count display
-        self.face_count_text = ft.Text(f"Known faces: {len(self.known_face_encodings)}", size=14, selectable=True)
+        self.face_count_text = ft.Text("Known faces: 0", size=14, selectable=True)
+
+        # Recognition history UI
+        self.history_name_input = ft.TextField(label="Name (empty = everyone)", width=220)
+        self.history_range = ft.Dropdown(
+            label="Period",
+            width=150,
+            value="24",
+            options=[ft.dropdown.Option("1", "Last hour"), ft.dropdown.Option("24", "Last 24 hours"), ft.dropdown.Option("168", "Last 7 days"), ft.dropdown.Option("0", "Everything")]
+        )
+        self.history_list = ft.ListView(height=300, width=560, spacing=2)
+        self.history_summary = ft.Text("", size=12, selectable=True)
+        self.history_dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("Recognition history", selectable=True),
+            content=ft.Column([
+                ft.Row([self.history_name_input, self.history_range, ft.IconButton(icon=ft.icons.SEARCH, tooltip="Search", on_click=self.search_history)]),
+                self.history_summary,
+                self.history_list
+            ], tight=True),
+            actions=[ft.TextButton("Close", on_click=self.close_history_dialog)]
+        )
+        self.history_button = ft.ElevatedButton("History", on_click=self.history_click)
 
         # Add instructions for the app
         self.instructions_dialog = ft.AlertDialog(
@@ -100,10 +204,63 @@ class FaceRecognitionApp:
 
         self.build_ui()
         self.page.window.on_event = self.on_window_event
+        self.record_startup("window")
+
+        # Initialize FaceAdder (business logic), enrollment captures from the first source
+        camera_uri = self.sources[0][0] if isinstance(self.sources[0], tuple) else self.sources[0]
+        self.face_adder = FaceAdder(matcher=self.matcher, encoder=self.encoder, camera_uri=camera_uri, gallery=self.gallery, profile=self.profile)
+
+        # Load the models in the background while the gallery loads and the user looks at the window
+        threading.Thread(target=self.warm_up, daemon=True).start()
 
-        # Initialize FaceAdder (business logic)
-        self.face_adder = FaceAdder()
         self.load_known_faces()
+        self.record_startup("gallery")
+
+    def warm_up(self) -> None:
+        """
+        Background thread: import the vision libraries, run the detector and the encoder once on a dummy frame
+        (and start the encoding processes) so the first camera frame does not pay for it
+        """
+        try:
+            # Imported for their load time only (the modules are cached for the code that uses them later)
+            for module in ("cv2", "face_recognition"):
+                start = time.perf_counter()
+                importlib.import_module(module)
+                metrics.set_gauge("import_seconds", time.perf_counter() - start, module=module)
+
+            start = time.perf_counter()
+            from src.business_logic.recognizer import FaceRecognizer
+            from src.business_logic.camera_session import CameraSessionManager
+            importlib.import_module("src.business_logic.multi_camera")
+            importlib.import_module("src.utils.display_transport")
+            metrics.set_gauge("import_seconds", time.perf_counter() - start, module="pipeline")
+
+            # The live loop and enrollment open the cameras through the same sessions
+            self.sessions = CameraSessionManager()
+            self.face_adder.sessions = self.sessions
+
+            start = time.perf_counter()
+            import numpy as np
+            dummy_frame = np.zeros((120, 160, 3), dtype=np.uint8)
+            self.profile.detect(dummy_frame)
+            self.profile.encode(dummy_frame, [(20, 100, 100, 20)])
+            if self.encoder is not None:
+                self.encoder.encode(dummy_frame, [(20, 100, 100, 20)])
+            metrics.set_gauge("warmup_seconds", time.perf_counter() - start)
+
+            self.recognizer = FaceRecognizer(self.matcher, encoder=self.encoder, profile=self.profile)
+            self.record_startup("models")
+        except Exception as e:
+            self.models_error = str(e)
+            logger.error(f"Failed to load the face recognition models: {e}")
+        finally:
+            self.models_ready.set()
+
+    def record_startup(self, phase : str) -> None:
+        """Record the seconds from process start to a startup phase (window, gallery, models, first_recognition)"""
+        seconds = time.perf_counter() - self.started_at
+        metrics.set_gauge("startup_seconds", seconds, phase=phase)
+        logger.info(f"Startup: {phase} ready after {seconds:.2f}s")
 
     def build_ui(self):
         """Build the user interface"""
@@ -116,14 +273,17 @@ class FaceRecognitionApp:
                         weight=ft.FontWeight.W_900,
                         selectable=True)
                 ], alignment="center"),
-                ft.Container(self.image_display, alignment=ft.alignment.center),
+                ft.Stack([self.build_streams_grid(), self.metrics_overlay]),
                 ft.Row([
                     self.start_button, 
                     self.add_face_button,
-                    self.delete_face_button
+                    self.delete_face_button,
+                    self.history_button,
+                    self.metrics_switch
                 ], alignment="center"),
                 self.status_text,
                 self.face_count_text,
+                self.pipeline_stats_text,
                 ft.Divider(),
                 ft.Row([
                     self.help_icon_button
@@ -132,6 +292,16 @@ class FaceRecognitionApp:
             ], alignment="center")
         )
 
+    def build_streams_grid(self):
+        """Build the display of the video streams: one image, or a grid of images for several sources"""
+        cells = [
+            ft.Column([self.stream_displays[name], self.stream_captions[name]], horizontal_alignment="center")
+            for name in self.stream_displays
+        ]
+        if len(cells) == 1:
+            return ft.Container(cells[0], alignment=ft.alignment.center)
+        return ft.Row(cells, wrap=True, alignment="center")
+
     def update_status_text(self, message):
         """Update status text and refresh UI"""
         self.status_text.value = message
@@ -140,156 +310,237 @@ class FaceRecognitionApp:
     def load_known_faces(self):
         """Load known faces using business logic"""
         try:
-            encodings, names = self.face_adder.load_known_faces()
-            self.known_face_encodings = encodings
-            self.known_face_names = names
+            self.face_adder.load_known_faces()
             self.update_face_count()
         except Exception as e:
             self.update_status_text(f"Error loading faces: {str(e)}")
 
     def update_face_count(self):
         """Update the face count display"""
-        self.face_count_text.value = f"Known faces: {len(self.known_face_encodings)}"
+        gallery = self.face_adder.gallery
+        self.face_count_text.value = f"Known faces: {gallery.identity_count()} ({gallery.count()} templates)"
         self.page.update()
     
 
-    def sound_worker(self) -> None:
-        """Worker thread for playing sounds without blocking main camera loop"""
-        while not self.stop_sound_flag.is_set():
-            try:
-                # Wait for sound request with timeout
-                if not self.sound_queue.empty():
-                    sound_type = self.sound_queue.get(timeout=0.1)
-                    play_sound_sync(sound_type)
-                else: # No sound insert into the queue
-                    time.sleep(0.1)
-            except Exception as e:
-                logger.error(f"Sound worker error: {e}")
-                raise
-
-
-    def start_sound_worker(self) -> None:
-        """
-        Start the sound worker thread
-        """
-        if self.sound_thread is None or not self.sound_thread.is_alive():
-            self.stop_sound_flag.clear()
-            self.sound_thread = threading.Thread(target=self.sound_worker, daemon=True)
-            self.sound_thread.start()
-
-    def queue_sound(self, sound_type : str, person_name : Optional[str]=None):
-        """Queue a sound to be played (non-blocking)"""
+    def queue_sound(self, sound_type : str, alert_key : Optional[str]=None):
+        """Queue a sound to be played (non-blocking), alert_key identifies the face track for the cooldown"""
         current_time = time.time()
         
         # Check cooldown to avoid sound spam
-        if person_name:
-            last_time = self.last_detection_time.get(person_name, 0)
+        if alert_key:
+            last_time = self.last_detection_time.get(alert_key, 0)
             if current_time - last_time < self.detection_cooldown:
                 return
-            self.last_detection_time[person_name] = current_time
+            self.last_detection_time[alert_key] = current_time
         
-        # Add to queue if not full
-        if self.sound_queue.qsize() < 5:  # Limit queue size
-            self.sound_queue.put(sound_type)
+        # Dropped by the audio engine if its queue is full
+        self.audio.play(sound_type)
 
     def start_camera(self) -> None:
-        """Start camera stream with face recognition and sound alerts"""
-        
-        # Start sound worker
-        self.start_sound_worker()
-        
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
+        """
+        Start camera streams with face recognition and sound alerts.
+        Every source has its own capture thread, the inference workers share one matcher and are
+        scheduled fairly across the sources, and the display runs at camera rate with the most recent overlay.
+        """
+        self.camera_started_at = time.perf_counter()
+        if not self.models_ready.is_set():
+            self.update_status_text("Loading face recognition models...")
+            self.models_ready.wait()
+        if self.recognizer is None:
+            self.update_status_text(f"Error loading face recognition models: {self.models_error}")
+            return
+
+        # Already imported by the warm-up thread
+        from src.business_logic.multi_camera import MultiCameraRecognizer
+        from src.utils.display_transport import DisplayTransport
+
+        if self.process_pipeline:
+            from src.business_logic.process_pipeline import ProcessCameraRecognizer
+            # The inference process loads the gallery from disk and follows the changes made by enrollment
+            self.camera_engine = ProcessCameraRecognizer(
+                self.sources, on_recognitions=self.on_recognitions, gallery_dir=self.face_adder.store.directory, data_file=self.face_adder.data_file,
+                tolerance=self.matcher.tolerance, profile=self.profile, target_fps=self.target_fps, max_latency=self.max_latency, sessions=self.sessions,
+                gallery_index=self.gallery_index
+            )
+        else:
+            self.camera_engine = MultiCameraRecognizer(self.sources, self.recognizer, on_recognitions=self.on_recognitions, sessions=self.sessions, target_fps=self.target_fps, max_latency=self.max_latency)
+        opened = self.camera_engine.start()
+        if not opened:
+            self.camera_engine.stop()
             self.update_status_text("Error: Unable to access the camera.")
             return
 
+        # The cameras are held by the capture processes, enrollment samples them through the engine
+        if self.process_pipeline:
+            self.face_adder.sessions = self.camera_engine
         self.update_status_text("Camera is running... Detecting faces...")
-
-        # Process every nth frame for better performance
-        process_this_frame = True
-        previous_face_names = []
-
-        while not self.stop_camera_flag.is_set():
-            ret, frame = cap.read()
-            if not ret:
-                self.update_status_text("Error: Failed to read frame.")
-                break
-
-            # Resize frame for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-
-            # Only process every other frame to save time
-            if process_this_frame:
-                face_locations = face_recognition.face_locations(rgb_small_frame)
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-
-                face_names = []
-                for face_encoding in face_encodings:
-                    matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
-                    name = "Unknown"
-
-                    if True in matches:
-                        face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = self.known_face_names[best_match_index]
-
-                    face_names.append(name)
-
-                # Check for new faces and queue sounds
-                for name in face_names:
-                    if name not in previous_face_names:
-                        if name != "Unknown":
-                            self.queue_sound("known", name)
-                        else:
-                            self.queue_sound("unknown", "Unknown")
-                
-                previous_face_names = face_names.copy()
-
-            process_this_frame = not process_this_frame
-
-            # Draw rectangles and labels on the frame
-            for (top, right, bottom, left), name in zip(face_locations, face_names):
-                # Scale back up face locations since the frame we detected in was scaled to 1/4 size
-                top *= 4
-                right *= 4
-                bottom *= 4
-                left *= 4
-
-                # Choose color based on recognition
-                color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)  # Green for known, Red for unknown
-
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-
-                # Draw label
-                cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                font = cv2.FONT_HERSHEY_DUPLEX
-                cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.8, (255, 255, 255), 1)
-
-            # Resize frame for display
-            frame = cv2.resize(frame, (640, 360))
-            ret, buffer = cv2.imencode(".jpg", frame)
-            if not ret:
-                continue
-
-            img_b64 = base64.b64encode(buffer).decode("utf-8")
-            self.image_display.src_base64 = img_b64
-            self.page.update()
-
-            time.sleep(0.1)  # Small delay to prevent overwhelming the UI
-
-        cap.release()
+        self.announced_tracks = {}
+        self.last_detection_time = {}
+        last_stats_time = time.time()
+
+        # One transport per stream: only its image control is updated, from its own sender thread
+        self.display_transports = {
+            name: DisplayTransport(image_display, image_display.width, image_display.height)
+            for name, image_display in self.stream_displays.items()
+        }
+
+        # Render stage: runs on every captured frame, stale frames are dropped by the slots
+        while not self.stop_camera_flag.is_set() and self.camera_engine.is_running:
+            for source, frame in self.camera_engine.next_render_frames(timeout=0.5):
+                transport = self.display_transports[source.name]
+                # A frame the UI cannot show yet is neither drawn nor encoded
+                if not transport.ready():
+                    continue
+
+                # Resize into the reusable display buffer of the source first, so the overlay
+                # is drawn on the small frame and the captured frame is never written
+                width, height = transport.frame_size()
+                display_frame = source.display_buffers.display(frame, (width, height))
+
+                recognitions = source.overlay_slot.peek() or []
+                with metrics.time_stage("overlay"):
+                    self.draw_overlay(display_frame, recognitions, width / frame.shape[1], height / frame.shape[0])
+
+                if transport.submit(display_frame):
+                    source.display_rate.tick()
+
+            # Refresh the per-stream FPS, pipeline counters and metrics once per second,
+            # the images are pushed by their transports so the whole page is only updated here
+            if time.time() - last_stats_time >= 1.0:
+                # A gallery changed by another process (bulk import, maintenance tool) is picked up here,
+                # the check is a stat of the gallery directory
+                try:
+                    if self.face_adder.gallery.reload_if_changed():
+                        self.update_face_count()
+                except Exception as e:
+                    logger.error(f"Failed to reload the gallery: {e}")
+                self.update_stream_stats()
+                self.update_metrics()
+                self.page.update()
+                last_stats_time = time.time()
+
+        for transport in self.display_transports.values():
+            if self.stop_camera_flag.is_set():
+                transport.clear()
+            transport.close()
+
+        errors = [f"{source.name}: {source.error}" for source in self.camera_engine.sources if source.error]
+        self.write_controller_log()
+        self.camera_engine.stop()
+        self.face_adder.sessions = self.sessions
         
-        # Stop sound worker
-        self.stop_sound_flag.set()
-        if self.sound_thread and self.sound_thread.is_alive():
-            self.sound_thread.join(timeout=1.0)
+        # Alerts of the stopped streams that were not played yet are dropped
+        self.audio.clear()
         
-        self.update_status_text("Camera stopped.")
+        if errors and not self.stop_camera_flag.is_set():
+            self.update_status_text("Error: " + ", ".join(errors))
+        else:
+            self.update_status_text("Camera stopped.")
         time.sleep(3)
         self.update_status_text("Click a button to begin.")
 
+    def on_recognitions(self, source, recognitions) -> None:
+        """Called by the inference workers: queue sounds for the face tracks that appeared or changed identity on a source"""
+        announced = self.announced_tracks.setdefault(source.name, {})
+
+        # Time to the first recognized frame, from the camera start and from the process start
+        if self.camera_started_at is not None:
+            metrics.set_gauge("first_recognition_seconds", time.perf_counter() - self.camera_started_at)
+            self.camera_started_at = None
+            self.record_startup("first_recognition")
+
+        # Check for new tracks (or new identities of a track): log the sighting and queue sounds
+        for recognition in recognitions:
+            track = recognition.track_id if recognition.track_id >= 0 else recognition.name
+            if announced.get(track) != recognition.name:
+                announced[track] = recognition.name
+                # Dropped by the event log if its queue is full, the inference worker never waits for the disk
+                self.event_log.record(source.name, recognition)
+                sound_type = "known" if recognition.name != "Unknown" else "unknown"
+                self.queue_sound(sound_type, f"{source.name}:{track}")
+
+        # Forget the tracks that ended
+        active_tracks = set(source.tracker.active_track_ids) if source.tracker is not None else {r.name for r in recognitions}
+        for track in [track for track in announced if track not in active_tracks]:
+            del announced[track]
+            self.last_detection_time.pop(f"{source.name}:{track}", None)
+
+    def write_controller_log(self) -> None:
+        """Append the decisions of the adaptive controllers of this run to the controller log file"""
+        if not self.controller_log or self.camera_engine is None:
+            return
+        try:
+            with open(self.controller_log, "a", encoding="utf-8") as f:
+                for decision in self.camera_engine.decision_log():
+                    f.write(json.dumps(decision) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to write controller log {self.controller_log}: {e}")
+
+    def draw_overlay(self, frame, recognitions, scale_x : float = 1.0, scale_y : float = 1.0) -> None:
+        """Draw rectangles and labels of the recognized faces on the frame, scale_x / scale_y map full frame coordinates to it"""
+        from src.utils.overlay import draw_recognitions
+        draw_recognitions(frame, recognitions, scale_x, scale_y)
+
+    def pipeline_stats(self) -> dict:
+        """
+        Get the per-stream FPS and the per-stage queue depth and drop counters of the camera pipeline
+
+        :return: Dict {source name: {"capture_fps", "inference_fps", "inference": {...}, "render": {...}}}
+        """
+        if self.camera_engine is None:
+            return {}
+        return self.camera_engine.stats()
+
+    def update_stream_stats(self) -> None:
+        """Refresh the caption of every stream and the pipeline counters"""
+        stats = self.pipeline_stats()
+        for name, caption in self.stream_captions.items():
+            source_stats = stats.get(name)
+            if source_stats:
+                caption.value = f"{name}: {source_stats['capture_fps']:.1f} FPS, recognition {source_stats['inference_fps']:.1f} FPS, display {source_stats['display_fps']:.1f} FPS"
+                transport = self.display_transports.get(name)
+                if transport is not None:
+                    caption.value += f" (JPEG q{transport.quality}, {transport.scale:.0%} size, {transport.stats()['kb_per_frame']} kB)"
+                controller = source_stats.get("controller")
+                if controller:
+                    caption.value += f", detection scale {controller['scale']:.2f} x{2 ** controller['upsample']} every {controller['stride']} frames"
+                motion = source_stats.get("motion")
+                if motion:
+                    caption.value += f", detection skipped {motion['skipped_fraction']:.0%} / ROI only {motion['roi_fraction']:.0%}"
+
+        self.pipeline_stats_text.value = " | ".join(
+            f"{name}: inference depth {source_stats['inference']['depth']}, dropped {source_stats['inference']['dropped']}, "
+            f"render depth {source_stats['render']['depth']}, dropped {source_stats['render']['dropped']}"
+            for name, source_stats in stats.items() if isinstance(source_stats, dict)
+        ) + f" | inference load {stats.get('utilization', 0):.0%}"
+
+        event_stats = self.event_log.stats()
+        self.pipeline_stats_text.value += f" | events {event_stats['written']} logged ({event_stats['events_per_second']:.0f}/s), {event_stats['dropped']} dropped"
+
+    def update_metrics(self) -> None:
+        """Publish the pipeline gauges, refresh the metrics overlay and the Prometheus text file"""
+        if self.camera_engine is not None:
+            self.camera_engine.publish_metrics()
+        metrics.set_gauge("sound_queue_depth", self.audio.queue.qsize())
+        metrics.set_gauge("sound_dropped", self.audio.dropped)
+        self.event_log.publish_metrics()
+
+        if self.metrics_overlay.visible:
+            self.metrics_text.value = metrics.summary_text()
+
+        if self.metrics_file:
+            try:
+                metrics.write_prometheus(self.metrics_file)
+            except OSError as e:
+                logger.error(f"Failed to write metrics file {self.metrics_file}: {e}")
+
+    def toggle_metrics_overlay(self, e):
+        """Show or hide the live metrics overlay"""
+        self.metrics_overlay.visible = self.metrics_switch.value
+        if self.metrics_overlay.visible:
+            self.metrics_text.value = metrics.summary_text()
+        self.page.update()
+
     def start_camera_click(self, e):
         """Handle start/stop camera button click"""
         if not self.camera_running:
@@ -302,22 +553,18 @@ class FaceRecognitionApp:
             self.stop_camera_flag.set()
             self.camera_running = False
             self.start_button.text = "Start Camera"
-            self.image_display.src_base64 = ""  # Clear image on stop
+            for image_display in self.stream_displays.values():
+                image_display.src_base64 = ""  # Clear image on stop
             self.stop_camera_flag.set()
-            self.stop_sound_flag.set()
             
             # Clean up sound queue
-            while not self.sound_queue.empty():
-                try:
-                    self.sound_queue.get_nowait()
-                except:
-                    break
+            self.audio.clear()
             self.page.update()
 
     def add_face_click(self, e):
-        """Handle add face button click"""
-        if self.camera_running:
-            self.update_status_text("Please stop the camera before adding a new face.")
+        """Handle add face button click, enrollment shares the camera stream so recognition keeps running"""
+        if self.enrolling:
+            self.update_status_text("A face is already being captured.")
             return
         
         self.page.dialog = self.add_dialog
@@ -338,20 +585,34 @@ class FaceRecognitionApp:
         self.add_dialog.open = False
         self.page.update()
 
-        self.update_status_text("Capturing face... Please look at the camera.")
-        
         # Get the name from input field
         name = self.name_input_to_add.value.strip() if self.name_input_to_add.value.strip() else None
         
         ## TODO - Must to write name(no optional). Add check if self.name_input.value is not empty string.
 
+        # Capture and encoding run in their own thread, the UI and the live loop are not blocked
+        self.enrolling = True
+        self.add_face_button.disabled = True
+        threading.Thread(target=self.enroll_face, args=(name,), daemon=True).start()
+
+    def enroll_face(self, name : Optional[str]) -> None:
+        """
+        Enrollment thread: capture a burst from the shared camera stream and add its best face to the database
+
+        :param name: Name of the person, None for a generated one
+        """
+        self.update_status_text("Capturing face... Please look at the camera.")
+
         # Use business logic to add face
         try:
-            success, message = self.face_adder.capture_and_add_face(
-                name=name,
-                known_encodings=self.known_face_encodings, 
-                known_names=self.known_face_names
-            )
+            if not self.models_ready.is_set():
+                self.update_status_text("Loading face recognition models...")
+                self.models_ready.wait()
+            if self.recognizer is None:
+                self.update_status_text(f"Error loading face recognition models: {self.models_error}")
+                return
+
+            success, message = self.face_adder.capture_and_add_face(name=name)
             
             self.update_status_text(message)
 
@@ -364,10 +625,14 @@ class FaceRecognitionApp:
             self.page.update()
 
             time.sleep(3)
-            self.update_status_text("Click a button to begin.")
+            self.update_status_text("Camera is running... Detecting faces..." if self.camera_running else "Click a button to begin.")
                 
         except Exception as e:
             self.update_status_text(f"Error adding face: {str(e)}")
+        finally:
+            self.enrolling = False
+            self.add_face_button.disabled = False
+            self.page.update()
 
 
     def delete_face_click(self, e):
@@ -400,11 +665,7 @@ class FaceRecognitionApp:
             return
         
         # Call delete function from bussiness_logic
-        success, message = self.face_adder.delete_face(
-            name=name_to_delete,
-            known_encodings=self.known_face_encodings,
-            known_names=self.known_face_names
-        )
+        success, message = self.face_adder.delete_face(name=name_to_delete)
         self.status_text.value = message
         self.page.update()
         
@@ -417,16 +678,68 @@ class FaceRecognitionApp:
         self.name_input_to_delete.value = ""
         self.update_status_text("Click a button to begin.")
 
+    def history_click(self, e):
+        """
+        Opening the history dialog with the sightings of the last 24 hours
+        """
+        self.page.dialog = self.history_dialog
+        self.history_dialog.open = True
+        self.search_history(e)
+
+    def close_history_dialog(self, e):
+        self.history_dialog.open = False
+        self.page.update()
+
+    def search_history(self, e):
+        """
+        Query the event log by name and period (indexed queries) and show the most recent sightings
+        """
+        name = self.history_name_input.value.strip() if self.history_name_input.value else ""
+        hours = int(self.history_range.value or 0)
+        since = time.time() - hours * 3600 if hours else None
+
+        try:
+            # Events still waiting in the queue are committed first, so a face seen a moment ago is listed
+            self.event_log.flush(timeout=1.0)
+            events = self.event_log.query(name=name or None, since=since, limit=200)
+            counts = self.event_log.name_counts(since=since, limit=5) if not name else []
+        except Exception as ex:
+            self.history_summary.value = f"Error reading the history: {ex}"
+            self.page.update()
+            return
+
+        self.history_list.controls = [
+            ft.Text(
+                f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['timestamp']))}  {event['camera']:<10} {event['name']}"
+                + (f" ({event['distance']:.2f})" if event["distance"] is not None else ""),
+                size=12, font_family="monospace", selectable=True
+            )
+            for event in events
+        ]
+        self.history_summary.value = f"{len(events)} sightings shown" + (
+            " | most seen: " + ", ".join(f"{count_name} x{count}" for count_name, count, _ in counts) if counts else ""
+        )
+        self.page.update()
+
     def on_window_event(self, e: ft.WindowEvent):
         """Handle window events"""
         if e.data == "close":
             self.stop_camera_flag.set()
             self.camera_running = False
-            # Save faces before closing using business logic
+            # Fold the journaled changes into the gallery file before closing using business logic
             try:
-                self.face_adder.save_known_faces(self.known_face_encodings, self.known_face_names)
+                self.face_adder.compact_known_faces()
             except Exception as ex:
                 print(f"Error saving faces on close: {ex}")
+
+            if self.encoder is not None:
+                self.encoder.close()
+            if self.sessions is not None:
+                self.sessions.close()
+            metrics.stop_serving()
+            self.audio.close()
+            # Commit the queued recognition events
+            self.event_log.close()
     
     def open_help_dialog(self, e):
         self.instructions_dialog.open = True
@@ -437,8 +750,9 @@ class FaceRecognitionApp:
         return ft.Column([
             ft.Text("Instructions:", weight="bold", selectable=True),
             ft.Text("• Start Camera: Begin face recognition", size=14, selectable=True),
-            ft.Text("• Add new Face: Capture and save a new face", size=14, selectable=True),
+            ft.Text("• Add new Face: Capture and save a new face (the camera can keep running)", size=14, selectable=True),
             ft.Text("• Delete known face: Enter the name you want to delete from db", size=14, selectable=True),
+            ft.Text("• History: Who was seen, when and on which camera", size=14, selectable=True),
             ft.Text("• Green box = Recognized, Red box = Unknown", size=14, selectable=True),
         ])
     
@@ -0,0 +1,232 @@
+"""
+Non-blocking audio alerts.
+
+The alert waveforms are synthesized once, a worker thread woken by a blocking queue hands them to a sink,
+and the sound device sink mixes overlapping alerts into one persistent output stream, so playing an
+alert never waits for the previous one to end. Sinks:
+    SoundDeviceSink - sounddevice OutputStream with a mixing callback
+    FileSink        - appends the alerts to a WAV file (headless machines, tests)
+    NullSink        - discards the alerts
+"""
+from typing import Dict, Optional
+from collections import deque
+from queue import Queue, Empty, Full
+import threading
+import time
+import wave
+import numpy as np
+from config import setup_logger
+from src.utils.metrics import metrics
+from src.utils.sound_player import siren_waveform, wonderful_waveform
+
+logger = setup_logger(__name__)
+
+SAMPLE_RATE = 44100
+
+
+def synthesize_alerts(sample_rate : int = SAMPLE_RATE) -> Dict[str, np.ndarray]:
+    """
+    Synthesize the alert waveforms
+
+    :param sample_rate: Audio sampling rate
+    :return: Dict {sound type: mono float32 waveform}
+    """
+    return {
+        "known": wonderful_waveform(sample_rate=sample_rate).astype(np.float32),
+        "unknown": siren_waveform(sample_rate=sample_rate).astype(np.float32)
+    }
+
+
+class NullSink:
+    """Sink that discards the alerts"""
+
+    def start(self) -> None:
+        pass
+
+    def play(self, waveform : np.ndarray) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FileSink:
+    def __init__(self, path : str, sample_rate : int = SAMPLE_RATE):
+        """
+        Initialize FileSink: every alert is appended to a mono 16-bit WAV file
+
+        :param path: WAV file path
+        :param sample_rate: Audio sampling rate
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.played = 0
+        self._file = None
+
+    def start(self) -> None:
+        self._file = wave.open(self.path, "wb")
+        self._file.setnchannels(1)
+        self._file.setsampwidth(2)
+        self._file.setframerate(self.sample_rate)
+
+    def play(self, waveform : np.ndarray) -> None:
+        self._file.writeframes((np.clip(waveform, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+        self.played += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SoundDeviceSink:
+    def __init__(self, sample_rate : int = SAMPLE_RATE, block_size : int = 512, max_voices : int = 8):
+        """
+        Initialize SoundDeviceSink: one persistent output stream, the alerts being played are mixed in its callback
+
+        :param sample_rate: Audio sampling rate
+        :param block_size: Frames per callback (latency = block_size / sample_rate)
+        :param max_voices: Maximum number of alerts mixed at once, the oldest ones are cut beyond it
+        """
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.max_voices = max_voices
+
+        self._pending = deque()  # Waveforms handed over to the callback thread, deque append/popleft are thread safe
+        self._voices = []        # [waveform, position] being played, only touched by the callback
+        self._stream = None
+
+    def start(self) -> None:
+        import sounddevice as sd
+
+        self._stream = sd.OutputStream(samplerate=self.sample_rate, channels=1, dtype="float32", blocksize=self.block_size, callback=self._callback)
+        self._stream.start()
+
+    def play(self, waveform : np.ndarray) -> None:
+        self._pending.append(waveform)
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def _callback(self, outdata : np.ndarray, frames : int, time_info, status) -> None:
+        while self._pending:
+            self._voices.append([self._pending.popleft(), 0])
+        del self._voices[:-self.max_voices]
+
+        output = outdata[:, 0]
+        output.fill(0.0)
+        for voice in self._voices:
+            waveform, position = voice
+            chunk = waveform[position:position + frames]
+            output[:len(chunk)] += chunk
+            voice[1] = position + len(chunk)
+        self._voices = [voice for voice in self._voices if voice[1] < len(voice[0])]
+        np.clip(output, -1.0, 1.0, out=output)
+
+
+def make_sink(kind : str = "auto", sample_rate : int = SAMPLE_RATE):
+    """
+    Create an audio sink
+
+    :param kind: "auto" (sound device, null if none is available), "device", "null" or "file:<path.wav>"
+    :param sample_rate: Audio sampling rate
+    :return: Sink, not started
+    """
+    if kind == "null":
+        return NullSink()
+    if kind.startswith("file:"):
+        return FileSink(kind[len("file:"):], sample_rate)
+    if kind == "device":
+        return SoundDeviceSink(sample_rate)
+    if kind == "auto":
+        try:
+            import sounddevice
+            sounddevice.query_devices(kind="output")
+            return SoundDeviceSink(sample_rate)
+        except Exception as e:
+            # No PortAudio or no output device (headless machine)
+            logger.info(f"No audio output available, alerts are muted: {e}")
+            return NullSink()
+    raise ValueError(f"Unknown audio sink '{kind}'")
+
+
+class AudioEngine:
+    def __init__(self, sink : Optional[object] = None, sample_rate : int = SAMPLE_RATE, max_queue : int = 5):
+        """
+        Initialize AudioEngine: alerts are synthesized once and played by a worker thread through the sink
+
+        :param sink: NullSink, FileSink, SoundDeviceSink or any object with start(), play(waveform) and close() (default: make_sink("auto"))
+        :param sample_rate: Audio sampling rate
+        :param max_queue: Maximum number of alerts waiting for the worker, further alerts are dropped
+        """
+        self.sample_rate = sample_rate
+        self.sink = sink if sink is not None else make_sink("auto", sample_rate)
+        self.waveforms = synthesize_alerts(sample_rate)
+        self.queue = Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        try:
+            self.sink.start()
+        except Exception as e:
+            logger.error(f"Failed to open the audio output, alerts are muted: {e}")
+            self.sink = NullSink()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def play(self, sound_type : str) -> bool:
+        """
+        Queue an alert, never blocks
+
+        :param sound_type: "known" or "unknown"
+        :return: False if the alert was dropped because the queue is full
+        """
+        try:
+            self.queue.put_nowait((sound_type, time.perf_counter()))
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def clear(self) -> None:
+        """
+        Drop the alerts that were not played yet
+        """
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                return
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self.clear()
+            self.queue.put(None)
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self.sink.close()
+
+    def _worker(self) -> None:
+        """Worker thread: sleeps on the queue until an alert arrives"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            sound_type, queued_time = item
+            metrics.observe_stage("sound_queue_wait", time.perf_counter() - queued_time)
+
+            waveform = self.waveforms.get(sound_type)
+            if waveform is None:
+                logger.error(f"Unknown sound type '{sound_type}'")
+                continue
+            try:
+                with metrics.time_stage("sound_play"):
+                    self.sink.play(waveform)
+            except Exception as e:
+                logger.error(f"Error playing sound: {e}")
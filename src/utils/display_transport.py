@@ -0,0 +1,166 @@
+from typing import Any, Tuple
+import base64
+import threading
+import time
+import cv2
+from config import setup_logger
+from src.utils.latest_slot import LatestSlot
+from src.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class DisplayTransport:
+    def __init__(self, control : Any, width : int, height : int, target_fps : float = 25.0, target_kbps : float = 8000.0,
+                 quality : int = 75, min_quality : int = 35, max_quality : int = 90, min_scale : float = 0.5):
+        """
+        Initialize DisplayTransport: sends frames to one Flet image control.
+        Only that control is updated (no full page.update), from a sender thread so the render loop never
+        waits for the UI. A frame is encoded only when the previous one was delivered and the FPS budget allows it,
+        and the JPEG quality / resolution adapt so the frames fit the bandwidth budget.
+
+        :param control: Flet Image control (anything with src_base64 and update())
+        :param width: Display width of the control in pixels
+        :param height: Display height of the control in pixels
+        :param target_fps: Maximum frames per second sent to the control
+        :param target_kbps: Bandwidth budget of the control in kilobits per second
+        :param quality: Initial JPEG quality
+        :param min_quality: Lowest JPEG quality before the resolution is reduced
+        :param max_quality: Highest JPEG quality
+        :param min_scale: Lowest fraction of the display resolution that is sent
+        """
+        self.control = control
+        self.width = width
+        self.height = height
+        self.target_fps = target_fps
+        self.target_kbps = target_kbps
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.min_scale = min_scale
+        self.scale = 1.0
+
+        self.encoded_count = 0
+        self.skipped_count = 0
+        self.bytes_per_frame = 0.0
+        self.send_seconds = 0.0
+
+        self._resized = None  # Reused resize destination, reallocated only when the sent resolution changes
+        self._slot = LatestSlot("display")
+        self._in_flight = threading.Event()
+        self._next_due_time = 0.0
+        self._stop_flag = threading.Event()
+        self._thread = threading.Thread(target=self._sender, daemon=True)
+        self._thread.start()
+
+    def ready(self) -> bool:
+        """
+        :return: True if a new frame should be encoded: the previous one was delivered and the FPS budget allows it
+        """
+        if self._in_flight.is_set() or time.perf_counter() < self._next_due_time:
+            self.skipped_count += 1
+            return False
+        return True
+
+    def frame_size(self) -> Tuple[int, int]:
+        """
+        :return: (width, height) of the frames currently sent: the display size times the adaptive scale
+        """
+        return max(int(self.width * self.scale), 1), max(int(self.height * self.scale), 1)
+
+    def submit(self, frame : Any) -> bool:
+        """
+        Encode a BGR frame and hand it to the sender thread
+
+        :param frame: BGR frame, resized to frame_size() unless it already has that size
+        :return: True if the frame was encoded and queued for display, False on an encoding error
+        """
+        start = time.perf_counter()
+        width, height = self.frame_size()
+        if frame.shape[:2] != (height, width):
+            if self._resized is None or self._resized.shape[:2] != (height, width):
+                self._resized = None
+            frame = self._resized = cv2.resize(frame, (width, height), dst=self._resized)
+
+        # cv2.imencode has no output parameter, the JPEG buffer is the one allocation left per displayed frame
+        ret, buffer = cv2.imencode(".jpg", frame, (cv2.IMWRITE_JPEG_QUALITY, self.quality))
+        if not ret:
+            return False
+
+        # Frames are due every 1 / target_fps on average, a late frame does not allow a burst afterwards
+        interval = 1.0 / self.target_fps
+        self._next_due_time = max(self._next_due_time, start - interval) + interval
+        self._in_flight.set()
+        self._slot.put((base64.b64encode(buffer).decode("ascii"), len(buffer)))
+        self.encoded_count += 1
+        metrics.observe_stage("display_encode", time.perf_counter() - start)
+        return True
+
+    def clear(self) -> None:
+        """
+        Blank the control
+        """
+        self._slot.put(("", 0))
+
+    def close(self) -> None:
+        """
+        Stop the sender thread once the pending frame (or clear) was delivered
+        """
+        self._stop_flag.set()
+        self._thread.join(timeout=1.0)
+
+    def stats(self) -> dict:
+        return {
+            "encoded": self.encoded_count,
+            "skipped": self.skipped_count,
+            "quality": self.quality,
+            "scale": round(self.scale, 2),
+            "kb_per_frame": round(self.bytes_per_frame / 1000, 1),
+            "send_ms": round(1000 * self.send_seconds, 2)
+        }
+
+    def _sender(self) -> None:
+        """Sender thread: push the latest encoded frame to the control, then adapt the encoding"""
+        while True:
+            item = self._slot.get(timeout=0.1)
+            if item is None:
+                if self._stop_flag.is_set():
+                    break
+                continue
+            payload, frame_bytes = item
+
+            start = time.perf_counter()
+            try:
+                self.control.src_base64 = payload
+                self.control.update()
+            except Exception as e:
+                # The page may be closing, the next frame retries
+                logger.error(f"Display update failed: {e}")
+            finally:
+                duration = time.perf_counter() - start
+                self._in_flight.clear()
+
+            if frame_bytes:
+                metrics.observe_stage("ui_update", duration)
+                self._adapt(frame_bytes, duration)
+
+    def _adapt(self, frame_bytes : int, send_seconds : float) -> None:
+        """
+        Adapt quality first, then resolution, so a frame fits its share of the bandwidth and of the frame interval
+        """
+        self.bytes_per_frame = frame_bytes if not self.bytes_per_frame else 0.8 * self.bytes_per_frame + 0.2 * frame_bytes
+        self.send_seconds = send_seconds if not self.send_seconds else 0.8 * self.send_seconds + 0.2 * send_seconds
+
+        frame_budget = self.target_kbps * 125.0 / self.target_fps  # Bytes per frame
+        frame_interval = 1.0 / self.target_fps
+
+        if self.bytes_per_frame > frame_budget or self.send_seconds > frame_interval:
+            if self.quality > self.min_quality:
+                self.quality = max(self.quality - 5, self.min_quality)
+            else:
+                self.scale = max(self.scale * 0.9, self.min_scale)
+        elif self.bytes_per_frame < 0.6 * frame_budget and self.send_seconds < 0.5 * frame_interval:
+            if self.scale < 1.0:
+                self.scale = min(self.scale / 0.9, 1.0)
+            elif self.quality < self.max_quality:
+                self.quality = min(self.quality + 2, self.max_quality)
@@ -0,0 +1,53 @@
+from typing import Any, Optional, Tuple
+import cv2
+import numpy as np
+
+
+class FrameBuffers:
+    def __init__(self):
+        """
+        Reusable output buffers of the per-frame preprocessing of one video source.
+        OpenCV writes into them through dst=, they are only reallocated when the frame or output size changes.
+        Every call overwrites the result of the previous one, so one instance serves one consumer thread
+        that is done with a frame before it processes the next one.
+        """
+        self._small = None
+        self._small_rgb = None
+        self._display = None
+
+    def downscale(self, frame : np.ndarray, scale : float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Downscale a BGR frame for detection and convert it to RGB for face_recognition
+
+        :param frame: BGR frame as read from cv2.VideoCapture
+        :param scale: Downscale factor
+        :return: Tuple (small BGR frame, small RGB frame), both owned by this object
+        """
+        self._small = cv2.resize(frame, (0, 0), dst=_reusable(self._small, frame, scale), fx=scale, fy=scale)
+        self._small_rgb = cv2.cvtColor(self._small, cv2.COLOR_BGR2RGB, dst=self._small_rgb if _same_shape(self._small_rgb, self._small) else None)
+        return self._small, self._small_rgb
+
+    def display(self, frame : np.ndarray, size : Tuple[int, int]) -> np.ndarray:
+        """
+        Resize a frame to the display size
+
+        :param frame: BGR frame
+        :param size: (width, height) of the display frame
+        :return: Display frame owned by this object
+        """
+        width, height = size
+        buffer = self._display if self._display is not None and self._display.shape[:2] == (height, width) else None
+        self._display = cv2.resize(frame, (width, height), dst=buffer)
+        return self._display
+
+
+def _reusable(buffer : Optional[np.ndarray], frame : np.ndarray, scale : float) -> Optional[np.ndarray]:
+    # Same output size rule as cv2.resize with fx / fy
+    height, width = int(round(frame.shape[0] * scale)), int(round(frame.shape[1] * scale))
+    if buffer is not None and buffer.shape == (height, width) + frame.shape[2:]:
+        return buffer
+    return None
+
+
+def _same_shape(buffer : Optional[Any], reference : np.ndarray) -> bool:
+    return buffer is not None and buffer.shape == reference.shape
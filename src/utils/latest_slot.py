@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Any, Optional
+
+
+class LatestSlot:
+    def __init__(self, name : str, condition : Optional[threading.Condition] = None):
+        """
+        Bounded single-item buffer between two pipeline stages where the latest item wins:
+        putting a new item replaces the one that was not consumed yet (counted as a drop)
+        instead of queueing it, so the consumer always works on the freshest frame.
+
+        :param name: Name of the stage fed by this slot (for stats)
+        :param condition: Condition shared by several slots so one consumer can wait for any of them
+        """
+        self.name = name
+        self._condition = condition if condition is not None else threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._latest = None
+        self._item_time = 0.0
+        # time.time() the last taken item was put, the capture time of a frame slot
+        self.taken_time = 0.0
+
+        self.put_count = 0
+        self.taken_count = 0
+        self.dropped_count = 0
+
+    def put(self, item : Any) -> None:
+        """
+        Publish an item, replacing the pending one if the consumer did not take it yet
+
+        :param item: Item to publish
+        """
+        with self._condition:
+            if self._has_item:
+                self.dropped_count += 1
+            self._item = item
+            self._item_time = time.time()
+            self._latest = item
+            self._has_item = True
+            self.put_count += 1
+            self._condition.notify_all()
+
+    def get(self, timeout : Optional[float] = None) -> Optional[Any]:
+        """
+        Take the pending item, waiting for one if needed
+
+        :param timeout: Maximum time to wait in seconds (None = forever)
+        :return: The item, or None if no item was published before the timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._has_item, timeout):
+                return None
+            item = self._item
+            self.taken_time = self._item_time
+            self._item = None
+            self._has_item = False
+            self.taken_count += 1
+            return item
+
+    def peek(self) -> Optional[Any]:
+        """
+        :return: The latest published item without consuming it (None if nothing was published)
+        """
+        with self._condition:
+            return self._latest
+
+    def clear(self) -> None:
+        with self._condition:
+            self._item = None
+            self._has_item = False
+            self._latest = None
+
+    @property
+    def depth(self) -> int:
+        return 1 if self._has_item else 0
+
+    def stats(self) -> dict:
+        """
+        :return: Dict with the queue depth and the put / taken / dropped counters of the slot
+        """
+        with self._condition:
+            return {
+                "depth": self.depth,
+                "put": self.put_count,
+                "taken": self.taken_count,
+                "dropped": self.dropped_count
+            }
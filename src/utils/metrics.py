@@ -0,0 +1,252 @@
+from typing import Dict, Iterable, Tuple
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+import numpy as np
+from config import setup_logger
+
+logger = setup_logger(__name__)
+
+# Latency buckets in seconds, from 0.5 ms to 5 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, buckets : Iterable[float] = LATENCY_BUCKETS, window : int = 1024):
+        """
+        Initialize Histogram: cumulative buckets since start (for Prometheus) and a ring buffer of the
+        last window samples (for rolling percentiles). Recording a sample is O(log buckets) under an uncontended lock.
+
+        :param buckets: Upper bounds of the buckets
+        :param window: Number of recent samples the percentiles are computed on
+        """
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+        self._window = [0.0] * window
+        self._lock = threading.Lock()
+
+    def observe(self, value : float) -> None:
+        with self._lock:
+            self._window[self.count % len(self._window)] = value
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentiles(self, quantiles : Iterable[float] = QUANTILES) -> Dict[float, float]:
+        """
+        :return: Dict {quantile: value} over the last window samples, empty if there is no sample
+        """
+        with self._lock:
+            recent = self._window[:min(self.count, len(self._window))]
+        if not recent:
+            return {}
+        values = np.percentile(np.array(recent), [100 * q for q in quantiles])
+        return dict(zip(quantiles, values.tolist()))
+
+
+class MetricsRegistry:
+    def __init__(self, prefix : str = "face_app", enabled : bool = True):
+        """
+        Initialize MetricsRegistry: per-stage latency histograms, value histograms and labelled gauges
+
+        :param prefix: Prefix of the exported metric names
+        :param enabled: When False, recording is a no-op
+        """
+        self.prefix = prefix
+        self.enabled = enabled
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}      # (name, labels) -> value
+        self._stages = {}     # stage -> Histogram, shortcut of the hot path
+        self._lock = threading.Lock()
+        self._server = None
+
+    def histogram(self, name : str, buckets : Iterable[float] = LATENCY_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe_stage(self, stage : str, seconds : float) -> None:
+        """
+        Record the latency of a pipeline stage
+
+        :param stage: Stage name (e.g. "detect", "encode", "display_encode")
+        :param seconds: Duration of the stage
+        """
+        if self.enabled:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = self.histogram("stage_seconds", stage=stage)
+            histogram.observe(seconds)
+
+    def observe_value(self, name : str, value : float, buckets : Iterable[float] = COUNT_BUCKETS) -> None:
+        """
+        Record a non-latency distribution (e.g. faces per frame)
+        """
+        if self.enabled:
+            self.histogram(name, buckets).observe(value)
+
+    def time_stage(self, stage : str) -> "_StageTimer":
+        """
+        Context manager recording the duration of its block as a stage latency
+        """
+        return _StageTimer(self, stage)
+
+    def set_gauge(self, name : str, value : float, **labels) -> None:
+        if self.enabled:
+            self.gauges[(name, tuple(sorted(labels.items())))] = float(value)
+
+    def reset(self) -> None:
+        """
+        Forget every recorded sample and gauge (e.g. between two runs of a benchmark)
+        """
+        with self._lock:
+            self.histograms = {}
+            self.gauges = {}
+            self._stages = {}
+
+    def stage_percentiles(self) -> Dict[str, Dict[float, float]]:
+        """
+        :return: Dict {stage: {quantile: seconds}} of the rolling window of every stage
+        """
+        return {
+            dict(labels)["stage"]: histogram.percentiles()
+            for (name, labels), histogram in list(self.histograms.items()) if name == "stage_seconds"
+        }
+
+    def summary_text(self) -> str:
+        """
+        Human readable table of the stage latencies and gauges, used by the live overlay
+
+        :return: One line per stage (p50 / p95 / p99 in ms) followed by the gauges
+        """
+        lines = []
+        for stage, percentiles in sorted(self.stage_percentiles().items()):
+            if percentiles:
+                lines.append(f"{stage:<18} p50 {1000 * percentiles[0.5]:7.1f}  p95 {1000 * percentiles[0.95]:7.1f}  p99 {1000 * percentiles[0.99]:7.1f} ms")
+        for (name, labels), value in sorted(list(self.gauges.items())):
+            label_text = ",".join(str(v) for _, v in labels)
+            lines.append(f"{name}{'[' + label_text + ']' if label_text else ''}: {value:g}")
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(list(self.histograms.items())):
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(list(histogram.buckets) + ["+Inf"], histogram.bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum:.9g}")
+            lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+
+        # Rolling percentiles as gauges, a Prometheus histogram only has cumulative buckets
+        for (name, labels), histogram in sorted(list(self.histograms.items())):
+            for quantile, value in histogram.percentiles().items():
+                metric = f"{self.prefix}_{name}_recent"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} gauge")
+                    typed.add(metric)
+                lines.append(f"{metric}{_labels(labels, quantile=quantile)} {value:.9g}")
+
+        for (name, labels), value in sorted(list(self.gauges.items())):
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} gauge")
+                typed.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path : str) -> None:
+        """
+        Write the metrics to a text file for the node_exporter textfile collector (atomic replace)
+
+        :param path: Destination file path
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def serve(self, port : int, host : str = "127.0.0.1") -> None:
+        """
+        Serve the metrics on http://host:port/metrics from a daemon thread
+
+        :param port: TCP port
+        :param host: Interface to bind, local only by default
+        """
+        if self._server is not None:
+            return
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def stop_serving(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _StageTimer:
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry : MetricsRegistry, stage : str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.registry.observe_stage(self.stage, time.perf_counter() - self.start)
+
+
+def _labels(labels : Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = list(labels) + [(key, value) for key, value in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_format_label(value)}"' for key, value in pairs) + "}"
+
+
+def _format_label(value) -> str:
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide registry shared by the camera pipeline, the gallery and the sound worker
+metrics = MetricsRegistry()
@@ -0,0 +1,32 @@
+from typing import List, Any
+import cv2
+
+
+def draw_recognitions(frame : Any, recognitions : List[Any], scale_x : float = 1.0, scale_y : float = 1.0) -> None:
+    """
+    Draw rectangles and labels of the recognized faces on the frame (in place)
+
+    :param frame: BGR frame
+    :param recognitions: Objects with a (top, right, bottom, left) location and a name, in full frame coordinates
+    :param scale_x: Width of the drawn frame divided by the width of the full frame (when drawing on a display-size frame)
+    :param scale_y: Height of the drawn frame divided by the height of the full frame
+    """
+    # The label keeps the look it had on a full frame shown downscaled, with a readable minimum
+    label_height = max(int(round(35 * scale_y)), 16)
+    font_scale = max(0.8 * scale_y, 0.4)
+
+    for recognition in recognitions:
+        top, right, bottom, left = recognition.location
+        top, bottom = int(round(top * scale_y)), int(round(bottom * scale_y))
+        left, right = int(round(left * scale_x)), int(round(right * scale_x))
+        name = recognition.name
+
+        # Choose color based on recognition
+        color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)  # Green for known, Red for unknown
+
+        cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+
+        # Draw label
+        cv2.rectangle(frame, (left, bottom - label_height), (right, bottom), color, cv2.FILLED)
+        font = cv2.FONT_HERSHEY_DUPLEX
+        cv2.putText(frame, name, (left + 6, bottom - max(int(round(6 * scale_y)), 3)), font, font_scale, (255, 255, 255), 1)
@@ -0,0 +1,168 @@
+from typing import Any, NamedTuple, Optional, Tuple
+from multiprocessing import shared_memory
+import multiprocessing
+import numpy as np
+
+# Slot states: the sequence number of the content, or one of these
+EMPTY = -1
+WRITING = -2
+
+
+class RingSpec(NamedTuple):
+    """
+    Everything a process needs to attach a SharedRing (passed to the process at spawn, the lock cannot be pickled later)
+
+    :param name: Name of the shared memory block
+    :param slot_bytes: Size of one slot
+    :param slots: Number of slots
+    :param lock: Lock of the slot states, shared by all the processes of the ring
+    """
+    name: str
+    slot_bytes: int
+    slots: int
+    lock: Any
+
+
+class FrameDescriptor(NamedTuple):
+    """
+    What travels over the pipe for one item of a ring, the item itself stays in shared memory
+
+    :param sequence: Item number, increasing, tells a reused slot from the item it held
+    :param slot: Ring slot holding the item
+    :param shape: Shape of the item array
+    :param timestamp: time.time() of the capture of the frame the item belongs to
+    :param count: Number of rows actually used (results), 0 for frames
+    """
+    sequence: int
+    slot: int
+    shape: Tuple[int, ...]
+    timestamp: float
+    count: int = 0
+
+
+def _attach(name : str) -> shared_memory.SharedMemory:
+    try:
+        # Python >= 3.13: the creating process owns the block, the attaching process must not unlink it on exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedRing:
+    def __init__(self, spec : RingSpec, block : shared_memory.SharedMemory, owner : bool):
+        """
+        Ring of fixed-size shared memory slots between one producer process and any number of consumer processes.
+        The producer writes an item in place into a free slot and sends a FrameDescriptor over a pipe, a consumer
+        leases the slot, reads the item in place and releases it. A leased slot is never overwritten, a slot that
+        nobody leased is reused by the producer (latest item wins: a consumer lagging behind finds its descriptor
+        stale and skips it). Use SharedRing.create in the owning process and SharedRing.attach in the others.
+
+        Header: one int64 state (sequence of the content, EMPTY or WRITING) and one int64 lease count per slot,
+        changed under the lock of the spec. The slots follow, 64-byte aligned.
+        """
+        self.spec = spec
+        self._block = block
+        self._owner = owner
+        self._header_bytes = (2 * spec.slots * 8 + 63) // 64 * 64
+        self._states = np.ndarray((spec.slots,), dtype=np.int64, buffer=block.buf)
+        self._leases = np.ndarray((spec.slots,), dtype=np.int64, buffer=block.buf, offset=spec.slots * 8)
+        self._next_slot = 0
+
+        self.written_count = 0
+        self.full_count = 0  # Items dropped by the producer because every slot was leased
+
+    @classmethod
+    def create(cls, slot_bytes : int, slots : int = 4, context : Optional[Any] = None) -> "SharedRing":
+        """
+        :param slot_bytes: Size of one slot, the largest item the ring holds
+        :param slots: Number of slots, at least one per consumer plus two so the producer always finds a free one
+        :param context: multiprocessing context the lock is created with (default: spawn)
+        :return: SharedRing owning the shared memory block, unlinked by close()
+        """
+        context = context if context is not None else multiprocessing.get_context("spawn")
+        header_bytes = (2 * slots * 8 + 63) // 64 * 64
+        block = shared_memory.SharedMemory(create=True, size=header_bytes + slots * slot_bytes)
+        ring = cls(RingSpec(block.name, slot_bytes, slots, context.Lock()), block, owner=True)
+        ring._states[:] = EMPTY
+        ring._leases[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, spec : RingSpec) -> "SharedRing":
+        """
+        :param spec: Spec of a ring created by another process
+        :return: SharedRing attached to the same memory
+        """
+        return cls(spec, _attach(spec.name), owner=False)
+
+    def array(self, slot : int, shape : Tuple[int, ...], dtype : Any = np.uint8) -> np.ndarray:
+        """
+        View of a slot as an array, in place (no copy)
+
+        :param slot: Slot index
+        :param shape: Shape of the item
+        :param dtype: Dtype of the item
+        :return: Array whose memory is the slot
+        """
+        return np.ndarray(shape, dtype=dtype, buffer=self._block.buf, offset=self._header_bytes + slot * self.spec.slot_bytes)
+
+    def reserve(self) -> Optional[int]:
+        """
+        Producer: take the oldest slot nobody leased for the next item
+
+        :return: Slot index, None if every slot is leased (the item is dropped)
+        """
+        with self.spec.lock:
+            for offset in range(self.spec.slots):
+                slot = (self._next_slot + offset) % self.spec.slots
+                if self._leases[slot] == 0:
+                    self._states[slot] = WRITING
+                    self._next_slot = slot + 1
+                    return slot
+        self.full_count += 1
+        return None
+
+    def publish(self, slot : int, sequence : int) -> None:
+        """
+        Producer: the item of a reserved slot is complete, consumers may lease it
+
+        :param slot: Slot returned by reserve
+        :param sequence: Sequence number sent in the descriptor of the item
+        """
+        with self.spec.lock:
+            self._states[slot] = sequence
+        self.written_count += 1
+
+    def lease(self, descriptor : FrameDescriptor) -> bool:
+        """
+        Consumer: pin the slot of a descriptor so the producer does not overwrite it
+
+        :param descriptor: Descriptor received from the producer
+        :return: True if the slot still holds the item, False if it was already reused (stale descriptor)
+        """
+        with self.spec.lock:
+            if self._states[descriptor.slot] != descriptor.sequence:
+                return False
+            self._leases[descriptor.slot] += 1
+            return True
+
+    def release(self, slot : int) -> None:
+        """
+        Consumer: done with a leased slot
+
+        :param slot: Slot of a successful lease
+        """
+        with self.spec.lock:
+            self._leases[slot] -= 1
+
+    def close(self) -> None:
+        """Detach from the ring, the owner also frees the shared memory"""
+        # The header views must go before the memory map can be closed
+        self._states = self._leases = None
+        try:
+            self._block.close()
+        except BufferError:
+            # An array of a slot is still referenced, the mapping goes away with the process
+            pass
+        if self._owner:
+            self._block.unlink()
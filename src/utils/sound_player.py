@@ -1,22 +1,17 @@
-from random import sample
-import wave
 import numpy as np
-import sounddevice as sd
-import winsound
-import chime
-import time
 # import pygame
 from typing import List
 
-def play_siren_sound(duration : int = 0.2, low_freq : int = 600, high_freq : int = 1200, rate : int = 0.25, sample_rate : int = 44100):
+def siren_waveform(duration : int = 0.2, low_freq : int = 600, high_freq : int = 1200, rate : int = 0.25, sample_rate : int = 44100) -> np.ndarray:
     """
-    Play a siren-like sound.
+    Synthesize a siren-like sound.
 
     :param duration: Total duration in seconds
     :param low_freq: Lowest frequency (Hz)
     :param high_freq: Highest frequency (Hz)
     :param rate: Number of up-down cycles per second
     :param samplerate: Audio sampling rate
+    :return: Mono float waveform in [-1, 1]
     """
     # Create a linear time array from 0 to duration with samples based on the sampling rate
     time_linspace = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
@@ -35,25 +30,39 @@ def play_siren_sound(duration : int = 0.2, low_freq : int = 600, high_freq : int
 
     # Normalize volume to 50% of the original amplitude to avoid loudness
     waveform *= 0.5
+    return waveform
+
+def wonderful_waveform(duration=0.2, f0=200, sample_rate=44100) -> np.ndarray:
+    """
+    Synthesize a chord of a fundamental and its first two harmonics.
+
+    :return: Mono float waveform in [-1, 1]
+    """
+    t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
+    waveform = (
+        1.0 * np.sin(2 * np.pi * f0 * t) +
+        0.5 * np.sin(2 * np.pi * 2 * f0 * t) +
+        0.3 * np.sin(2 * np.pi * 3 * f0 * t)
+    )
+    waveform /= np.max(np.abs(waveform))
+    return waveform
+
+def play_siren_sound(duration : int = 0.2, low_freq : int = 600, high_freq : int = 1200, rate : int = 0.25, sample_rate : int = 44100):
+    """
+    Play a siren-like sound and wait for its end (see AudioEngine for non-blocking alerts)
+    """
+    import sounddevice as sd
 
     # Play the generated waveform using sounddevice with the given sampling rate
-    sd.play(waveform, samplerate=sample_rate)
+    sd.play(siren_waveform(duration, low_freq, high_freq, rate, sample_rate), samplerate=sample_rate)
 
     # Wait until the sound playback is finished before returning
     sd.wait()
 
 def play_wonderful_sound(duration=0.2, f0=200, sample_rate=44100):
-        # if self.current_play_obj and self.current_play_obj.is_playing():
-        #     return
-        t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
-        waveform = (
-            1.0 * np.sin(2 * np.pi * f0 * t) +
-            0.5 * np.sin(2 * np.pi * 2 * f0 * t) +
-            0.3 * np.sin(2 * np.pi * 3 * f0 * t)
-        )
-        waveform /= np.max(np.abs(waveform))
-
-        sd.play(waveform, samplerate=sample_rate)
+        import sounddevice as sd
+
+        sd.play(wonderful_waveform(duration, f0, sample_rate), samplerate=sample_rate)
 
         sd.wait()
 